@@ -153,15 +153,19 @@ class CANBadger(Interface):
         if extended_id:
             arb_id = arb_id | 0x80000000
         replay_payload = struct.pack('B', interface) + struct.pack('I', arb_id) + payload
+        # wait_for_ack returns True on ACK, False on NACK and None if the ACK didn't arrive in time
         return self.send(EthernetMessage(EthernetMessageType.ACTION, ActionType.START_REPLAY,
-                                         len(replay_payload), replay_payload), wait_for_ack=True) == 0
+                                         len(replay_payload), replay_payload), wait_for_ack=True) is True
 
     # call receive_canframe when the CANBadger is logging to receive the next logged payload
     def receive_canframe(self, can_ids=None, timeout=1):
+        # the timeout covers the whole call, filtered frames don't restart it
+        deadline = time.monotonic() + timeout if timeout is not None else None
         while True:
             # receive a logged canframe, if ids is set, retry until a valid one is found
             can_id = 0x0
-            logging_response = self.receive(timeout=timeout)
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            logging_response = self.receive(timeout=remaining)
             if logging_response == -1:
                 return None, None
             if logging_response.msg_type != EthernetMessageType.DATA:
@@ -0,0 +1,112 @@
+from queue import Queue, Empty
+
+from libcanbadger.ethernet_message import EthernetMessage, EthernetMessageType, ActionType
+from libcanbadger.interface import Interface, InterfaceConnectionStatus
+from libcanbadger.uds.offload_session import start_uds_struct, uds_request_header, EXTENDED_ID_FLAG
+
+
+class CANBadgerEmulator(Interface):
+    """
+    emulates the ethernet side of a CANBadger, running device-side UDS sessions against EcuEmulators
+
+    it provides the same send/receive/wait_for_ack methods as the CANBadger class, so it can be used in place of a
+    real device wherever whole EthernetMessages are exchanged, e.g. with an OffloadSession
+    """
+    def __init__(self, ecus: list = None):
+        """
+        :param ecus: the EcuEmulators reachable on the emulated bus
+        """
+        super(CANBadgerEmulator, self).__init__()
+        self.ecus = list(ecus) if ecus else []
+        self.data_queue = Queue()
+        self.ack_queue = Queue()
+        # all messages we received from the host, in order
+        self.received_messages = []
+        # the ECU of the active device-side UDS session
+        self.uds_ecu = None
+        self.tester_present_active = False
+
+    def connect(self, timeout: float = 10) -> bool:
+        self.connection_status = InterfaceConnectionStatus.Connected
+        return True
+
+    def get_connection_status(self):
+        return self.connection_status
+
+    def find_ecu(self, tester_id: int, ecu_id: int):
+        for ecu in self.ecus:
+            if ecu.tester_id == tester_id and ecu.ecu_id == ecu_id:
+                return ecu
+        return None
+
+    def send(self, eth_msg, wait_for_ack=False):
+        self.received_messages.append(eth_msg)
+        if eth_msg.msg_type == EthernetMessageType.ACTION:
+            if eth_msg.action_type == ActionType.START_UDS:
+                self.start_uds(eth_msg.data)
+            elif eth_msg.action_type == ActionType.UDS:
+                self.uds(eth_msg.data)
+            elif eth_msg.action_type in (ActionType.STOP_CURRENT_ACTION, ActionType.RESET):
+                self.uds_ecu = None
+                self.tester_present_active = False
+                self.ack()
+            else:
+                self.nack()
+        if wait_for_ack:
+            return self.wait_for_ack(1)
+        return True
+
+    def receive(self, timeout: float = None):
+        try:
+            if timeout is None:
+                return self.data_queue.get_nowait()
+            return self.data_queue.get(timeout=timeout)
+        except Empty:
+            return -1
+
+    def wait_for_ack(self, timeout=None):
+        try:
+            ack = self.ack_queue.get(timeout=timeout)
+        except Empty:
+            return None
+        return ack.msg_type == EthernetMessageType.ACK
+
+    def send_stop(self):
+        self.send(EthernetMessage(EthernetMessageType.ACTION, ActionType.STOP_CURRENT_ACTION, 0, b''))
+
+    def ack(self):
+        self.ack_queue.put(EthernetMessage(EthernetMessageType.ACK, ActionType.NO_TYPE, 0, b''))
+
+    def nack(self):
+        self.ack_queue.put(EthernetMessage(EthernetMessageType.NACK, ActionType.NO_TYPE, 0, b''))
+
+    def respond(self, action_type: ActionType, data: bytes):
+        self.data_queue.put(EthernetMessage(EthernetMessageType.DATA, action_type, len(data), data))
+
+    def start_uds(self, payload: bytes):
+        if len(payload) != start_uds_struct.size:
+            self.nack()
+            return
+        _, tester_id, ecu_id, _, _, level = start_uds_struct.unpack(payload)
+        ecu = self.find_ecu(tester_id & ~EXTENDED_ID_FLAG, ecu_id & ~EXTENDED_ID_FLAG)
+        if ecu is None:
+            self.nack()
+            return
+        self.ack()
+        responses = ecu.handle(bytes([0x10, level]))
+        final = responses[-1] if responses else b''
+        if final[:1] == b'\x50':
+            self.uds_ecu = ecu
+            self.tester_present_active = True
+        self.respond(ActionType.START_UDS, final)
+
+    def uds(self, payload: bytes):
+        if self.uds_ecu is None or len(payload) <= uds_request_header.size:
+            # no active session
+            self.respond(ActionType.UDS, b'')
+            return
+        responses = self.uds_ecu.handle(payload[uds_request_header.size:])
+        if not responses:
+            self.respond(ActionType.UDS, b'')
+        for response in responses:
+            self.respond(ActionType.UDS, response)
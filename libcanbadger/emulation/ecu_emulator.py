@@ -0,0 +1,279 @@
+import random
+import time
+
+from libcanbadger.uds.uds_constants import ResponseCodes, AdditionalResponseCodes, Masks
+
+
+def negative_response(sid: int, response_code: int) -> bytes:
+    """
+    :return: a formatted negative response (7F SID NRC)
+    """
+    return bytes([ResponseCodes.NEGATIVE_RESPONSE, sid, response_code])
+
+
+class EcuEmulator(object):
+    """
+    a minimal UDS server, standing in for a real ECU in tests and offline experiments
+
+    it works on whole UDS payloads. use it behind one of the emulated interfaces to talk to it like to a real ECU.
+    services are plain callables, mapped by their SID. every handler receives the full request and returns a list of
+    responses, so that e.g. response pending replies can be emulated. an empty list means no response at all.
+    """
+    def __init__(self, tester_id: int = 0x710, ecu_id: int = 0x77a, dids: dict = None, memory: bytes = None,
+                 memory_address: int = 0, max_read_size: int = 0xFFE):
+        """
+        :param tester_id: arbitration id the ECU receives requests on
+        :param ecu_id: arbitration id the ECU responds with
+        :param dids: dict mapping data identifiers to their content (bytes)
+        :param memory: content of the ECU's readable memory
+        :param memory_address: address of the first byte of memory
+        :param max_read_size: largest block ReadMemoryByAddress accepts
+        """
+        self.tester_id = tester_id
+        self.ecu_id = ecu_id
+        self.dids = dict(dids) if dids else {}
+        self.memory = bytearray(memory) if memory else bytearray()
+        self.memory_address = memory_address
+        self.max_read_size = max_read_size
+        # max number of DIDs in a single ReadDataByIdentifier request, None for no limit
+        self.max_dids_per_request = None
+        # block size and raw STmin byte of the flow control the ECU sends for multi-frame requests
+        self.fc_block_size = 0
+        self.fc_st_min = 0
+        # maxNumberOfBlockLength reported for uploads and downloads, including SID and counter
+        self.max_block_length = 0x402
+        # state of the active upload or download:
+        # direction (0x34 or 0x35), current offset, end offset, last counter, length of the last block
+        self.transfer = None
+        self.diagnostic_session = 0x01
+
+        # SecurityAccess: the key for a seed, invalid keys accepted before a lockout and the lockout's duration in s
+        self.security_key = lambda seed: bytes(b ^ 0x5A for b in seed)
+        self.seed_length = 4
+        self.max_key_attempts = 3
+        self.security_delay = 10.0
+        # some ECUs keep their lockout timer (and failed attempts) across resets
+        self.lockout_survives_reset = False
+        # if False, the seed only changes after a key attempt or a reset
+        self.new_seed_per_request = False
+        self.random = random.Random(0)
+        self.security_level = 0
+        self.seed = None
+        self.failed_key_attempts = 0
+        self.locked_until = 0.0
+        self.reset_count = 0
+        # maps SIDs to the number of response pending replies sent before the final response
+        self.pending_responses = {}
+        # every request the ECU received, in order
+        self.requests = []
+        self.services = {
+            0x10: self.diagnostic_session_control,
+            0x11: self.ecu_reset,
+            0x22: self.read_data_by_identifier,
+            0x23: self.read_memory_by_address,
+            0x34: self.request_download,
+            0x35: self.request_upload,
+            0x27: self.security_access,
+            0x36: self.transfer_data,
+            0x37: self.request_transfer_exit,
+            0x3E: self.tester_present,
+        }
+
+    def register_service(self, sid: int, handler: callable) -> None:
+        """
+        add or replace the handler for a service
+        :param sid: the service identifier
+        :param handler: callable accepting the request (bytes) and returning a list of responses
+        """
+        self.services[sid] = handler
+
+    def handle(self, request: bytes) -> list:
+        """
+        process a single UDS request
+        :param request: the raw request, starting with the SID
+        :return: a list of responses (bytes)
+        """
+        self.requests.append(bytes(request))
+        if len(request) < 1:
+            return []
+        sid = request[0]
+        handler = self.services.get(sid)
+        if handler is None:
+            return [negative_response(sid, ResponseCodes.SERVICE_NOT_SUPPORTED)]
+        responses = handler(request)
+        pending = self.pending_responses.get(sid, 0)
+        if pending and responses:
+            responses = [negative_response(sid, AdditionalResponseCodes.RESPONSE_PENDING)] * pending + responses
+        return responses
+
+    @staticmethod
+    def positive_response(request: bytes, data: bytes = b'') -> list:
+        return [bytes([request[0] | Masks.REPLY_MASK]) + data]
+
+    def diagnostic_session_control(self, request: bytes) -> list:
+        if len(request) != 2:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        level = request[1] & 0x7F
+        if level not in (0x01, 0x02, 0x03, 0x04):
+            return [negative_response(request[0], ResponseCodes.SUBFUNCTION_NOT_SUPPORTED)]
+        self.diagnostic_session = level
+        # P2 = 50ms and P2* = 5000ms (in 10ms steps), as recommended by ISO 14229
+        return self.positive_response(request, bytes([level, 0x00, 0x32, 0x01, 0xF4]))
+
+    def ecu_reset(self, request: bytes) -> list:
+        if len(request) != 2:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        if request[1] & 0x7F not in (0x01, 0x02, 0x03):
+            return [negative_response(request[0], ResponseCodes.SUBFUNCTION_NOT_SUPPORTED)]
+        self.reset_count += 1
+        self.diagnostic_session = 0x01
+        self.transfer = None
+        self.security_level = 0
+        self.seed = None
+        if not self.lockout_survives_reset:
+            self.failed_key_attempts = 0
+            self.locked_until = 0.0
+        if request[1] & 0x80:
+            return []
+        return self.positive_response(request, bytes([request[1]]))
+
+    def security_access(self, request: bytes) -> list:
+        if len(request) < 2:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        if self.diagnostic_session == 0x01:
+            return [negative_response(request[0], AdditionalResponseCodes.SERVICE_NOT_SUPPORTED_IN_ACTIVE_SESSION)]
+        level = request[1]
+        if level % 2 == 1:
+            # requestSeed
+            if len(request) != 2:
+                return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+            if time.monotonic() < self.locked_until:
+                return [negative_response(request[0], ResponseCodes.REQUIRED_TIME_DELAY_NOT_EXPIRED)]
+            if self.security_level == level:
+                # already unlocked
+                return self.positive_response(request, bytes([level]) + bytes(self.seed_length))
+            if self.seed is None or self.new_seed_per_request or self.seed[0] != level:
+                self.seed = (level, bytes(self.random.getrandbits(8) for _ in range(self.seed_length)))
+            return self.positive_response(request, bytes([level]) + self.seed[1])
+
+        # sendKey
+        if self.seed is None or self.seed[0] != level - 1:
+            return [negative_response(request[0], ResponseCodes.REQUEST_SEQUENCE_ERROR)]
+        seed = self.seed[1]
+        self.seed = None
+        if request[2:] == self.security_key(seed):
+            self.security_level = level - 1
+            self.failed_key_attempts = 0
+            return self.positive_response(request, bytes([level]))
+        self.failed_key_attempts += 1
+        if self.failed_key_attempts >= self.max_key_attempts:
+            self.failed_key_attempts = 0
+            self.locked_until = time.monotonic() + self.security_delay
+            return [negative_response(request[0], ResponseCodes.EXCEEDED_NUMBER_OF_ATTEMPTS)]
+        return [negative_response(request[0], ResponseCodes.INVALID_KEY)]
+
+    def tester_present(self, request: bytes) -> list:
+        if len(request) != 2:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        if request[1] & 0x80:
+            # suppressPosRspMsgIndicationBit
+            return []
+        return self.positive_response(request, bytes([request[1]]))
+
+    def read_data_by_identifier(self, request: bytes) -> list:
+        if len(request) < 3 or len(request) % 2 != 1:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        if self.max_dids_per_request is not None and len(request) // 2 > self.max_dids_per_request:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        data = b''
+        for i in range(1, len(request), 2):
+            did = int.from_bytes(request[i:i + 2], byteorder='big')
+            if did in self.dids:
+                data += request[i:i + 2] + self.dids[did]
+        if not data:
+            return [negative_response(request[0], ResponseCodes.REQUEST_OUT_OF_RANGE)]
+        if len(data) + 1 > 4095:
+            return [negative_response(request[0], ResponseCodes.RESPONSE_TOO_LONG)]
+        return self.positive_response(request, data)
+
+    @staticmethod
+    def parse_address_and_size(request: bytes, offset: int) -> tuple:
+        """
+        parse addressAndLengthFormatIdentifier, memoryAddress and memorySize starting at request[offset]
+        :return: a tuple (address, size, end offset) or None if the request is malformed
+        """
+        if len(request) <= offset:
+            return None
+        size_len = request[offset] >> 4
+        address_len = request[offset] & 0x0F
+        end = offset + 1 + address_len + size_len
+        if size_len == 0 or address_len == 0 or len(request) < end:
+            return None
+        address = int.from_bytes(request[offset + 1:offset + 1 + address_len], byteorder='big')
+        size = int.from_bytes(request[offset + 1 + address_len:end], byteorder='big')
+        return address, size, end
+
+    def read_memory_by_address(self, request: bytes) -> list:
+        parsed = self.parse_address_and_size(request, 1)
+        if parsed is None or parsed[2] != len(request):
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        address, size, _ = parsed
+        offset = address - self.memory_address
+        if size == 0 or size > self.max_read_size or offset < 0 or offset + size > len(self.memory):
+            return [negative_response(request[0], ResponseCodes.REQUEST_OUT_OF_RANGE)]
+        return self.positive_response(request, bytes(self.memory[offset:offset + size]))
+
+    def request_transfer(self, request: bytes) -> list:
+        parsed = self.parse_address_and_size(request, 2)
+        if parsed is None or parsed[2] != len(request):
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        if self.transfer is not None:
+            return [negative_response(request[0], ResponseCodes.CONDITIONS_NOT_CORRECT)]
+        address, size, _ = parsed
+        offset = address - self.memory_address
+        if offset < 0 or (request[0] == 0x35 and offset + size > len(self.memory)):
+            return [negative_response(request[0], ResponseCodes.REQUEST_OUT_OF_RANGE)]
+        if request[0] == 0x34 and offset + size > len(self.memory):
+            self.memory.extend(bytes(offset + size - len(self.memory)))
+        self.transfer = [request[0], offset, offset + size, 0, 0]
+        return self.positive_response(request, b'\x20' + self.max_block_length.to_bytes(2, byteorder='big'))
+
+    def request_download(self, request: bytes) -> list:
+        return self.request_transfer(request)
+
+    def request_upload(self, request: bytes) -> list:
+        return self.request_transfer(request)
+
+    def transfer_data(self, request: bytes) -> list:
+        if self.transfer is None:
+            return [negative_response(request[0], ResponseCodes.REQUEST_SEQUENCE_ERROR)]
+        if len(request) < 2:
+            return [negative_response(request[0], ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT)]
+        direction, offset, end, last_counter, last_length = self.transfer
+        counter = request[1]
+        data_length = self.max_block_length - 2
+        if counter == last_counter and last_counter != 0:
+            # a repeated block: the data was already transferred, go back one block
+            offset -= last_length
+        elif counter != (last_counter + 1) & 0xFF:
+            return [negative_response(request[0], AdditionalResponseCodes.WRONG_BLOCK_SEQUENCE_COUNTER)]
+
+        if direction == 0x34:
+            data = request[2:]
+            if len(data) > data_length or offset + len(data) > end:
+                return [negative_response(request[0], ResponseCodes.REQUEST_OUT_OF_RANGE)]
+            self.memory[offset:offset + len(data)] = data
+            self.transfer = [direction, offset + len(data), end, counter, len(data)]
+            return self.positive_response(request, bytes([counter]))
+        else:
+            if len(request) != 2 or offset >= end:
+                return [negative_response(request[0], ResponseCodes.REQUEST_OUT_OF_RANGE)]
+            data = bytes(self.memory[offset:min(offset + data_length, end)])
+            self.transfer = [direction, offset + len(data), end, counter, len(data)]
+            return self.positive_response(request, bytes([counter]) + data)
+
+    def request_transfer_exit(self, request: bytes) -> list:
+        if self.transfer is None or self.transfer[1] != self.transfer[2]:
+            return [negative_response(request[0], ResponseCodes.REQUEST_SEQUENCE_ERROR)]
+        self.transfer = None
+        return self.positive_response(request)
@@ -4,13 +4,15 @@ class Frame(object):
     """
     A can(-fd) frame
     """
-    def __init__(self, arb_id=None, payload=None):
+    def __init__(self, arb_id=None, payload=None, timestamp=None):
         self.arb_id = arb_id
         if self.arb_id is not None:
             self.is_extended_id = self.arb_id > 0x7ff
         else:
             self.is_extended_id = False
         self.payload = payload
+        # optional reception time in seconds, as provided by the source of the frame
+        self.timestamp = timestamp
 
     def payload_length(self):
         return len(self.payload)
@@ -1,6 +1,6 @@
 from enum import Enum
 from libcanbadger.frame import Frame
-from libcanbadger.log import Log, FrameEvent, LogEventType
+from libcanbadger.log import Log, FrameEvent, LogEventType, StreamingLogWriter
 
 
 # keeps track of the connection state
@@ -75,8 +75,24 @@ class LoggedInterface(Interface):
         self.log_to_status_map[l] = True
         return l
 
+    def start_stream_log(self, name, filename: str, **kwargs) -> StreamingLogWriter:
+        """
+        start a new log that is written to disk as it goes, and immediately start logging
+        :param name: the name for this log
+        :param filename: the file to write to, see StreamingLogWriter for the other arguments
+        :return: the new StreamingLogWriter
+        """
+        l = StreamingLogWriter(filename, name=name, **kwargs)
+        self.add_log(l)
+        return l
+
     def add_log(self, log: Log) -> None:
+        """
+        start logging to an existing log, a Log or anything else with a log(event) method such as a
+        StreamingLogWriter
+        """
         self.logs.append(log)
+        self.log_to_status_map[log] = True
 
     def enable_log(self, log: Log) -> None:
         self.log_to_status_map[log] = True
@@ -89,15 +105,20 @@ class LoggedInterface(Interface):
             self.log_to_status_map[l] = False
 
     def stop_log(self, log: Log = None, log_name: str = None) -> Log:
+        """
+        stop logging to a log, streamed logs are closed
+        """
         if log:
             del self.log_to_status_map[log]
             del self.logs[self.logs.index(log)]
+            log.close()
             return log
         if log_name:
             for l in self.logs:
                 if l.name == log_name:
                     del self.log_to_status_map[l]
                     del self.logs[self.logs.index(l)]
+                    l.close()
                     return l
         raise Exception("Invalid Arguments passed to stop_log()")
 
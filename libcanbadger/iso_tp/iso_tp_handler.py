@@ -3,7 +3,8 @@ import enum
 import time
 from libcanbadger.canbadger import CANBadger
 from libcanbadger.interface import Interface, InterfaceConnectionStatus
-from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage, IsoTpRxMessageStates
+from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage, IsoTpRxMessageStates, IsoTpFrameFlags, IsoTpBitmasks, \
+    IsoTpFlowStatus
 from libcanbadger.frame import Frame
 
 
@@ -13,11 +14,25 @@ class IsoTpHandler(object):
     IsoTpHandler defines a bridge between your application and IsoTpMessages
     It handles sending and receiving IsoTpMessages using a single interface
     """
-    def __init__(self, interface: type(Interface), sender_id: int, padding_byte=None):
+    def __init__(self, interface: type(Interface), sender_id: int, padding_byte=None,
+                 n_as: float = 1.0, n_bs: float = 1.0, n_cr: float = 1.0, max_fc_wait: int = 10):
+        """
+        :param interface: the interface to send and receive frames with
+        :param sender_id: arbitration id used for our own flow control frames
+        :param padding_byte: a value to use for padding frames, None disables padding
+        :param n_as: max time (in s) the interface may take to transmit a single frame
+        :param n_bs: max time (in s) to wait for a flow control frame after a first frame or a block
+        :param n_cr: max time (in s) to wait for the next consecutive frame
+        :param max_fc_wait: max number of flow control WAIT frames accepted in a row
+        """
         self.messages = {}
         self.interface = interface
         self.sender_id = sender_id
         self.padding_byte = padding_byte
+        self.n_as = n_as
+        self.n_bs = n_bs
+        self.n_cr = n_cr
+        self.max_fc_wait = max_fc_wait
 
     def register_message(self, name: str, arb_id: int, payload: bytes = None) -> None:
         """
@@ -40,22 +55,101 @@ class IsoTpHandler(object):
         msg = self.messages[name]
         self.send_message(msg)
 
-    def send_message(self, msg: IsoTpMessage) -> bool:
+    def send_message(self, msg: IsoTpMessage, wait_for_flow_control: bool = False, fc_arb_id: int = None) -> bool:
         """
         send a message straight away, without registering it
+        :param msg: the message to send
+        :param wait_for_flow_control: wait for the receiver's flow control frames in multi-frame transfers and
+                                      respect their block size and separation time
+        :param fc_arb_id: only accept flow control frames from this arbitration id
+        :return: True if all frames went out in time, False otherwise
         """
         frames = msg.format()
-        for frame in frames:
-            self.interface.send_frame(frame)
+        if len(frames) == 1 or not wait_for_flow_control:
+            for frame in frames:
+                if not self.send_frame_timed(frame):
+                    return False
+            return True
+
+        if not self.send_frame_timed(frames[0]):
+            return False
+        index = 1
+        while index < len(frames):
+            fc = self.wait_for_flowcontrol(arb_id=fc_arb_id)
+            if fc is None:
+                return False
+            block_size, st_min = fc
+            end = len(frames) if block_size == 0 else min(index + block_size, len(frames))
+            for frame in frames[index:end]:
+                if st_min:
+                    time.sleep(st_min)
+                if not self.send_frame_timed(frame):
+                    return False
+            index = end
+        return True
+
+    def send_frame_timed(self, frame: Frame) -> bool:
+        """
+        send a single frame and enforce the N_As timeout on it
+        :return: True if the interface accepted the frame within N_As
+        """
+        start = time.monotonic()
+        if self.interface.send_frame(frame) is False:
+            return False
+        return time.monotonic() - start <= self.n_as
+
+    def wait_for_flowcontrol(self, arb_id: int = None) -> tuple:
+        """
+        wait for a flow control frame, at most N_Bs (restarted by every WAIT frame)
+        :param arb_id: only accept flow control frames from this arbitration id
+        :return: a tuple (block_size, st_min in s) or None on timeout, overflow or too many WAIT frames
+        """
+        deadline = time.monotonic() + self.n_bs
+        wait_count = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            frame = self.interface.receive_frame(timeout=remaining)
+            if frame.payload is None:
+                # the interface waited for the remaining time and got nothing
+                return None
+            if arb_id is not None and frame.arb_id != arb_id:
+                continue
+            if len(frame.payload) < 3 or frame.payload[0] & IsoTpBitmasks.FRAME_TYPE != IsoTpFrameFlags.FC:
+                continue
+            flow_status = frame.payload[0] & IsoTpBitmasks.LEN_OR_CTR
+            if flow_status == IsoTpFlowStatus.CONTINUE_TO_SEND:
+                return frame.payload[1], self.decode_st_min(frame.payload[2])
+            elif flow_status == IsoTpFlowStatus.WAIT:
+                wait_count += 1
+                if wait_count > self.max_fc_wait:
+                    return None
+                deadline = time.monotonic() + self.n_bs
+            else:
+                # overflow or invalid flow status, the receiver won't take this message
+                return None
 
-    def send_data(self, arb_id: int, payload: bytes):
+    @staticmethod
+    def decode_st_min(st_min: int) -> float:
+        """
+        :return: the separation time encoded in a flow control frame, in s
+        """
+        if st_min <= 0x7F:
+            return st_min / 1000
+        if 0xF1 <= st_min <= 0xF9:
+            return (st_min - 0xF0) / 10000
+        # reserved values have to be interpreted as the maximum
+        return 0x7F / 1000
+
+    def send_data(self, arb_id: int, payload: bytes, wait_for_flow_control: bool = False, fc_arb_id: int = None) -> bool:
         """
         send some binary payload, using the user-supplied arbitration id
         does not register the resulting message
         this is essentially syntactic sugar around IsoTpMessage's constructor
         """
         msg = IsoTpMessage(arb_id=arb_id, payload=payload, padding_byte=self.padding_byte)
-        self.send_message(msg)
+        return self.send_message(msg, wait_for_flow_control=wait_for_flow_control, fc_arb_id=fc_arb_id)
 
     def send_flowcontrol(self, command=0, block_size=0, delay=100):
         pl = bytes([command + 0x30, block_size, delay])
@@ -71,10 +165,15 @@ class IsoTpHandler(object):
         """
         pass
 
-    def receive_message(self, arb_id: int = None, timeout=None) -> bytes:
+    def receive_message(self, arb_id: int = None, timeout=None, transfer_timeout=None) -> bytes:
         """
         blocks until a message is received with arbitration id = arb_id
         no message is registered
+
+        waiting is deadline based: unrelated traffic doesn't extend any of the timeouts
+        :param arb_id: only accept a message from this arbitration id, None accepts any
+        :param timeout: max time (in s) to wait for the single or first frame, defaults to N_Cr
+        :param transfer_timeout: optional max time (in s) for the whole transfer, including the first frame
         :return: the received message
         """
         if self.interface.get_connection_status() != InterfaceConnectionStatus.Connected:
@@ -85,18 +184,34 @@ class IsoTpHandler(object):
         else:
             msg = IsoTpMessage()
 
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.n_cr)
+        transfer_deadline = start + transfer_timeout if transfer_timeout is not None else None
+
         # receive frames and see if we can feed them
         while msg.rx_state != IsoTpRxMessageStates.COMPLETE:
-            frame = self.interface.receive_frame(timeout=timeout)
+            now = time.monotonic()
+            if transfer_deadline is not None and transfer_deadline < deadline:
+                deadline = transfer_deadline
+            remaining = deadline - now
+            if remaining <= 0:
+                msg.rx_state = IsoTpRxMessageStates.ERROR
+                break
+
+            frame = self.interface.receive_frame(timeout=remaining)
             if frame.payload is None:
                 msg.rx_state = IsoTpRxMessageStates.ERROR
-                print('empty frame --> timeout')
             elif msg.arb_id is None or msg.arb_id == frame.arb_id:
-                # filter out tester present messages
-                if frame.payload[1] == 0x7f and frame.payload[2] == 0x3e:
+                # filter out tester present messages. only single frames, consecutive frames may contain anything
+                if len(frame.payload) > 2 and frame.payload[0] & IsoTpBitmasks.FRAME_TYPE == IsoTpFrameFlags.SF \
+                        and frame.payload[1] == 0x7f and frame.payload[2] == 0x3e:
                     print('received bad TP response!!')
                 else:
+                    num_received = msg.num_received
                     msg.feed(frame)
+                    if msg.rx_state == IsoTpRxMessageStates.EXPECT_CF and msg.num_received != num_received:
+                        # N_Cr restarts with every consecutive frame we accepted
+                        deadline = time.monotonic() + self.n_cr
 
             if msg.rx_state == IsoTpRxMessageStates.ERROR:
                 # we return an erroneous message as soon as we get the error
@@ -105,6 +220,7 @@ class IsoTpHandler(object):
             if msg.rx_state == IsoTpRxMessageStates.SEND_FC:
                 self.send_flowcontrol(command=0, block_size=0, delay=100)
                 msg.rx_state = IsoTpRxMessageStates.EXPECT_CF
+                deadline = time.monotonic() + self.n_cr
         # if all is good, we return the complete received message
         if msg.rx_state == IsoTpRxMessageStates.COMPLETE:
             return msg.payload
@@ -23,6 +23,12 @@ class IsoTpFrameFlags(enum.IntEnum):
     FC = 0x30  # flow control
 
 
+class IsoTpFlowStatus(enum.IntEnum):
+    CONTINUE_TO_SEND = 0x00
+    WAIT = 0x01
+    OVERFLOW = 0x02
+
+
 class IsoTpBitmasks(enum.IntEnum):
     FRAME_TYPE = 0xF0
     LEN_OR_CTR = 0x0F
@@ -111,7 +117,7 @@ class IsoTpMessage:
                 rx_bytes_to_read = 7 if rx_bytes_remaining > 7 else rx_bytes_remaining  # TODO check for extended frames
                 self.payload += frame.payload[1:rx_bytes_to_read+1]
                 self.num_received += rx_payload_len
-                self.rx_next_ctr += 1
+                self.rx_next_ctr = (self.rx_next_ctr + 1) & IsoTpBitmasks.LEN_OR_CTR
                 if self.num_received >= self.rx_len:
                     # we're done!
                     self.rx_state = IsoTpRxMessageStates.COMPLETE
@@ -155,7 +161,7 @@ class IsoTpMessage:
             for i in range(1, int(byte_count/max_frame_len)+1):
                 frames.append(Frame(
                     arb_id=self.arb_id,
-                    payload=self.pad_message(struct.pack('B', (0x20 | (i % 0x0F))) +
+                    payload=self.pad_message(struct.pack('B', (0x20 | (i & 0x0F))) +
                                              self.payload[i * max_frame_len - 1:(1 + i) * max_frame_len - 1])
                 ))
 
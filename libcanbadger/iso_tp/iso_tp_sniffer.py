@@ -0,0 +1,249 @@
+import time
+from collections import OrderedDict
+
+from libcanbadger.frame import Frame
+from libcanbadger.log import FrameEvent
+
+# plain ints instead of the IsoTpFrameFlags enum, comparing IntEnums is noticeably slower in the hot path
+_SF = 0x00
+_FF = 0x10
+_CF = 0x20
+_FC = 0x30
+
+
+class IsoTpSniffedMessage(object):
+    """
+    a reassembled IsoTp message, as seen passively on the bus
+    """
+    def __init__(self, arb_id: int, payload: bytes, start_time: float, end_time: float, request=None):
+        """
+        :param arb_id: arbitration id the message was sent with
+        :param payload: the reassembled payload
+        :param start_time: timestamp of the single or first frame
+        :param end_time: timestamp of the frame that completed the message
+        :param request: the IsoTpSniffedMessage this message answers, if it could be paired
+        """
+        self.arb_id = arb_id
+        self.payload = payload
+        self.start_time = start_time
+        self.end_time = end_time
+        self.request = request
+
+    def duration(self) -> float:
+        return self.end_time - self.start_time
+
+    def __len__(self):
+        return len(self.payload)
+
+    def __repr__(self):
+        return f"IsoTpSniffedMessage({hex(self.arb_id)}, {self.payload.hex()}, {self.start_time}, {self.end_time})"
+
+
+class _IsoTpStream(object):
+    """
+    reassembly state for a single arbitration id
+    """
+    __slots__ = ('buffer', 'expected_len', 'next_ctr', 'start_time', 'last_time', 'peer_id', 'unanswered')
+
+    def __init__(self):
+        self.buffer = None  # None while no multi-frame transfer is in progress
+        self.expected_len = 0
+        self.next_ctr = 0
+        self.start_time = 0.0
+        self.last_time = 0.0
+        self.peer_id = None
+        self.unanswered = None  # last completed message from this id that got no response yet
+
+
+class IsoTpSniffer(object):
+    """
+    passively reassembles IsoTp messages from any number of arbitration ids
+
+    unlike IsoTpHandler, the sniffer never transmits anything. flow control frames are only used to learn which ids
+    talk to each other, so that responses can be paired with their requests.
+    the number of tracked ids is bounded, the least recently active stream is evicted first
+    """
+    def __init__(self, pairs: dict = None, max_streams: int = 256, stream_timeout: float = 1.0, arb_ids=None):
+        """
+        :param pairs: optional dict of known addressing pairs, e.g. {tester_id: ecu_id}. more pairs are learned from flow control frames
+        :param max_streams: maximum number of arbitration ids to keep reassembly state for
+        :param stream_timeout: an unfinished transfer is dropped when its id has been silent for this long (in s)
+        :param arb_ids: optional collection of arbitration ids to reassemble, all other frames are ignored
+        """
+        self.arb_ids = frozenset(arb_ids) if arb_ids is not None else None
+        self.max_streams = max_streams
+        self.stream_timeout = stream_timeout
+        self.pairs = {}
+        if pairs:
+            for a, b in pairs.items():
+                self.pairs[a] = b
+                self.pairs[b] = a
+        # arb_id -> _IsoTpStream, ordered by last activity
+        self.streams = OrderedDict()
+        # id of the last stream that sent a first frame, the next flow control frame belongs to it
+        self.awaiting_fc = None
+
+        # statistics
+        self.frame_count = 0
+        self.message_count = 0
+        self.error_count = 0
+        self.evicted_count = 0
+
+    def reset(self) -> None:
+        """
+        forget all reassembly and pairing state, except for the pairs supplied by the user
+        """
+        self.streams.clear()
+        self.awaiting_fc = None
+
+    def _get_stream(self, arb_id: int, now: float) -> _IsoTpStream:
+        streams = self.streams
+        stream = streams.get(arb_id)
+        if stream is None:
+            stream = _IsoTpStream()
+            streams[arb_id] = stream
+            if len(streams) > self.max_streams:
+                streams.popitem(last=False)
+                self.evicted_count += 1
+        else:
+            streams.move_to_end(arb_id)
+
+        # streams are ordered by activity, so we only have to look at the front
+        deadline = now - self.stream_timeout
+        while streams:
+            oldest_id = next(iter(streams))
+            oldest = streams[oldest_id]
+            if oldest is stream or oldest.last_time >= deadline:
+                break
+            del streams[oldest_id]
+            self.evicted_count += 1
+
+        stream.last_time = now
+        return stream
+
+    def _complete(self, arb_id: int, stream: _IsoTpStream, payload: bytes, start_time: float,
+                  end_time: float) -> IsoTpSniffedMessage:
+        msg = IsoTpSniffedMessage(arb_id, payload, start_time, end_time)
+        peer_id = self.pairs.get(arb_id, stream.peer_id)
+        if peer_id is not None:
+            peer = self.streams.get(peer_id)
+            if peer is not None and peer.unanswered is not None:
+                msg.request = peer.unanswered
+                peer.unanswered = None
+            else:
+                stream.unanswered = msg
+        else:
+            stream.unanswered = msg
+        self.message_count += 1
+        return msg
+
+    def feed(self, frame: Frame) -> IsoTpSniffedMessage:
+        """
+        feed a single frame into the sniffer
+        :param frame: the frame to process
+        :return: an IsoTpSniffedMessage if the frame completed a message, None otherwise
+        """
+        payload = frame.payload
+        arb_id = frame.arb_id
+        if not payload or arb_id is None:
+            return None
+        if self.arb_ids is not None and arb_id not in self.arb_ids:
+            return None
+        self.frame_count += 1
+        now = frame.timestamp if frame.timestamp is not None else time.time()
+        stream = self._get_stream(arb_id, now)
+
+        pci = payload[0]
+        frame_type = pci & 0xF0
+        if frame_type == _CF:
+            buffer = stream.buffer
+            if buffer is None:
+                return None
+            if pci & 0x0F != stream.next_ctr:
+                # lost a frame somewhere, this transfer can't be completed anymore
+                stream.buffer = None
+                self.error_count += 1
+                return None
+            stream.next_ctr = (stream.next_ctr + 1) & 0x0F
+            buffer += payload[1:]
+            if len(buffer) >= stream.expected_len:
+                stream.buffer = None
+                return self._complete(arb_id, stream, bytes(buffer[:stream.expected_len]), stream.start_time, now)
+            return None
+        elif frame_type == _SF:
+            if stream.buffer is not None:
+                self.error_count += 1
+                stream.buffer = None
+            length = pci & 0x0F
+            if length == 0 and len(payload) > 8:
+                # can-fd single frame with escaped length
+                return self._complete(arb_id, stream, bytes(payload[2:2 + payload[1]]), now, now)
+            if length == 0 or length > len(payload) - 1:
+                self.error_count += 1
+                return None
+            return self._complete(arb_id, stream, bytes(payload[1:1 + length]), now, now)
+        elif frame_type == _FF:
+            if len(payload) < 2:
+                self.error_count += 1
+                return None
+            if stream.buffer is not None:
+                self.error_count += 1
+            length = ((pci & 0x0F) << 8) | payload[1]
+            data_start = 2
+            if length == 0 and len(payload) >= 6:
+                # first frame with escaped 32 bit length
+                length = int.from_bytes(payload[2:6], byteorder='big')
+                data_start = 6
+            stream.buffer = bytearray(payload[data_start:])
+            stream.expected_len = length
+            stream.next_ctr = 1
+            stream.start_time = now
+            self.awaiting_fc = arb_id
+            return None
+        elif frame_type == _FC:
+            sender_id = self.awaiting_fc
+            if sender_id is not None and sender_id != arb_id:
+                stream.peer_id = sender_id
+                sender = self.streams.get(sender_id)
+                if sender is not None:
+                    sender.peer_id = arb_id
+                self.awaiting_fc = None
+            return None
+        return None
+
+    def sniff(self, source) -> iter:
+        """
+        reassemble all IsoTp messages from a source of frames
+        :param source: an iterable of Frames or log events (e.g. a Log), or an Interface to read from
+        :return: a generator yielding IsoTpSniffedMessages
+        """
+        if hasattr(source, 'receive_frame'):
+            source = frames_from_interface(source)
+        feed = self.feed
+        for item in source:
+            if isinstance(item, FrameEvent):
+                item = item.frame
+            elif not isinstance(item, Frame):
+                # named events and the like carry no frames
+                continue
+            msg = feed(item)
+            if msg is not None:
+                yield msg
+
+
+def frames_from_interface(interface, timeout: float = 1.0, stop_event=None) -> iter:
+    """
+    turns a live interface into an iterable of frames
+    received frames without a timestamp are stamped with their reception time
+    :param interface: the interface to receive from
+    :param timeout: how long every single receive call may block
+    :param stop_event: optional threading.Event, the generator returns once it is set
+    :return: a generator yielding Frames
+    """
+    while stop_event is None or not stop_event.is_set():
+        frame = interface.receive_frame(timeout=timeout)
+        if frame.payload is None:
+            continue
+        if frame.timestamp is None:
+            frame.timestamp = time.time()
+        yield frame
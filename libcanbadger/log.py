@@ -1,6 +1,9 @@
 from libcanbadger.frame import Frame
 import json
 import enum
+import os
+import threading
+import time
 from binascii import hexlify, unhexlify
 
 class LogEventType(enum.IntEnum):
@@ -12,8 +15,11 @@ class LogEvent(object):
     def __init__(self, type: int):
         self.type = type
 
+    def to_dict(self) -> dict:
+        return {'type': self.type}
+
     def serialize(self) -> str:
-        pass
+        return json.dumps(self.to_dict())
 
     @staticmethod
     def from_dict(json_obj: dict) -> object:
@@ -32,20 +38,27 @@ class FrameEvent(LogEvent):
         super(FrameEvent, self).__init__(type)
         self.frame = frame
 
-    def serialize(self) -> str:
-        return json.dumps({
+    def to_dict(self) -> dict:
+        json_obj = {
             'type': self.type,
             'arb_id': hex(self.frame.arb_id),
             'payload': ' '.join([hex(i) for i in self.frame.payload])
-        })
+        }
+        if self.frame.timestamp is not None:
+            json_obj['timestamp'] = self.frame.timestamp
+        return json_obj
 
     @staticmethod
     def from_dict(json_obj: dict) -> object:
         if json_obj['type'] not in [LogEventType.LOG_EVENT_RX_FRAME, LogEventType.LOG_EVENT_TX_FRAME]:
             raise Exception("Tried parsing a FrameEvent with invalid type!")
 
+        # the payload is serialized as space separated hex numbers, e.g. "0x2 0x10 0x3"
         return FrameEvent(
-            frame=Frame(arb_id=int(json_obj['arb_id'], 16), payload=bytes.fromhex(json_obj['payload']))
+            frame=Frame(arb_id=int(json_obj['arb_id'], 16),
+                        payload=bytes(int(i, 16) for i in json_obj['payload'].split()),
+                        timestamp=json_obj.get('timestamp')),
+            type=LogEventType(json_obj['type'])
         )
 
     def pretty_print(self) -> None:
@@ -56,10 +69,11 @@ class NamedEvent(LogEvent):
         super(NamedEvent, self).__init__(type=LogEventType.LOG_EVENT_NAMED_EVENT)
         self.name = name
 
-    def serialize(self) -> str:
-        return json.dumps({
+    def to_dict(self) -> dict:
+        return {
+            'type': self.type,
             'name': self.name
-        })
+        }
 
     @staticmethod
     def from_dict(json_obj: dict) -> object:
@@ -72,10 +86,21 @@ class NamedEvent(LogEvent):
     def pretty_print(self) -> None:
         print(f"-> {self.name}")
 
+def parse_log_event(json_obj: dict) -> object:
+    """
+    :return: the LogEvent serialized in json_obj, or json_obj itself if it isn't one
+    """
+    if 'type' in json_obj:
+        if json_obj['type'] in [LogEventType.LOG_EVENT_RX_FRAME, LogEventType.LOG_EVENT_TX_FRAME]:
+            return FrameEvent.from_dict(json_obj)
+        elif json_obj['type'] == LogEventType.LOG_EVENT_NAMED_EVENT:
+            return NamedEvent.from_dict(json_obj)
+    return json_obj
+
 class JsonLogEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, LogEvent):
-            return o.serialize()
+            return o.to_dict()
         else:
             return json.JSONEncoder.default(self, o)
 
@@ -103,6 +128,12 @@ class Log(object):
     def log(self, event: LogEvent) -> None:
         self.events.append(event)
 
+    def close(self) -> None:
+        """
+        nothing to do for a Log in memory, see StreamingLogWriter
+        """
+        pass
+
     def pretty_print(self) -> None:
         for ev in self.events:
             ev.pretty_print()
@@ -118,17 +149,9 @@ class Log(object):
     def from_json(json_str: str) -> object:
         log = Log()
 
-        # add object hook
-        def parse_log_event(dct):
-            if 'type' in dct:
-                if dct['type'] in [LogEventType.LOG_EVENT_RX_FRAME, LogEventType.LOG_EVENT_TX_FRAME]:
-                    return FrameEvent.from_dict(dct)
-                elif dct['type'] == LogEventType.LOG_EVENT_NAMED_EVENT:
-                    return NamedEvent.from_dict(dct)
-            return dct
-
         ev_arr = json.loads(json_str, object_hook=parse_log_event)
-        log.events = ev_arr
+        # older files hold every event as a json string of its own
+        log.events = [parse_log_event(json.loads(ev)) if isinstance(ev, str) else ev for ev in ev_arr]
 
         return log
 
@@ -145,3 +168,161 @@ class Log(object):
 
         return Log.from_json(json_str)
 
+    @staticmethod
+    def load_from_stream(filename: str) -> object:
+        """
+        loads a log written by a StreamingLogWriter, including all rotated segments
+        :param filename: the filename passed to the StreamingLogWriter
+        :return: a new Log object
+        """
+        log = Log()
+        for record in read_log_stream(filename):
+            if isinstance(record, LogEvent):
+                log.events.append(record)
+            elif 'log' in record:
+                log.name = record['log']
+        return log
+
+
+def stream_segment_filename(filename: str, index: int) -> str:
+    """
+    :return: the name of segment index of a streamed log, the first segment is filename itself
+    """
+    if index == 0:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{index}{ext}"
+
+
+def read_log_stream(filename: str):
+    """
+    reads the records of a streamed log, segment by segment, while it may still be written to
+    a partially written last line (e.g. after a crash) is left out
+    :param filename: the filename passed to the StreamingLogWriter
+    :return: a generator of LogEvents, and of dicts for other records such as segment headers
+    """
+    index = 0
+    while os.path.exists(stream_segment_filename(filename, index)):
+        with open(stream_segment_filename(filename, index), 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    yield parse_log_event(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+        index += 1
+
+
+class StreamingLogWriter(object):
+    """
+    writes log events to disk as they come in, one JSON object per line (NDJSON), instead of keeping them in memory
+
+    lines are buffered and flushed every flush_interval seconds, and synced to disk with fsync every fsync_interval
+    seconds. files are rotated once they reach max_bytes or are older than max_age seconds: segment n is written to
+    "name.n.ext" (see stream_segment_filename()), each starting with a header record. every record gets the time it
+    was logged at. it can be used wherever a Log is, e.g. with LoggedInterface.add_log(). read it back with
+    Log.load_from_stream() or read_log_stream()
+    """
+    def __init__(self, filename: str, name: str = None, buffer_size: int = 65536, flush_interval: float = 1.0,
+                 fsync_interval: float = None, max_bytes: int = None, max_age: float = None):
+        """
+        :param filename: the file to write, rotated segments are named after it
+        :param name: the name of the log
+        :param buffer_size: size of the write buffer, in bytes
+        :param flush_interval: hand buffered lines to the OS after this many seconds, 0 to do so for every event
+        :param fsync_interval: sync the file to disk after this many seconds, None to only sync on rotation and close
+        :param max_bytes: rotate to a new segment once a segment reached this size, None for no limit
+        :param max_age: rotate to a new segment after this many seconds, None for no limit
+        """
+        self.filename = filename
+        self.name = name
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # log() may be called from several threads, e.g. by a LoggedInterface
+        self.lock = threading.Lock()
+        self.file = None
+        self.segment = -1
+        self.segment_bytes = 0
+        self.segment_start = 0.0
+        self.last_flush = 0.0
+        self.last_fsync = 0.0
+        self.event_count = 0
+        # continue with the last segment of an earlier run
+        last = 0
+        while os.path.exists(stream_segment_filename(filename, last + 1)):
+            last += 1
+        self.open_segment(last)
+
+    def __len__(self):
+        return self.event_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open_segment(self, index: int) -> None:
+        self.segment = index
+        # line buffering off, the buffer is flushed by our own policy
+        self.file = open(stream_segment_filename(self.filename, index), 'a', buffering=self.buffer_size)
+        self.segment_bytes = self.file.tell()
+        if self.segment_bytes > 0:
+            # continuing a file, don't glue the header to a partial line left behind by a crash
+            self.write_line('\n')
+        self.segment_start = time.monotonic()
+        self.last_flush = self.last_fsync = self.segment_start
+        self.write_line(json.dumps({'log': self.name, 'segment': index, 'time': time.time()}) + '\n')
+
+    def write_line(self, line: str) -> None:
+        self.file.write(line)
+        # JSON is plain ascii, so characters are bytes
+        self.segment_bytes += len(line)
+
+    def sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = self.last_fsync = time.monotonic()
+
+    def rotate(self) -> None:
+        self.sync()
+        self.file.close()
+        self.open_segment(self.segment + 1)
+
+    def log(self, event: LogEvent) -> None:
+        record = event.to_dict()
+        record['time'] = time.time()
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            if self.file is None:
+                raise Exception("StreamingLogWriter: log() after close()")
+            now = time.monotonic()
+            if (self.max_bytes is not None and self.segment_bytes + len(line) > self.max_bytes) \
+                    or (self.max_age is not None and now - self.segment_start >= self.max_age):
+                self.rotate()
+            self.write_line(line)
+            self.event_count += 1
+            if self.fsync_interval is not None and now - self.last_fsync >= self.fsync_interval:
+                self.sync()
+            elif now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+    def segment_filenames(self) -> list:
+        return [stream_segment_filename(self.filename, i) for i in range(self.segment + 1)]
@@ -0,0 +1,224 @@
+import heapq
+from typing import List
+
+from libcanbadger.search.strategy import Strategy
+from libcanbadger.search.parameter import Parameter
+
+
+class AdaptiveStrategy(Strategy):
+    """
+    visits the neighbourhood of hits first
+
+    the combination indices are split into blocks of neighbouring combinations, the last parameter varying fastest as
+    in BruteforceStrategy. every block is visited in order, but blocks are picked by priority: hits reported in a
+    block raise its priority and that of its neighbours, dead ends lower it. the caller tells which is which, see
+    report(). a block that
+    keeps answering with dead ends is left for later, so the first pass samples every block before going deep.
+    every combination is still returned exactly once. only blocks that were started take up memory
+    """
+    def __init__(self, block_size: int = 64, hit_weight: float = 10.0, dead_weight: float = 1.0):
+        """
+        :param block_size: number of neighbouring combinations per block
+        :param hit_weight: priority gained by a block per hit, its neighbours gain half of it
+        :param dead_weight: priority lost by a block per dead end
+        """
+        super(AdaptiveStrategy, self).__init__()
+        self.block_size = block_size
+        self.hit_weight = hit_weight
+        self.dead_weight = dead_weight
+        self.block_count = 0
+        # maps started blocks to [cursor, priority]
+        self.blocks = {}
+        # (-priority, -push counter, block) entries, some of them outdated
+        self.heap = []
+        self.push_count = 0
+        # the next block that was never started, blocks are started in order unless a neighbour's hit starts them
+        self.next_fresh = 0
+        self.hit_count = 0
+        self.dead_count = 0
+        # the block of the last returned combination
+        self.last_block = None
+
+    def update(self, parameters: List[Parameter]):
+        super(AdaptiveStrategy, self).update(parameters)
+        self.block_count = -(-self.length() // self.block_size)
+
+    def set_range(self, start: int, stop: int) -> None:
+        super(AdaptiveStrategy, self).set_range(start, stop)
+        self.block_count = -(-self.length() // self.block_size)
+
+    def reset(self):
+        super(AdaptiveStrategy, self).reset()
+        self.blocks = {}
+        self.heap = []
+        self.push_count = 0
+        self.next_fresh = 0
+        self.hit_count = 0
+        self.dead_count = 0
+        self.last_block = None
+
+    def seek(self, position: int) -> None:
+        # the order depends on the reported outcomes, a position alone doesn't tell where we are
+        if position == 0:
+            self.reset()
+        elif position == self.total_returned_cnt + 1:
+            # Search.increment()
+            self.get_next()
+        elif position != self.total_returned_cnt:
+            raise Exception("AdaptiveStrategy: can't seek, use serialize() and unserialize() to resume")
+
+    def block_length(self, block: int) -> int:
+        return min(self.block_size, self.length() - block * self.block_size)
+
+    def push(self, block: int) -> None:
+        cursor, priority = self.blocks[block]
+        if cursor < self.block_length(block):
+            self.push_count += 1
+            heapq.heappush(self.heap, (-priority, -self.push_count, block))
+
+    def start_block(self, block: int, priority: float = 0.0) -> None:
+        self.blocks[block] = [0, priority]
+        self.push(block)
+
+    def best_block(self) -> int:
+        """
+        :return: the block to continue with, or None if all blocks are done
+        """
+        while self.heap:
+            priority, _, block = self.heap[0]
+            cursor, current_priority = self.blocks[block]
+            if -priority != current_priority or cursor >= self.block_length(block):
+                # outdated entry
+                heapq.heappop(self.heap)
+                continue
+            if current_priority >= 0:
+                return block
+            break
+        # fresh blocks rank below every started block that didn't turn out dead
+        while self.next_fresh < self.block_count and self.next_fresh in self.blocks:
+            self.next_fresh += 1
+        if self.next_fresh < self.block_count:
+            self.start_block(self.next_fresh)
+            return self.next_fresh
+        if self.heap:
+            return self.heap[0][2]
+        return None
+
+    def next_index(self, advance: bool) -> int:
+        block = self.best_block()
+        if block is None:
+            return None
+        state = self.blocks[block]
+        index = self.range_start + block * self.block_size + state[0]
+        if advance:
+            state[0] += 1
+            self.last_block = block
+        return index
+
+    def get_next(self) -> list:
+        """
+        :return: the next combination, or None once all combinations were returned
+        """
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        index = self.next_index(advance=True)
+        if index is None:
+            return None
+        self.total_returned_cnt += 1
+        return self.get(index)
+
+    def skip_invalid(self) -> None:
+        """
+        skip pruned and invalid combinations, they count as returned
+        """
+        while (self.pruned_prefixes or self.sparse) and self.total_returned_cnt < self.length():
+            index = self.next_index(advance=False)
+            if index is None or not self.should_skip(self.get(index)):
+                break
+            self.next_index(advance=True)
+            self.total_returned_cnt += 1
+            self.skipped_cnt += 1
+
+    def peek_next(self) -> list:
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        index = self.next_index(advance=False)
+        return None if index is None else self.get(index)
+
+    def next_index_batch(self, n: int):
+        import numpy
+        indices = []
+        while len(indices) < n:
+            self.skip_invalid()
+            if self.total_returned_cnt >= self.length():
+                break
+            index = self.next_index(advance=True)
+            if index is None:
+                break
+            self.total_returned_cnt += 1
+            indices.append(index)
+        return numpy.array(indices, dtype=self.index_dtype())
+
+    def change_priority(self, block: int, delta: float) -> None:
+        if block < 0 or block >= self.block_count:
+            return
+        if block not in self.blocks:
+            # a neighbour of a hit, start it right away
+            self.start_block(block, delta)
+            return
+        self.blocks[block][1] += delta
+        self.push(block)
+
+    def report(self, values: list, outcome, hit: bool = None) -> None:
+        """
+        feedback for a combination returned before
+        :param values: the combination
+        :param outcome: the result, for the pruning rules
+        :param hit: True for a hit, False for a dead end, None if the result says neither (e.g. a timeout)
+        """
+        super(AdaptiveStrategy, self).report(values, outcome, hit)
+        if hit is None:
+            return
+        position = self.index_of(values) - self.range_start
+        if position < 0 or position >= self.length():
+            return
+        block = position // self.block_size
+        if hit:
+            self.hit_count += 1
+            self.change_priority(block, self.hit_weight)
+            self.change_priority(block - 1, self.hit_weight / 2)
+            self.change_priority(block + 1, self.hit_weight / 2)
+        else:
+            self.dead_count += 1
+            self.change_priority(block, -self.dead_weight)
+
+    def to_dict(self) -> dict:
+        json_obj = super(AdaptiveStrategy, self).to_dict()
+        json_obj.update({'block_size': self.block_size, 'hit_weight': self.hit_weight,
+                         'dead_weight': self.dead_weight, 'next_fresh': self.next_fresh, 'last_block': self.last_block,
+                         'blocks': [[block, cursor, priority] for block, (cursor, priority) in self.blocks.items()]})
+        return json_obj
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        return AdaptiveStrategy(block_size=json_obj.get('block_size', 64), hit_weight=json_obj.get('hit_weight', 10.0),
+                                dead_weight=json_obj.get('dead_weight', 1.0))
+
+    def load_state(self, json_obj: dict) -> None:
+        self.set_range(*json_obj['range'])
+        for block, cursor, priority in json_obj.get('blocks', []):
+            self.blocks[block] = [cursor, priority]
+        self.next_fresh = json_obj.get('next_fresh', 0)
+        self.total_returned_cnt = json_obj['position']
+        self.last_block = json_obj.get('last_block')
+        self.load_pruning_state(json_obj)
+        returned = sum(cursor for cursor, _ in self.blocks.values())
+        if self.total_returned_cnt == returned - 1 and self.last_block is not None:
+            # serialized with in_flight, hand out the last combination again
+            self.blocks[self.last_block][0] -= 1
+        elif self.total_returned_cnt != returned:
+            raise Exception("AdaptiveStrategy: position doesn't match the saved blocks")
+        for block in self.blocks:
+            self.push(block)
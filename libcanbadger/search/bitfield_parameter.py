@@ -0,0 +1,74 @@
+from math import comb
+
+from libcanbadger.search.parameter import Parameter
+
+
+class BitfieldParameter(Parameter):
+    """
+    variations of a template, flipping the bits selected by a mask
+    values are ordered by the number of flipped bits: first the template itself, then all single bit flips, then all
+    pairs and so on, up to max_flips bits. with max_flips=None, all values of the masked bits are covered.
+    values are computed from the index (using the combinatorial number system), the domain is never expanded
+    """
+    def __init__(self, name, template: bytes, mask: bytes = None, max_flips: int = None):
+        """
+        :param template: the value to start from
+        :param mask: the bits that may be flipped, as long as template. all bits if None
+        :param max_flips: the most bits flipped at once, all masked bits if None
+        """
+        super(BitfieldParameter, self).__init__(name)
+        self.template = bytes(template)
+        self.mask = b'\xff' * len(self.template) if mask is None else bytes(mask)
+        if len(self.mask) != len(self.template):
+            raise Exception("BitfieldParameter: mask and template differ in length")
+        mask_value = int.from_bytes(self.mask, byteorder='big')
+        # the bit numbers we can flip, bit 0 is the least significant bit of the last byte
+        self.positions = [bit for bit in range(len(self.mask) * 8) if mask_value >> bit & 1]
+        self.max_flips = len(self.positions) if max_flips is None else min(max_flips, len(self.positions))
+        # the index of the first value with a given number of flipped bits
+        self.offsets = [0]
+        for flips in range(self.max_flips):
+            self.offsets.append(self.offsets[-1] + comb(len(self.positions), flips))
+
+    def length(self) -> int:
+        return self.offsets[-1] + comb(len(self.positions), self.max_flips)
+
+    def get(self, index, context: dict = None):
+        if index < 0 or index >= self.length():
+            raise IndexError(f"BitfieldParameter {self.name}: index {index} out of range")
+        flips = len(self.offsets) - 1
+        while self.offsets[flips] > index:
+            flips -= 1
+        rank = index - self.offsets[flips]
+        # unrank the combination of flipped positions, largest position first
+        pattern = 0
+        c = len(self.positions)
+        for i in range(flips, 0, -1):
+            c -= 1
+            while comb(c, i) > rank:
+                c -= 1
+            rank -= comb(c, i)
+            pattern |= 1 << self.positions[c]
+        value = int.from_bytes(self.template, byteorder='big') ^ pattern
+        return value.to_bytes(len(self.template), byteorder='big')
+
+    def index_of(self, value, context: dict = None) -> int:
+        value = bytes(value)
+        if len(value) != len(self.template):
+            raise Exception(f"BitfieldParameter {self.name}: {value.hex()} is not a value of this parameter")
+        pattern = int.from_bytes(value, byteorder='big') ^ int.from_bytes(self.template, byteorder='big')
+        if pattern & ~int.from_bytes(self.mask, byteorder='big'):
+            raise Exception(f"BitfieldParameter {self.name}: {value.hex()} is not a value of this parameter")
+        flipped = [c for c, bit in enumerate(self.positions) if pattern >> bit & 1]
+        if len(flipped) > self.max_flips:
+            raise Exception(f"BitfieldParameter {self.name}: {value.hex()} is not a value of this parameter")
+        return self.offsets[len(flipped)] + sum(comb(c, i + 1) for i, c in enumerate(flipped))
+
+    def to_dict(self) -> dict:
+        return {'type': type(self).__name__, 'name': self.name, 'switch_cost': self.switch_cost,
+                'template': self.template.hex(), 'mask': self.mask.hex(), 'max_flips': self.max_flips}
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        return BitfieldParameter(json_obj['name'], bytes.fromhex(json_obj['template']),
+                                 mask=bytes.fromhex(json_obj['mask']), max_flips=json_obj['max_flips'])
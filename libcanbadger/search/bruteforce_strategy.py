@@ -1,4 +1,3 @@
-from functools import reduce
 from typing import List
 
 from libcanbadger.search.strategy import Strategy
@@ -8,68 +7,105 @@ from libcanbadger.search.parameter import Parameter
 class BruteforceStrategy(Strategy):
     """
     a depth-first-search bruteforce variant
+    the last parameter varies fastest, so combinations are returned in the order of their index
     """
     def __init__(self):
         super(BruteforceStrategy, self).__init__()
         self.total_combination_count = 0
         self.total_parameter_count = 0
-        self.parameters = []
-        self.indices = {}
+        # the parameter indices of the next combination
+        self.indices = []
 
     def reset(self):
-        self.update(self.parameters)
-
-    def reset_all(self):
-        self.total_returned_cnt = 0
-        self.indices = {}
-        self.parameters = []
+        self.seek(0)
 
     def update(self, parameters: List[Parameter]):
-        self.reset_all()
-        self.parameters = parameters
-        self.total_combination_count = reduce(lambda x, y: x*y, [p.length() for p in parameters])
-        self.total_parameter_count = len(parameters)
-        for p in self.parameters:
-            self.indices[p] = 0
+        super(BruteforceStrategy, self).update(parameters)
+        self.total_combination_count = self.combination_count
+        self.total_parameter_count = len(self.parameters)
 
-    def move_indices(self, indices) -> list:
-        # select "deepest" parameter
-        current_param_index = len(self.parameters) - 1
-        current_param = self.parameters[current_param_index]
-        indices[current_param] += 1
-        while indices[self.parameters[current_param_index]] >= self.parameters[current_param_index].length():
-            indices[self.parameters[current_param_index]] = 0
-            current_param_index -= 1
-            indices[self.parameters[current_param_index]] += 1
+    def seek(self, position: int) -> None:
+        super(BruteforceStrategy, self).seek(position)
+        if position < self.length():
+            self.indices = self.indices_of(self.index_at(position))
+        else:
+            self.indices = []
 
-            if current_param_index == 0 and indices[self.parameters[0]] > self.parameters[0].length():
-                # we're done!
-                self.total_returned_cnt= 1
-                return [p.length()-1 for p in self.parameters]
+    def prune(self, prefix: list) -> None:
+        """
+        a subtree is a contiguous run of combinations here, so skip over the rest of it right away
+        """
+        if self.has_completed():
+            return
+        start, stop = self.prefix_range(prefix)
+        index = self.index_at(self.total_returned_cnt)
+        if start <= index < stop:
+            position = min(stop, self.range_stop) - self.range_start
+            self.skipped_cnt += position - self.total_returned_cnt
+            self.seek(position)
 
-        self.total_returned_cnt += 1
-        return list(self.indices.values())
+    def skip_invalid(self) -> None:
+        """
+        skip invalid combinations. the ones sharing the parameters up to an invalid dependent parameter index are a
+        contiguous run, starting with the invalid index and reaching to the end of that subtree
+        """
+        while self.sparse and self.total_returned_cnt < self.length():
+            _, invalid = self.resolve(self.indices)
+            if invalid is None:
+                return
+            if invalid == 0:
+                stop = self.combination_count
+            else:
+                start = self.index_of_indices(self.indices[:invalid])
+                stop = start + self.place_values[invalid - 1]
+            position = min(stop, self.range_stop) - self.range_start
+            self.skipped_cnt += position - self.total_returned_cnt
+            self.seek(position)
+
+    def next_index_batch(self, n: int):
+        if self.pruned_prefixes or self.sparse:
+            return super(BruteforceStrategy, self).next_index_batch(n)
+        import numpy
+        position = self.total_returned_cnt
+        count = max(min(n, self.length() - position), 0)
+        start = self.index_at(position)
+        if self.index_dtype() is object:
+            indices = numpy.array(range(start, start + count), dtype=object)
+        else:
+            indices = numpy.arange(start, start + count, dtype=numpy.int64)
+        self.seek(position + count)
+        return indices
+
+    def move_indices(self, indices: list) -> bool:
+        """
+        advance a list of parameter indices to the next combination, in place
+        :return: False if there is no next combination
+        """
+        current_param_index = len(indices) - 1
+        while current_param_index >= 0:
+            indices[current_param_index] += 1
+            if indices[current_param_index] < self.radices[current_param_index]:
+                return True
+            # carry over to the next "outer" parameter
+            indices[current_param_index] = 0
+            current_param_index -= 1
+        return False
 
     def get_next(self) -> list:
-        values = []
-        for k, v in self.indices.items():
-            values.append(k.get(v))
-        self.move_indices(self.indices)
+        """
+        :return: the next combination, or None once all combinations were returned
+        """
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        values = self.values_of(self.indices)
+        self.total_returned_cnt += 1
+        if not self.move_indices(self.indices):
+            self.indices = []
         return values
 
     def peek_next(self) -> list:
-        values = []
-        for k, v in self.indices.items():
-            values.append(k.get(v))
-        return values
-
-    def length(self) -> int:
-        if len(self.parameters) > 0:
-            param_lengths = [p.length() for p in self.parameters]
-            total_count = param_lengths[0]
-            for l in param_lengths[1:]:
-                total_count *= l
-            return total_count
-
-        return 0
-
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        return self.values_of(self.indices)
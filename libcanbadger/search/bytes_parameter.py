@@ -0,0 +1,79 @@
+from libcanbadger.search.parameter import Parameter
+
+
+class BytesParameter(Parameter):
+    """
+    byte strings of min_length to max_length bytes, every byte taken from an alphabet (all 256 values by default)
+    shorter strings come first, strings of the same length in lexicographic order of their alphabet indices.
+    prefix and suffix are added to every value, e.g. for a fixed sub-function or a checksum placeholder.
+    values are computed from the index, the domain is never expanded
+    """
+    def __init__(self, name, min_length: int = 1, max_length: int = None, alphabet: list = None,
+                 prefix: bytes = b'', suffix: bytes = b''):
+        """
+        :param min_length: the shortest variable part, can be 0
+        :param max_length: the longest variable part, min_length if None
+        :param alphabet: the byte values to use, all 256 if None
+        :param prefix: fixed bytes before the variable part
+        :param suffix: fixed bytes after the variable part
+        """
+        super(BytesParameter, self).__init__(name)
+        if max_length is None:
+            max_length = min_length
+        if min_length < 0 or max_length < min_length:
+            raise Exception("BytesParameter: invalid length range")
+        self.min_length = min_length
+        self.max_length = max_length
+        self.alphabet = list(range(256)) if alphabet is None else list(alphabet)
+        if not self.alphabet:
+            raise Exception("BytesParameter: the alphabet can't be empty")
+        self.prefix = bytes(prefix)
+        self.suffix = bytes(suffix)
+        # the number of values per length, and the index of the first value of every length
+        self.counts = [len(self.alphabet) ** length for length in range(min_length, max_length + 1)]
+        self.offsets = [0]
+        for count in self.counts[:-1]:
+            self.offsets.append(self.offsets[-1] + count)
+
+    def length(self) -> int:
+        return self.offsets[-1] + self.counts[-1]
+
+    def get(self, index, context: dict = None):
+        if index < 0 or index >= self.length():
+            raise IndexError(f"BytesParameter {self.name}: index {index} out of range")
+        bucket = len(self.offsets) - 1
+        while self.offsets[bucket] > index:
+            bucket -= 1
+        index -= self.offsets[bucket]
+        radix = len(self.alphabet)
+        data = bytearray(self.min_length + bucket)
+        for i in range(len(data) - 1, -1, -1):
+            index, digit = divmod(index, radix)
+            data[i] = self.alphabet[digit]
+        return self.prefix + bytes(data) + self.suffix
+
+    def index_of(self, value, context: dict = None) -> int:
+        value = bytes(value)
+        if not value.startswith(self.prefix) or not value.endswith(self.suffix) \
+                or len(value) < len(self.prefix) + len(self.suffix):
+            raise Exception(f"BytesParameter {self.name}: {value.hex()} is not a value of this parameter")
+        data = value[len(self.prefix):len(value) - len(self.suffix)]
+        if len(data) < self.min_length or len(data) > self.max_length:
+            raise Exception(f"BytesParameter {self.name}: {value.hex()} is not a value of this parameter")
+        index = 0
+        for byte in data:
+            if byte not in self.alphabet:
+                raise Exception(f"BytesParameter {self.name}: {value.hex()} is not a value of this parameter")
+            index = index * len(self.alphabet) + self.alphabet.index(byte)
+        return self.offsets[len(data) - self.min_length] + index
+
+    def to_dict(self) -> dict:
+        return {'type': type(self).__name__, 'name': self.name, 'switch_cost': self.switch_cost,
+                'min_length': self.min_length, 'max_length': self.max_length, 'alphabet': self.alphabet,
+                'prefix': self.prefix.hex(), 'suffix': self.suffix.hex()}
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        return BytesParameter(json_obj['name'], min_length=json_obj['min_length'], max_length=json_obj['max_length'],
+                              alphabet=json_obj['alphabet'], prefix=bytes.fromhex(json_obj['prefix']),
+                              suffix=bytes.fromhex(json_obj['suffix']))
@@ -0,0 +1,145 @@
+from typing import List
+
+from libcanbadger.search.strategy import Strategy
+from libcanbadger.search.parameter import Parameter
+
+
+class CostAwareStrategy(Strategy):
+    """
+    visits every combination exactly once, in the order that changes expensive parameters least often
+
+    parameters declare what changing their value costs in switch_cost, e.g. the time to enter a diagnostic session or
+    to unlock a security level. expensive parameters vary slowest, cheap ones fastest. with gray=True, the order is
+    a reflected mixed-radix Gray code: inner parameters run backwards every other time instead of jumping back to
+    their first value, so exactly one parameter changes between two combinations. sorting the parameters by
+    descending cost is optimal then. without it, the odometer order of BruteforceStrategy is used, with the
+    parameters sorted by cost * radix / (radix - 1).
+    expected_cost() tells the total switching cost before a run
+    """
+    def __init__(self, gray: bool = True):
+        """
+        :param gray: use the reflected (Gray code) order
+        """
+        super(CostAwareStrategy, self).__init__()
+        self.gray = gray
+        # parameter numbers from the slowest to the fastest varying one, and their radices and place values
+        self.order = []
+        self.order_radices = []
+        self.order_place_values = []
+
+    def update(self, parameters: List[Parameter]):
+        super(CostAwareStrategy, self).update(parameters)
+        self.order = self.best_order(self.parameters, self.gray)
+        self.order_radices = [self.radices[p] for p in self.order]
+        self.order_place_values = [1] * len(self.order)
+        for i in range(len(self.order) - 2, -1, -1):
+            self.order_place_values[i] = self.order_place_values[i + 1] * self.order_radices[i + 1]
+
+    @staticmethod
+    def best_order(parameters: List[Parameter], gray: bool) -> list:
+        """
+        :return: the parameter numbers, ordered from the slowest to the fastest varying
+        """
+        def priority(p: int):
+            cost = parameters[p].switch_cost
+            radix = parameters[p].length()
+            if gray:
+                return cost
+            # a parameter with a single value never changes, it doesn't matter where it goes
+            return cost * radix / (radix - 1) if radix > 1 else float('inf')
+        # stable, parameters of equal cost keep the order they were added in
+        return sorted(range(len(parameters)), key=priority, reverse=True)
+
+    def index_at(self, position: int) -> int:
+        position += self.range_start
+        indices = [0] * len(self.order)
+        for p, radix, place_value in zip(self.order, self.order_radices, self.order_place_values):
+            # position // (place_value * radix) counts the completed runs of this parameter
+            runs, digit = divmod(position // place_value, radix)
+            if self.gray and runs % 2 == 1:
+                digit = radix - 1 - digit
+            indices[p] = digit
+        return self.index_of_indices(indices)
+
+    def get_next(self) -> list:
+        """
+        :return: the next combination, or None once all combinations were returned
+        """
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        values = self.get(self.index_at(self.total_returned_cnt))
+        self.total_returned_cnt += 1
+        return values
+
+    def peek_next(self) -> list:
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        return self.get(self.index_at(self.total_returned_cnt))
+
+    @staticmethod
+    def switch_counts(radices: list, place_values: list, gray: bool, start: int, stop: int) -> list:
+        """
+        :param radices: of the visiting order, slowest varying parameter first
+        :param place_values: of the visiting order
+        :return: how often every parameter changes between positions start and stop - 1
+        """
+        def wraps(place_value: int) -> int:
+            # number of steps p -> p + 1 in the range with p + 1 a multiple of place_value
+            return (stop - 1) // place_value - start // place_value if stop - start >= 2 else 0
+        counts = []
+        for radix, place_value in zip(radices, place_values):
+            if radix < 2:
+                counts.append(0)
+            elif gray:
+                # only the slowest parameter moving changes, the ones it carries over to turn around instead
+                counts.append(wraps(place_value) - wraps(place_value * radix))
+            else:
+                # the odometer resets all faster parameters along with it
+                counts.append(wraps(place_value))
+        return counts
+
+    def remaining_switch_counts(self) -> list:
+        """
+        :return: how often every parameter changes in the combinations left, in the visiting order
+        """
+        return self.switch_counts(self.order_radices, self.order_place_values, self.gray,
+                                  self.range_start + self.total_returned_cnt, self.range_stop)
+
+    def expected_cost(self) -> float:
+        """
+        :return: the total switching cost of the combinations left, pruning and invalid combinations not considered
+        """
+        counts = self.remaining_switch_counts()
+        return sum(self.parameters[p].switch_cost * count for p, count in zip(self.order, counts))
+
+    def bruteforce_cost(self) -> float:
+        """
+        :return: the switching cost of the same range with BruteforceStrategy, for comparison
+        """
+        counts = self.switch_counts(self.radices, self.place_values, False,
+                                    self.range_start + self.total_returned_cnt, self.range_stop)
+        return sum(p.switch_cost * count for p, count in zip(self.parameters, counts))
+
+    def cost_report(self) -> dict:
+        """
+        :return: a dict with the parameter names from the slowest to the fastest varying, the expected switch count per
+        parameter, the expected total cost and the cost BruteforceStrategy would have
+        """
+        counts = self.remaining_switch_counts()
+        return {
+            'order': [self.parameters[p].name for p in self.order],
+            'switches': {self.parameters[p].name: count for p, count in zip(self.order, counts)},
+            'cost': self.expected_cost(),
+            'bruteforce_cost': self.bruteforce_cost(),
+        }
+
+    def to_dict(self) -> dict:
+        json_obj = super(CostAwareStrategy, self).to_dict()
+        json_obj.update({'gray': self.gray})
+        return json_obj
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        return CostAwareStrategy(gray=json_obj.get('gray', True))
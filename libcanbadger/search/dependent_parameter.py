@@ -0,0 +1,68 @@
+from libcanbadger.search.parameter import Parameter
+
+
+class DependentParameter(Parameter):
+    """
+    a parameter whose domain depends on the value of an earlier parameter
+    e.g. the data of a request, with a length depending on the service:
+        DependentParameter('data', depends_on='service', domains={
+            0x22: BytesParameter('did', min_length=2),
+            0x2e: BytesParameter('record', min_length=3, max_length=6)})
+    the strategy sees length() as the largest domain, and skips the indices beyond the domain that is valid for a
+    combination without trying them. the domains get the context, so they can be dependent as well.
+    BruteforceStrategy skips them in one go. other strategies step over them one by one, which takes forever if
+    domains differ a lot in size (e.g. 2 and 6 bytes). scan such domains with BruteforceStrategy, or in separate
+    searches
+    """
+    dependent = True
+
+    def __init__(self, name, depends_on: str, domains: dict, default: Parameter = None):
+        """
+        :param depends_on: name of the earlier parameter
+        :param domains: maps its values to parameters
+        :param default: the domain for values missing in domains, combinations with them are invalid if None
+        """
+        super(DependentParameter, self).__init__(name)
+        self.depends_on = depends_on
+        self.domains = dict(domains)
+        self.default = default
+        candidates = list(self.domains.values()) + ([default] if default is not None else [])
+        self.max_length = max((p.length() for p in candidates), default=0)
+
+    def domain(self, context: dict) -> Parameter:
+        if context is None or self.depends_on not in context:
+            raise Exception(f"DependentParameter {self.name}: needs a value of {self.depends_on}")
+        return self.domains.get(context[self.depends_on], self.default)
+
+    def length(self) -> int:
+        return self.max_length
+
+    def valid_length(self, context: dict = None) -> int:
+        domain = self.domain(context)
+        return 0 if domain is None else domain.valid_length(context)
+
+    def get(self, index, context: dict = None):
+        domain = self.domain(context)
+        if domain is None:
+            raise IndexError(f"DependentParameter {self.name}: no domain for {self.depends_on} "
+                             f"{context[self.depends_on]}")
+        return domain.get(index, context)
+
+    def index_of(self, value, context: dict = None) -> int:
+        domain = self.domain(context)
+        if domain is None:
+            raise Exception(f"DependentParameter {self.name}: {value} is not a value of this parameter")
+        return domain.index_of(value, context)
+
+    def to_dict(self) -> dict:
+        # json keys have to be strings, so the domains are stored as pairs
+        return {'type': type(self).__name__, 'name': self.name, 'switch_cost': self.switch_cost,
+                'depends_on': self.depends_on, 'domains': [[key, p.to_dict()] for key, p in self.domains.items()],
+                'default': None if self.default is None else self.default.to_dict()}
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        default = json_obj.get('default')
+        return DependentParameter(json_obj['name'], json_obj['depends_on'],
+                                  {key: Parameter.from_dict(p) for key, p in json_obj['domains']},
+                                  default=None if default is None else Parameter.from_dict(default))
@@ -12,3 +12,13 @@ class IntegerChoiceParameter(Parameter):
     def get(self, index, context: dict = None):
         return self.values[index]
 
+    def get_batch(self, indices, contexts: list = None):
+        import numpy
+        # fancy indexing
+        return numpy.asarray(self.values)[indices]
+
+    def index_of(self, value, context: dict = None) -> int:
+        if value not in self.values:
+            raise Exception(f"IntegerChoiceParameter {self.name}: {value} is not a value of this parameter")
+        return self.values.index(value)
+
@@ -13,8 +13,18 @@ class IntegerRangeParameter(Parameter):
         self.step = step
 
     def length(self) -> int:
-        return int((self.stop - self.start) / self.step)
+        # integer arithmetic, floats lose precision for large ranges
+        return max((self.stop - self.start) // self.step, 0)
 
     def get(self, index, context: dict = None):
         return self.start + (index * self.step)
 
+    def get_batch(self, indices, contexts: list = None):
+        return self.start + indices * self.step
+
+    def index_of(self, value, context: dict = None) -> int:
+        index, remainder = divmod(value - self.start, self.step)
+        if remainder != 0 or index < 0 or index >= self.length():
+            raise Exception(f"IntegerRangeParameter {self.name}: {value} is not a value of this parameter")
+        return index
+
@@ -1,14 +1,54 @@
 
 
+# maps class names to parameter classes, so serialized parameters can be recreated
+parameter_types = {}
+
+
 class Parameter(object):
     """
     defines the interface for parameter subclasses
     parameters define ranges (search spaces) of values, only
     searching through the spaces is implemented using Search classes
     """
+    # True for parameters whose domain depends on the values of earlier parameters, see valid_length()
+    dependent = False
+    # the cost (e.g. in s) of changing the value of this parameter, for CostAwareStrategy. set it on the instance
+    switch_cost = 0.0
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        parameter_types[cls.__name__] = cls
+
     def __init__(self, name):
         self.name = name
 
+    def to_dict(self) -> dict:
+        """
+        serializes the parameter definition
+        this implementation stores all attributes, which works for subclasses whose constructor arguments are named
+        like their attributes and are json serializable. others have to override to_dict() and from_dict()
+        :return: a json serializable dict
+        """
+        json_obj = {'type': type(self).__name__}
+        json_obj.update(vars(self))
+        return json_obj
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        """
+        recreates a parameter serialized with to_dict()
+        the parameter's class has to be imported already
+        """
+        cls = parameter_types.get(json_obj.get('type'))
+        if cls is None:
+            raise Exception(f"Parameter: unknown parameter type {json_obj.get('type')}")
+        if cls.from_dict is not Parameter.from_dict:
+            parameter = cls.from_dict(json_obj)
+        else:
+            parameter = cls(**{k: v for k, v in json_obj.items() if k not in ('type', 'switch_cost')})
+        if 'switch_cost' in json_obj:
+            parameter.switch_cost = json_obj['switch_cost']
+        return parameter
+
     def length(self) -> int:
         """
         determines how many values are in the parameter space
@@ -16,6 +56,14 @@ class Parameter(object):
         """
         pass
 
+    def valid_length(self, context: dict = None) -> int:
+        """
+        for dependent parameters: the number of valid indices given the values of earlier parameters. length() is
+        the largest valid_length() then, and combinations with an index beyond the valid length are skipped
+        :param context: the values of the earlier parameters
+        """
+        return self.length()
+
     def get(self, index, context: dict = None):
         """
         retrieves a value, given its index
@@ -26,4 +74,32 @@ class Parameter(object):
         :param context: optional context dictionary for latent parameters
         :return: a value
         """
-        pass
\ No newline at end of file
+        pass
+
+    def get_batch(self, indices, contexts: list = None):
+        """
+        retrieves the values for a numpy array of indices, for Search.next_batch()
+        this implementation calls get() for every index, subclasses override it with vectorized numpy code
+        :param indices: a numpy integer array of indices
+        :param contexts: one context dictionary per index, only passed to parameters not overriding get_batch()
+        :return: a numpy array of values, with the same shape as indices
+        """
+        import numpy
+        values = numpy.empty(len(indices), dtype=object)
+        for i, index in enumerate(indices):
+            values[i] = self.get(int(index), contexts[i] if contexts is not None else None)
+        return values
+
+    def index_of(self, value, context: dict = None) -> int:
+        """
+        the inverse of get(), this implementation simply tries all indices
+        subclasses should override it with something faster
+
+        :param value: a value of this parameter
+        :param context: optional context dictionary for latent parameters
+        :return: the index of that value
+        """
+        for index in range(self.length()):
+            if self.get(index, context) == value:
+                return index
+        raise Exception(f"Parameter {self.name}: {value} is not a value of this parameter")
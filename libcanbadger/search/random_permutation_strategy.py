@@ -0,0 +1,87 @@
+import hashlib
+from typing import List
+
+from libcanbadger.search.strategy import Strategy
+from libcanbadger.search.parameter import Parameter
+
+
+class RandomPermutationStrategy(Strategy):
+    """
+    visits every combination exactly once, in a pseudo-random order given by a seed
+
+    the order is a keyed Feistel network over the smallest even number of bits that covers all combination indices.
+    outputs beyond the last combination are fed through the network again (cycle walking) until they fall into the
+    search space, which keeps it a permutation. nothing is stored per combination, so this works for huge spaces
+    """
+    def __init__(self, seed: int = 0, rounds: int = 4):
+        """
+        :param seed: the same seed gives the same order
+        :param rounds: Feistel rounds, 4 are enough to make neighbouring positions look unrelated
+        """
+        super(RandomPermutationStrategy, self).__init__()
+        self.seed = seed
+        self.rounds = rounds
+        self.half_bits = 1
+        self.half_mask = 1
+        self.keys = []
+
+    def update(self, parameters: List[Parameter]):
+        super(RandomPermutationStrategy, self).update(parameters)
+        bits = max((self.combination_count - 1).bit_length(), 2)
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        # one key per round, derived from the seed and the size of the space
+        self.keys = [hashlib.blake2b(f"{self.seed}:{self.combination_count}:{r}".encode(), digest_size=16).digest()
+                     for r in range(self.rounds)]
+
+    def round_function(self, round_index: int, value: int) -> int:
+        digest = hashlib.blake2b(value.to_bytes((self.half_bits + 7) // 8, byteorder='little'),
+                                 digest_size=min((self.half_bits + 7) // 8, 64), key=self.keys[round_index]).digest()
+        return int.from_bytes(digest, byteorder='little') & self.half_mask
+
+    def feistel(self, value: int) -> int:
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for r in range(self.rounds):
+            left, right = right, left ^ self.round_function(r, right)
+        return (left << self.half_bits) | right
+
+    def permute(self, position: int) -> int:
+        """
+        :param position: in [0, combination_count)
+        :return: the combination index visited at that position of the full order
+        """
+        index = self.feistel(position)
+        # cycle walking: at most a few rounds, as the network's domain is less than 4 times the search space
+        while index >= self.combination_count:
+            index = self.feistel(index)
+        return index
+
+    def index_at(self, position: int) -> int:
+        return self.permute(self.range_start + position)
+
+    def get_next(self) -> list:
+        """
+        :return: the next combination, or None once all combinations were returned
+        """
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        values = self.get(self.index_at(self.total_returned_cnt))
+        self.total_returned_cnt += 1
+        return values
+
+    def peek_next(self) -> list:
+        self.skip_invalid()
+        if self.total_returned_cnt >= self.length():
+            return None
+        return self.get(self.index_at(self.total_returned_cnt))
+
+    def to_dict(self) -> dict:
+        json_obj = super(RandomPermutationStrategy, self).to_dict()
+        json_obj.update({'seed': self.seed, 'rounds': self.rounds})
+        return json_obj
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        return RandomPermutationStrategy(seed=json_obj.get('seed', 0), rounds=json_obj.get('rounds', 4))
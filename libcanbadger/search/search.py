@@ -1,3 +1,9 @@
+import copy
+import json
+import os
+import time
+
+from libcanbadger.search.parameter import Parameter
 from libcanbadger.search.strategy import Strategy
 
 class Search(object):
@@ -6,7 +12,23 @@ class Search(object):
             raise RuntimeError('Please provide a strategy when instantiating Search!')
         self.strategy = strategy
         self.parameters = []
+        # automatic checkpoints, see enable_checkpoints()
+        self.checkpoint_filename = None
+        self.checkpoint_steps = None
+        self.checkpoint_seconds = None
+        self.last_checkpoint_position = 0
+        self.last_checkpoint_time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.checkpoint_filename is not None:
+            # after an error, the last combination was not completed and has to be repeated
+            self.checkpoint(in_flight=exc_type is not None)
 
+    def __len__(self):
+        return len(self.strategy)
 
     def add_param(self, param: object):
         """
@@ -31,6 +53,7 @@ class Search(object):
         :return: no return value
         """
         self.parameters = []
+        self.strategy.reset_all()
 
     def length(self) -> int:
         """
@@ -48,7 +71,7 @@ class Search(object):
         checks if the search is done or not
         :return: True if search has exhausted all parameters/stragies. False, if not done yet.
         """
-        pass
+        return self.strategy.has_completed()
 
     def peek_next(self) -> list:
         """
@@ -61,6 +84,8 @@ class Search(object):
         increment the search by one step.
         :return: no return value
         """
+        if not self.strategy.has_completed():
+            self.strategy.seek(self.strategy.progress() + 1)
 
     def next(self) -> list:
         """
@@ -69,21 +94,188 @@ class Search(object):
         if you don't like this, use peek_next() and increment() in combination
         :return: a tuple, containing all parameter choices
         """
+        self.checkpoint_if_due()
         return self.strategy.get_next()
 
+    def next_batch(self, n: int, as_columns: bool = False):
+        """
+        the vectorized next(), for preparing large numbers of combinations offline. needs numpy
+        IntegerRangeParameter and IntegerChoiceParameter values are computed with numpy, other parameters are asked
+        for every value (see Parameter.get_batch())
+        :param n: number of combinations, fewer are returned at the end of the search
+        :param as_columns: return one array per parameter instead of a single array
+        :return: a numpy array of shape (n, number of parameters), or a list of numpy arrays of length n
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("Search.next_batch() needs numpy, install it with 'pip install numpy'")
+        self.checkpoint_if_due()
+        indices = self.strategy.next_index_batch(n)
+        columns = self.strategy.values_batch(indices)
+        if as_columns:
+            return columns
+        if not columns:
+            return numpy.empty((len(indices), 0))
+        return numpy.column_stack(columns)
+
+    def checkpoint_if_due(self) -> None:
+        if self.checkpoint_filename is None:
+            return
+        # everything returned so far was completed, so this is the moment to checkpoint
+        position = self.strategy.progress()
+        if (self.checkpoint_steps is not None
+                and position - self.last_checkpoint_position >= self.checkpoint_steps) \
+                or (self.checkpoint_seconds is not None
+                    and time.monotonic() - self.last_checkpoint_time >= self.checkpoint_seconds):
+            self.checkpoint()
+
+    def add_pruning_rule(self, depth: int, predicate: callable) -> None:
+        """
+        skip the rest of the combinations sharing the first depth values with a combination, once
+        predicate(values, outcome) is True for it. outcomes come in through report()
+        the parameters have to be added first, an exception is raised if depth exceeds their number.
+        rules can't be serialized, pass them to unserialize() or load_checkpoint() when resuming.
+        see Strategy.add_pruning_rule()
+        """
+        self.strategy.add_pruning_rule(depth, predicate)
+
+    def skipped(self) -> int:
+        """
+        :return: number of combinations skipped by pruning rules, they count as done in progress()
+        """
+        return self.strategy.skipped_cnt
+
+    def report(self, values: list, outcome, hit: bool = None) -> None:
+        """
+        pass the outcome of a combination on to the strategy, see Strategy.report()
+        :param values: a combination returned by next()
+        :param outcome: e.g. the response to the request built from it
+        :param hit: True for a hit, False for a dead end, None if the outcome says neither
+        """
+        self.strategy.report(values, outcome, hit)
+
+    def get(self, index: int) -> list:
+        """
+        random access to the combination space, independent of the progress
+        :param index: combination index, in [0, length()). index 0 is the first combination a BruteforceStrategy returns
+        :return: the value combination with that index
+        """
+        return self.strategy.get(index)
+
+    def index_of(self, values: list) -> int:
+        """
+        :param values: a value combination, one value per parameter
+        :return: its combination index, the inverse of get()
+        """
+        return self.strategy.index_of(values)
+
+    def seek(self, position: int) -> None:
+        """
+        jump to a position in the search, as if position combinations had been returned already
+        :param position: in [0, length()]
+        :return: no return value
+        """
+        self.strategy.seek(position)
+
+    def shard(self, shard_index: int, shard_count: int) -> 'Search':
+        """
+        split the search into shard_count disjoint slices of (almost) equal size, covering all combinations together
+        the shard is an independent copy of this search with its own progress, e.g. for another process or device
+        :param shard_index: which slice, in [0, shard_count)
+        :param shard_count: number of slices
+        :return: a new Search covering only that slice
+        """
+        if shard_count < 1 or shard_index < 0 or shard_index >= shard_count:
+            raise Exception(f"Search: invalid shard {shard_index} of {shard_count}")
+        strategy = copy.deepcopy(self.strategy)
+        start = strategy.range_start
+        length = strategy.range_stop - start
+        strategy.set_range(start + length * shard_index // shard_count,
+                           start + length * (shard_index + 1) // shard_count)
+        search = Search(strategy=strategy)
+        search.parameters = strategy.parameters
+        return search
 
-    def serialize(self) -> str:
+    def serialize(self, in_flight: bool = False) -> str:
         """
         serializes the search to json, including current state of all parameters
+        :param in_flight: the last combination returned wasn't completed, store the position before it
         :return: a json string
         """
-        pass
+        strategy = self.strategy.to_dict()
+        if in_flight and strategy['position'] > 0:
+            strategy['position'] -= 1
+        return json.dumps({'parameters': [p.to_dict() for p in self.parameters], 'strategy': strategy},
+                          separators=(',', ':'))
 
-    def unserialize(self, json_string: str) -> None:
+    def unserialize(self, json_string: str, pruning_rules: list = None) -> None:
         """
         reads a serialized Search from json_string
         this implicitly calls reset_all() and overwrites all attributes with the serialized attributes
+        pruning rules can't be serialized. without pruning_rules, the ones added to this search are kept. a warning is
+        printed if the serialized search had more rules than that
         :param json_string: json-serialized search
+        :param pruning_rules: (depth, predicate) tuples to use from now on, see add_pruning_rule()
         :return: nothing
         """
-        pass
\ No newline at end of file
+        json_obj = json.loads(json_string)
+        if pruning_rules is None:
+            pruning_rules = self.strategy.pruning_rules
+        self.reset_all()
+        self.parameters = [Parameter.from_dict(p) for p in json_obj['parameters']]
+        self.strategy = Strategy.from_dict(json_obj['strategy'])
+        self.strategy.update(self.parameters)
+        self.strategy.load_state(json_obj['strategy'])
+        for depth, predicate in pruning_rules:
+            self.strategy.add_pruning_rule(depth, predicate)
+        saved_rules = json_obj['strategy'].get('pruning_rules', 0)
+        if saved_rules > len(pruning_rules):
+            print(f"Warning: the serialized search had {saved_rules} pruning rules, {len(pruning_rules)} are in use "
+                  f"now. Pass them to unserialize() or load_checkpoint() to keep pruning.")
+
+    def enable_checkpoints(self, filename: str, every_steps: int = 100, every_seconds: float = None) -> None:
+        """
+        write a checkpoint from next() every every_steps combinations or every_seconds seconds, whichever comes first
+        checkpoints only cover combinations that were completed, i.e. the ones before the one next() is called for.
+        use the search as a context manager to checkpoint when leaving, too
+        :param filename: the checkpoint file, it is replaced atomically
+        :param every_steps: max number of combinations between two checkpoints, None to disable
+        :param every_seconds: max time between two checkpoints, None to disable
+        :return: no return value
+        """
+        self.checkpoint_filename = filename
+        self.checkpoint_steps = every_steps
+        self.checkpoint_seconds = every_seconds
+        self.last_checkpoint_position = self.strategy.progress()
+        self.last_checkpoint_time = time.monotonic()
+
+    def checkpoint(self, in_flight: bool = False) -> None:
+        """
+        write a checkpoint now
+        :param in_flight: the last combination returned wasn't completed and should be repeated after a restart
+        :return: no return value
+        """
+        # write to a temporary file first, so a crash never leaves a broken checkpoint behind
+        with open(self.checkpoint_filename + '.tmp', 'w') as f:
+            f.write(self.serialize(in_flight=in_flight))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.checkpoint_filename + '.tmp', self.checkpoint_filename)
+        self.last_checkpoint_position = self.strategy.progress()
+        self.last_checkpoint_time = time.monotonic()
+
+    def load_checkpoint(self, filename: str, pruning_rules: list = None) -> bool:
+        """
+        continue from a checkpoint, if there is one
+        :param filename: the checkpoint file
+        :param pruning_rules: see unserialize()
+        :return: True if a checkpoint was loaded
+        """
+        try:
+            with open(filename, 'r') as f:
+                json_string = f.read()
+        except OSError:
+            return False
+        self.unserialize(json_string, pruning_rules)
+        return True
@@ -0,0 +1,143 @@
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from libcanbadger.search.search import Search
+
+
+def run_shard(search: Search, shard_index: int, worker_factory: callable, result_queue,
+              report_interval: int) -> int:
+    """
+    work through a single shard, reporting hits and progress to result_queue
+    this runs in a worker thread or process
+    :return: the number of combinations tried
+    """
+    done = 0
+    try:
+        worker = worker_factory(shard_index)
+        while not search.has_completed():
+            values = search.next()
+            result = worker(values)
+            done += 1
+            if result is not None:
+                result_queue.put(('hit', shard_index, values, result))
+            if done % report_interval == 0:
+                result_queue.put(('progress', shard_index, done))
+    finally:
+        # always sent, even if the worker failed, so the executor doesn't wait forever
+        result_queue.put(('done', shard_index, done))
+    return done
+
+
+class SearchExecutor(object):
+    """
+    runs a search in parallel, split into disjoint shards
+
+    every shard gets its own worker, created by worker_factory(shard_index) inside the thread or process running the
+    shard. a worker is called with every combination of its shard and returns a result for hits, None otherwise.
+    hits of all shards are merged into one stream, and progress is reported over all shards.
+    use threads to drive several CANBadgers at once (the worker factory opens a session on device shard_index),
+    and processes for CPU bound workers. with processes, worker_factory and the results have to be picklable
+    """
+    def __init__(self, search: Search, worker_factory: callable, shard_count: int, use_processes: bool = False,
+                 report_interval: int = 256):
+        """
+        :param search: the search to run, it is not modified
+        :param worker_factory: called with the shard index, returns the worker callable for that shard
+        :param shard_count: number of shards, and of parallel workers
+        :param use_processes: run the shards in a process pool instead of threads
+        :param report_interval: every shard reports its progress after this many combinations
+        """
+        self.search = search
+        self.worker_factory = worker_factory
+        self.shard_count = shard_count
+        self.use_processes = use_processes
+        self.report_interval = report_interval
+        # combinations done per shard
+        self.shard_progress = [0] * shard_count
+        self.total = search.length() - search.strategy.progress()
+        # (values, result) tuples of all hits, in the order they arrived
+        self.hits = []
+        self.elapsed = 0.0
+
+    def done(self) -> int:
+        return sum(self.shard_progress)
+
+    def progress(self) -> float:
+        """
+        :return: the overall progress, in [0, 1]
+        """
+        if self.total == 0:
+            return 1.0
+        return self.done() / self.total
+
+    def shards(self) -> list:
+        """
+        :return: one Search per shard, splitting up what is left of the search
+        """
+        strategy = self.search.strategy
+        start = strategy.range_start + strategy.progress()
+        length = strategy.range_stop - start
+        shards = []
+        for i in range(self.shard_count):
+            shard = self.search.shard(i, self.shard_count)
+            shard.strategy.set_range(start + length * i // self.shard_count,
+                                     start + length * (i + 1) // self.shard_count)
+            shards.append(shard)
+        return shards
+
+    def run(self, result_callback: callable = None, progress_callback: callable = None) -> list:
+        """
+        run all shards and wait for them to finish
+        :param result_callback: called in the calling thread with (values, result) for every hit
+        :param progress_callback: called in the calling thread with (combinations done, total) on progress
+        :return: all hits, as (values, result) tuples
+        """
+        start_time = time.monotonic()
+        self.shard_progress = [0] * self.shard_count
+        self.total = self.search.length() - self.search.strategy.progress()
+        self.hits = []
+        shards = self.shards()
+        if self.use_processes:
+            manager = multiprocessing.Manager()
+            result_queue = manager.Queue()
+            pool = ProcessPoolExecutor(max_workers=self.shard_count)
+        else:
+            manager = None
+            result_queue = queue.Queue()
+            pool = ThreadPoolExecutor(max_workers=self.shard_count)
+
+        try:
+            futures = [pool.submit(run_shard, shard, i, self.worker_factory, result_queue, self.report_interval)
+                       for i, shard in enumerate(shards)]
+            running = len(futures)
+            while running:
+                try:
+                    message = result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    # a shard that failed before it even started doesn't report back
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+                kind, shard_index = message[0], message[1]
+                if kind == 'hit':
+                    self.hits.append((message[2], message[3]))
+                    if result_callback is not None:
+                        result_callback(message[2], message[3])
+                    continue
+                self.shard_progress[shard_index] = message[2]
+                if kind == 'done':
+                    running -= 1
+                if progress_callback is not None:
+                    progress_callback(self.done(), self.total)
+            # raise worker exceptions here
+            for future in futures:
+                future.result()
+        finally:
+            pool.shutdown(wait=True)
+            if manager is not None:
+                manager.shutdown()
+            self.elapsed = time.monotonic() - start_time
+        return self.hits
@@ -2,31 +2,227 @@ from typing import List
 
 from libcanbadger.search.parameter import Parameter
 
+# maps class names to strategy classes, so serialized strategies can be recreated
+strategy_types = {}
+
 
 class Strategy(object):
+    """
+    base class for search strategies
+
+    every combination of parameter values has an index in [0, combination_count). the index is a mixed-radix number, with one
+    digit per parameter and the radix of a digit being the length of its parameter. the last parameter is the least
+    significant digit. strategies decide in which order the indices are visited, they don't need to store the
+    combinations themselves
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        strategy_types[cls.__name__] = cls
+
     def __init__(self):
         # initialize internal state here
         self.total_returned_cnt = 0
+        self.parameters = []
+        # parameter lengths, and the place value of every digit (the product of all radices right of it)
+        self.radices = []
+        self.place_values = []
+        self.combination_count = 0
+        # True if a parameter is dependent, some combinations are invalid then and get skipped
+        self.sparse = False
+        # the slice of the visiting order this strategy covers, see set_range()
+        self.range_start = 0
+        self.range_stop = 0
+        # (depth, predicate) tuples, see add_pruning_rule()
+        self.pruning_rules = []
+        # value prefixes whose remaining combinations are skipped
+        self.pruned_prefixes = set()
+        self.skipped_cnt = 0
+
+    def __len__(self):
+        return self.length()
 
     def reset(self):
         """
         forget our progress and all other state
         :return: nothing
         """
-        pass
+        self.total_returned_cnt = 0
+        self.pruned_prefixes = set()
+        self.skipped_cnt = 0
 
     def reset_all(self):
         """
         forget all parameters and state
         :return: nothing
         """
-        pass
+        self.update([])
 
     def update(self, parameters: List[Parameter]):
         """
         :param parameters: an array of all parameters
         """
-        pass
+        self.parameters = list(parameters)
+        self.radices = [p.length() for p in self.parameters]
+        self.place_values = [1] * len(self.radices)
+        for i in range(len(self.radices) - 2, -1, -1):
+            self.place_values[i] = self.place_values[i + 1] * self.radices[i + 1]
+        self.combination_count = self.place_values[0] * self.radices[0] if self.parameters else 0
+        self.sparse = any(p.dependent for p in self.parameters)
+        self.range_start = 0
+        self.range_stop = self.combination_count
+        self.reset()
+
+    def set_range(self, start: int, stop: int) -> None:
+        """
+        only cover positions [start, stop) of the visiting order. positions, progress and length are relative to start
+        afterwards. combination indices (get(), index_of()) are not affected
+        """
+        if start < 0 or stop > self.combination_count or start > stop:
+            raise IndexError(f"Strategy: range [{start}, {stop}) out of range")
+        self.range_start = start
+        self.range_stop = stop
+        self.reset()
+
+    def index_at(self, position: int) -> int:
+        """
+        :return: the combination index visited at a position of the visiting order
+        """
+        return self.range_start + position
+
+    def indices_of(self, index: int) -> list:
+        """
+        :return: the parameter indices (digits) of a combination index
+        """
+        if index < 0 or index >= self.combination_count:
+            raise IndexError(f"Strategy: combination index {index} out of range")
+        indices = []
+        for radix in reversed(self.radices):
+            index, digit = divmod(index, radix)
+            indices.append(digit)
+        indices.reverse()
+        return indices
+
+    def index_of_indices(self, indices: list) -> int:
+        """
+        :return: the combination index of a list of parameter indices
+        """
+        return sum(i * place_value for i, place_value in zip(indices, self.place_values))
+
+    def resolve(self, indices: list) -> tuple:
+        """
+        :return: (values, None) for a valid list of parameter indices. if the index of a dependent parameter is
+        beyond its valid length, (the values before it, its position)
+        """
+        context = {}
+        values = []
+        for k, (p, i) in enumerate(zip(self.parameters, indices)):
+            if p.dependent and i >= p.valid_length(context):
+                return values, k
+            value = p.get(i, context)
+            context[p.name] = value
+            values.append(value)
+        return values, None
+
+    def values_of(self, indices: list) -> list:
+        """
+        :return: the parameter values for a list of parameter indices, None if the combination is invalid.
+        every parameter gets the values of the parameters before it as context
+        """
+        values, invalid = self.resolve(indices)
+        return values if invalid is None else None
+
+    def get(self, index: int) -> list:
+        """
+        :param index: combination index, in [0, combination_count)
+        :return: the combination of parameter values with that index, None if it is invalid (see Parameter.dependent)
+        """
+        return self.values_of(self.indices_of(index))
+
+    def index_of(self, values: list) -> int:
+        """
+        the inverse of get()
+        :param values: one value per parameter
+        :return: the index of that combination
+        """
+        if len(values) != len(self.parameters):
+            raise Exception("Strategy: expected one value per parameter")
+        context = {}
+        indices = []
+        for p, value in zip(self.parameters, values):
+            indices.append(p.index_of(value, context))
+            context[p.name] = value
+        return self.index_of_indices(indices)
+
+    def index_dtype(self):
+        """
+        :return: the numpy dtype for arrays of combination indices, python ints if they don't fit into int64
+        """
+        import numpy
+        return numpy.int64 if self.combination_count < 2 ** 63 else object
+
+    def next_index_batch(self, n: int):
+        """
+        advance by up to n combinations, for Search.next_batch()
+        :return: a numpy array with their combination indices, shorter than n at the end of the search
+        """
+        import numpy
+        indices = []
+        if self.pruned_prefixes or self.sparse:
+            # pruned and invalid combinations are only known to get_next()
+            while len(indices) < n:
+                values = self.get_next()
+                if values is None:
+                    break
+                indices.append(self.index_of(values))
+            return numpy.array(indices, dtype=self.index_dtype())
+        position = self.total_returned_cnt
+        count = max(min(n, self.length() - position), 0)
+        indices = numpy.array([self.index_at(p) for p in range(position, position + count)], dtype=self.index_dtype())
+        self.seek(position + count)
+        return indices
+
+    def values_batch(self, indices) -> list:
+        """
+        the vectorized get(), see Parameter.get_batch()
+        :param indices: a numpy array of combination indices
+        :return: one numpy array of values per parameter
+        """
+        import numpy
+        columns = []
+        # only built if a parameter needs them
+        contexts = None
+        for p, radix, place_value in zip(self.parameters, self.radices, self.place_values):
+            digits = (indices // place_value) % radix
+            if digits.dtype == object:
+                digits = digits.astype(numpy.int64)
+            if type(p).get_batch is Parameter.get_batch:
+                if contexts is None:
+                    contexts = [{} for _ in range(len(indices))]
+                    for previous, column in zip(self.parameters, columns):
+                        for context, value in zip(contexts, column.tolist()):
+                            context[previous.name] = value
+                column = p.get_batch(digits, contexts)
+            else:
+                column = p.get_batch(digits)
+            if contexts is not None:
+                for context, value in zip(contexts, column.tolist()):
+                    context[p.name] = value
+            columns.append(column)
+        return columns
+
+    def seek(self, position: int) -> None:
+        """
+        continue the search at a position, as if position combinations had been returned already
+        :param position: in [0, length()]
+        """
+        if position < 0 or position > self.length():
+            raise IndexError(f"Strategy: position {position} out of range")
+        self.total_returned_cnt = position
+
+    def has_completed(self) -> bool:
+        # a pruned or invalid tail doesn't count as left to do, get_next() would return None for it
+        self.skip_invalid()
+        return self.total_returned_cnt >= self.length()
 
     def get_next(self) -> list:
         """
@@ -39,14 +235,125 @@ class Strategy(object):
         :return: the next choice of parameters, without incrementing the progress
         """
 
+    def add_pruning_rule(self, depth: int, predicate: callable) -> None:
+        """
+        skip the rest of a subtree when predicate(values, outcome) returns True for a reported combination.
+        the subtree are all combinations sharing the first depth values, e.g. with depth 1 and a service parameter
+        first, a SERVICE_NOT_SUPPORTED response skips all other combinations with the same service
+        :param depth: number of leading parameters that make up the subtree, in [1, number of parameters]
+        :param predicate: called with the combination and the outcome passed to report()
+        """
+        if depth < 1 or depth > len(self.parameters):
+            raise Exception(f"Strategy: pruning depth {depth} out of range")
+        self.pruning_rules.append((depth, predicate))
+
+    def prefix_indices(self, prefix: list) -> list:
+        """
+        :return: the parameter indices of the values in prefix
+        """
+        context = {}
+        indices = []
+        for p, value in zip(self.parameters, prefix):
+            indices.append(p.index_of(value, context))
+            context[p.name] = value
+        return indices
+
+    def prefix_range(self, prefix: list) -> tuple:
+        """
+        :return: the combination indices [start, stop) of all combinations starting with prefix
+        """
+        start = self.index_of_indices(self.prefix_indices(prefix))
+        return start, start + self.place_values[len(prefix) - 1]
+
+    def is_pruned(self, values: list) -> bool:
+        """
+        :return: True if the combination is in a pruned subtree
+        """
+        return any(tuple(values[:depth]) in self.pruned_prefixes for depth in range(1, len(values) + 1))
+
+    def should_skip(self, values: list) -> bool:
+        """
+        :return: True for invalid (None) combinations and for pruned ones
+        """
+        return values is None or (bool(self.pruned_prefixes) and self.is_pruned(values))
+
+    def skip_invalid(self) -> None:
+        """
+        skip pruned and invalid combinations at the current position, they count as returned
+        this implementation follows index_at(), strategies with their own order override it. it looks at one
+        combination at a time: in orders that don't keep subtrees together, a domain of a DependentParameter much
+        smaller than the largest one means stepping over all the invalid combinations in between. BruteforceStrategy
+        skips whole invalid runs instead
+        """
+        while (self.pruned_prefixes or self.sparse) and self.total_returned_cnt < self.length() \
+                and self.should_skip(self.get(self.index_at(self.total_returned_cnt))):
+            self.total_returned_cnt += 1
+            self.skipped_cnt += 1
+
+    def prune(self, prefix: list) -> None:
+        """
+        skip the remaining combinations starting with prefix. by default they are skipped when get_next() comes
+        across them, strategies that visit subtrees in one piece skip them right away
+        """
+        self.pruned_prefixes.add(tuple(prefix))
+
+    def report(self, values: list, outcome, hit: bool = None) -> None:
+        """
+        feedback about a combination returned before, e.g. the response it got. applies the pruning rules,
+        strategies that adapt their order to the results extend this
+        :param values: the combination
+        :param outcome: the result, passed to the pruning rules
+        :param hit: True for a hit, False for a dead end, None if the result says neither. strategies that adapt their
+        order use this, so they don't have to understand the outcome
+        """
+        for depth, predicate in self.pruning_rules:
+            if tuple(values[:depth]) not in self.pruned_prefixes and predicate(values, outcome):
+                self.prune(values[:depth])
+
     def length(self) -> int:
         """
         :return: total number of entries/parameter combinations performed by this search
         """
-        pass
+        return self.range_stop - self.range_start
+
+    def to_dict(self) -> dict:
+        """
+        serializes the strategy's configuration and position, but not the parameters
+        subclasses with constructor arguments or more state extend it, and override from_dict() and load_state()
+        :return: a json serializable dict
+        """
+        return {'type': type(self).__name__, 'range': [self.range_start, self.range_stop],
+                'position': self.total_returned_cnt, 'skipped': self.skipped_cnt,
+                'pruned': [self.prefix_indices(prefix) for prefix in self.pruned_prefixes],
+                'pruning_rules': len(self.pruning_rules)}
+
+    @staticmethod
+    def from_dict(json_obj: dict) -> object:
+        """
+        creates a strategy from its to_dict() output. call update() and load_state() afterwards
+        """
+        cls = strategy_types.get(json_obj.get('type'))
+        if cls is None:
+            raise Exception(f"Strategy: unknown strategy type {json_obj.get('type')}")
+        if cls.from_dict is not Strategy.from_dict:
+            return cls.from_dict(json_obj)
+        return cls()
+
+    def load_state(self, json_obj: dict) -> None:
+        """
+        restores range and position from to_dict() output, after update() was called with the same parameters
+        """
+        self.set_range(*json_obj['range'])
+        self.seek(json_obj['position'])
+        self.load_pruning_state(json_obj)
+
+    def load_pruning_state(self, json_obj: dict) -> None:
+        # prefixes are stored as parameter indices, values (e.g. bytes) aren't necessarily json serializable
+        self.pruned_prefixes = set(tuple(self.resolve(indices)[0]) for indices in json_obj.get('pruned', []))
+        self.skipped_cnt = json_obj.get('skipped', 0)
 
     def progress(self) -> int:
         """
-        :return: the raw count of items we've returned already.
+        :return: the raw count of items we've returned or skipped already.
         """
-        return self.total_returned_cnt
\ No newline at end of file
+        return self.total_returned_cnt
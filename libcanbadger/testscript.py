@@ -4,12 +4,12 @@ from libcanbadger.uds.session import Session, SessionStatus
 from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
 from libcanbadger.search.search import Search
 from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.uds.search_runner import SearchRunner, read_data_by_id_builder
 from libcanbadger.iso_tp.iso_tp_handler import IsoTpHandler, IsoTpMessage
 from libcanbadger.canbadger_connection_process import discover_canbadgers
 from libcanbadger.util.can_settings import CANBadgerSettings, CanbadgerStatusBits
 from libcanbadger.interface import LoggedInterface
 import sys
-import time
 
 
 def main():
@@ -48,20 +48,13 @@ def main():
             if session.status != SessionStatus.Failed:
                 search = Search(strategy=BruteforceStrategy())
                 search.add_param(IntegerRangeParameter('data_id', start=0x0ff0, stop=0x0fff, step=1))
-                scnt = 0
-                nscnt = 0
-                ttcnt = 0
-                while search.progress() < 1.0:
-                    time.sleep(0.001)
-                    id_to_check = search.next()[0]
-                    success, data = session.request_data_by_id(id_to_check)
-                    if success:
-                        scnt += 1
-                        print(f"For ID {id_to_check} we got the response {data}")
-                    else:
-                        nscnt += 1
-                    ttcnt += 1
-                print(f"Out of {ttcnt} checked ids total, we got {scnt} hits and {nscnt} misses")
+                # paced by what the ECU tolerates, see SearchRunner
+                runner = SearchRunner(session, search, request_builder=read_data_by_id_builder,
+                                      progress_callback=lambda status: print(f"{status['progress']:.0%}, "
+                                                                             f"ETA {status['eta']}s"))
+                for values, response in runner.run():
+                    print(f"For ID {values[0]} we got the response {response[1:]}")
+                print(f"Out of {runner.request_count} requests total, we got {len(runner.hits)} hits")
         li.stop_log(log)
         print("Logged data:")
         log.pretty_print()
@@ -0,0 +1,224 @@
+import time
+
+from libcanbadger.frame import Frame
+from libcanbadger.iso_tp.iso_tp_message import IsoTpFrameFlags, IsoTpBitmasks
+from libcanbadger.uds.uds_constants import ResponseCodes, Masks
+
+FUNCTIONAL_ID = 0x7DF
+FUNCTIONAL_ID_EXTENDED = 0x18DB33F1
+# 29 bit normal fixed addressing: 0x18DA<target address><source address>
+PHYSICAL_ID_EXTENDED = 0x18DA0000
+
+
+def candidate_ids(use_extended_ids: bool = False, source_address: int = 0xF1) -> list:
+    """
+    :return: all physical request ids worth probing. 11 bit: every id except the functional one,
+    29 bit: every target address, sent from source_address
+    """
+    if use_extended_ids:
+        return [PHYSICAL_ID_EXTENDED | (target << 8) | source_address for target in range(0x100)
+                if target != source_address]
+    return [arb_id for arb_id in range(0x800) if arb_id != FUNCTIONAL_ID]
+
+
+def conventional_request_id(response_id: int) -> int:
+    """
+    :return: the request id that belongs to a response id by convention (+8 for 11 bit, swapped target and source
+    address for 29 bit normal fixed addressing), or None
+    """
+    if response_id > 0x7FF:
+        if response_id & 0xFFFF0000 != PHYSICAL_ID_EXTENDED:
+            return None
+        return PHYSICAL_ID_EXTENDED | ((response_id & 0xFF) << 8) | ((response_id >> 8) & 0xFF)
+    if response_id < 8:
+        return None
+    return response_id - 8
+
+
+class DiscoveredEcu(object):
+    """
+    an ECU found by EcuDiscovery
+    """
+    def __init__(self, response_id: int, response: bytes):
+        # None if the ECU answered, but we couldn't find out to which request id
+        self.request_id = None
+        self.response_id = response_id
+        self.extended = response_id > 0x7FF
+        # the first response to our probe
+        self.response = response
+        self.functional = False
+        self.physical = False
+
+    def __repr__(self):
+        request_id = hex(self.request_id) if self.request_id is not None else '?'
+        return f"DiscoveredEcu({request_id} -> {hex(self.response_id)}, functional={self.functional})"
+
+
+class EcuDiscovery(object):
+    """
+    finds the diagnostic addresses of all ECUs on a bus
+
+    1. a functional broadcast finds every ECU that listens to it
+    2. a probe is sent to every candidate request id back to back, and all responses are collected in one shared
+       listening window afterwards
+    3. responses are matched to request ids by addressing convention, confirmed with a single probe round. the rest is
+       found by bisecting the candidates, all ECUs at once, so this takes about log2(candidates) more rounds
+    with 11 bit ids, all of this takes a few seconds instead of one timeout per id
+    """
+    def __init__(self, interface, use_extended_ids: bool = False, probe: bytes = b'\x3e\x00',
+                 padding_byte: int = 0xAA, listen_time: float = 0.2, source_address: int = 0xF1,
+                 frame_gap: float = 0.0):
+        """
+        :param interface: a connected interface
+        :param use_extended_ids: probe 29 bit (normal fixed addressing) instead of 11 bit ids
+        :param probe: the request to probe with, must fit into a single frame. TesterPresent by default,
+        DiagnosticSessionControl (b'\\x10\\x01') catches ECUs that don't answer TesterPresent
+        :param padding_byte: padding for the probes, None to disable
+        :param listen_time: length (in s) of the listening window after each probe round
+        :param source_address: our address for 29 bit ids
+        :param frame_gap: pause (in s) between two probes, for interfaces that can't take frames back to back
+        """
+        if len(probe) > 7:
+            raise Exception("EcuDiscovery: the probe has to fit into a single frame")
+        self.interface = interface
+        self.use_extended_ids = use_extended_ids
+        self.probe = probe
+        self.padding_byte = padding_byte
+        self.listen_time = listen_time
+        self.source_address = source_address
+        self.frame_gap = frame_gap
+        # maps response ids to DiscoveredEcus
+        self.ecus = {}
+        self.probe_count = 0
+        self.round_count = 0
+
+    def probe_frame(self, arb_id: int) -> Frame:
+        payload = bytes([len(self.probe)]) + self.probe
+        if self.padding_byte is not None:
+            payload += bytes([self.padding_byte] * (8 - len(payload)))
+        return Frame(arb_id=arb_id, payload=payload)
+
+    def is_probe_response(self, frame: Frame) -> bool:
+        payload = frame.payload
+        if payload is None or len(payload) < 2 or payload[0] & IsoTpBitmasks.FRAME_TYPE != IsoTpFrameFlags.SF:
+            # multi-frame responses start with a first frame
+            return payload is not None and len(payload) >= 3 and \
+                payload[0] & IsoTpBitmasks.FRAME_TYPE == IsoTpFrameFlags.FF and \
+                payload[2] == self.probe[0] | Masks.REPLY_MASK
+        sid = self.probe[0]
+        return payload[1] == sid | Masks.REPLY_MASK or \
+            (len(payload) >= 4 and payload[1] == ResponseCodes.NEGATIVE_RESPONSE and payload[2] == sid)
+
+    def probe_round(self, request_ids) -> dict:
+        """
+        send the probe to all request ids back to back, then listen for the responses
+        :return: a dict mapping response ids to the first response payload (without IsoTp header)
+        """
+        self.round_count += 1
+        for arb_id in request_ids:
+            self.interface.send_frame(self.probe_frame(arb_id))
+            self.probe_count += 1
+            if self.frame_gap:
+                time.sleep(self.frame_gap)
+        return self.listen()
+
+    def listen(self) -> dict:
+        responses = {}
+        deadline = time.monotonic() + self.listen_time
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            frame = self.interface.receive_frame(timeout=remaining)
+            if self.is_probe_response(frame) and frame.arb_id not in responses:
+                if frame.payload[0] & IsoTpBitmasks.FRAME_TYPE == IsoTpFrameFlags.SF:
+                    responses[frame.arb_id] = bytes(frame.payload[1:1 + (frame.payload[0] & IsoTpBitmasks.LEN_OR_CTR)])
+                else:
+                    responses[frame.arb_id] = bytes(frame.payload[2:])
+        return responses
+
+    def functional_probe(self) -> dict:
+        """
+        stage 1: broadcast the probe
+        :return: a dict mapping response ids to responses
+        """
+        responses = self.probe_round([FUNCTIONAL_ID_EXTENDED if self.use_extended_ids else FUNCTIONAL_ID])
+        for response_id, response in responses.items():
+            ecu = self.ecus.setdefault(response_id, DiscoveredEcu(response_id, response))
+            ecu.functional = True
+        return responses
+
+    def sweep(self, request_ids: list) -> dict:
+        """
+        stage 2: probe all candidate request ids in one go
+        :return: a dict mapping response ids to responses
+        """
+        responses = self.probe_round(request_ids)
+        for response_id, response in responses.items():
+            ecu = self.ecus.setdefault(response_id, DiscoveredEcu(response_id, response))
+            ecu.physical = True
+        return responses
+
+    def correlate(self, request_ids: list, response_ids: list) -> None:
+        """
+        stage 3: find the request id of every responding ECU
+        """
+        unresolved = []
+        conventional = {}
+        for response_id in response_ids:
+            request_id = conventional_request_id(response_id)
+            if request_id in request_ids:
+                conventional[response_id] = request_id
+            else:
+                unresolved.append(response_id)
+        if conventional:
+            # check all conventional pairs at once
+            responses = self.probe_round(sorted(set(conventional.values())))
+            for response_id, request_id in conventional.items():
+                if response_id in responses:
+                    self.ecus[response_id].request_id = request_id
+                else:
+                    unresolved.append(response_id)
+        if not unresolved:
+            return
+
+        # bisect: all ECUs start with all candidates and their candidate lists are always split in the same way, so
+        # the lists of two ECUs are either equal or disjoint and every ECU only reacts to the half probed for it
+        candidates = {response_id: sorted(request_ids) for response_id in unresolved}
+        while any(len(c) > 1 for c in candidates.values()):
+            probed = set()
+            for c in candidates.values():
+                probed.update(c[:len(c) // 2])
+            responses = self.probe_round(sorted(probed))
+            for response_id, c in candidates.items():
+                if len(c) < 2:
+                    continue
+                if response_id in responses:
+                    candidates[response_id] = c[:len(c) // 2]
+                else:
+                    candidates[response_id] = c[len(c) // 2:]
+        # the last half was never probed on its own
+        final = {response_id: c[0] for response_id, c in candidates.items() if c}
+        responses = self.probe_round(sorted(set(final.values())))
+        for response_id, request_id in final.items():
+            if response_id in responses:
+                self.ecus[response_id].request_id = request_id
+
+    def discover(self, request_ids: list = None) -> dict:
+        """
+        run all stages
+        :param request_ids: candidate request ids, defaults to candidate_ids()
+        :return: the address map, a dict mapping request ids to response ids. see ecus for all responding ECUs,
+        including those without a known request id
+        """
+        if request_ids is None:
+            request_ids = candidate_ids(self.use_extended_ids, self.source_address)
+        self.functional_probe()
+        self.sweep(request_ids)
+        physical = [response_id for response_id, ecu in self.ecus.items() if ecu.physical]
+        if physical:
+            self.correlate(request_ids, physical)
+        return self.address_map()
+
+    def address_map(self) -> dict:
+        return {ecu.request_id: ecu.response_id for ecu in self.ecus.values() if ecu.request_id is not None}
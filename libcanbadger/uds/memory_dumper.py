@@ -0,0 +1,251 @@
+import json
+import mmap
+import os
+import time
+
+from libcanbadger.uds.uds_constants import ResponseCodes
+
+# negative responses that can mean "block too large"
+BLOCK_SIZE_RESPONSE_CODES = (
+    ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT,
+    ResponseCodes.RESPONSE_TOO_LONG,
+    ResponseCodes.REQUEST_OUT_OF_RANGE,
+)
+
+
+def merge_range(ranges: list, start: int, end: int) -> list:
+    """
+    add [start, end) to a sorted list of disjoint [start, end) ranges, merging adjacent ones
+    :return: the new list of ranges
+    """
+    merged = []
+    placed = False
+    for r_start, r_end in ranges:
+        if r_end < start:
+            merged.append([r_start, r_end])
+        elif r_start > end:
+            if not placed:
+                merged.append([start, end])
+                placed = True
+            merged.append([r_start, r_end])
+        else:
+            start = min(start, r_start)
+            end = max(end, r_end)
+    if not placed:
+        merged.append([start, end])
+    return merged
+
+
+def missing_ranges(ranges: list, length: int) -> list:
+    """
+    :return: the gaps in a sorted list of disjoint ranges, within [0, length)
+    """
+    missing = []
+    position = 0
+    for r_start, r_end in ranges:
+        if r_start > position:
+            missing.append([position, r_start])
+        position = max(position, r_end)
+    if position < length:
+        missing.append([position, length])
+    return missing
+
+
+class MemoryDumper(object):
+    """
+    dumps ECU memory using ReadMemoryByAddress (0x23)
+
+    blocks are written straight into a preallocated, memory-mapped output file. progress is checkpointed into a
+    '<filename>.progress' file next to it, so an interrupted dump can be resumed without reading anything twice.
+    """
+    def __init__(self, session, block_size: int = None, max_block_size: int = 0xFFE, min_block_size: int = 0x10,
+                 retries: int = 3, address_length: int = None, size_length: int = None, checkpoint_interval: int = 32,
+                 timeout: float = None):
+        """
+        :param session: the (started) uds Session to read with
+        :param block_size: bytes per request, None finds the largest block size the ECU accepts
+        :param max_block_size: upper bound when probing the block size. a response must fit into 4095 IsoTp bytes
+        :param min_block_size: lower bound when probing the block size
+        :param retries: how often a failed block is retried before it is skipped
+        :param address_length: bytes used for memoryAddress, None derives it from the highest address
+        :param size_length: bytes used for memorySize, None derives it from the block size
+        :param checkpoint_interval: write the progress file every this many blocks
+        :param timeout: response timeout per request, in s. None uses the session's, based on the negotiated P2
+        """
+        self.session = session
+        self.block_size = block_size
+        self.max_block_size = min(max_block_size, 0xFFE)
+        self.min_block_size = min_block_size
+        self.retries = retries
+        self.address_length = address_length
+        self.size_length = size_length
+        self.checkpoint_interval = checkpoint_interval
+        self.timeout = timeout
+
+        # statistics of the last dump
+        self.bytes_read = 0
+        self.request_count = 0
+        self.retry_count = 0
+        self.failed_ranges = []
+        self.elapsed = 0.0
+
+    def format_request(self, address: int, size: int, address_length: int, size_length: int) -> bytes:
+        return bytes([0x23, (size_length << 4) | address_length]) + \
+            address.to_bytes(address_length, byteorder='big') + size.to_bytes(size_length, byteorder='big')
+
+    def read_memory(self, address: int, size: int, address_length: int = None, size_length: int = None) -> tuple:
+        """
+        read a single block of memory
+        :return: a tuple (success, data). on failure, data contains the negative response code or is empty on timeout
+        """
+        if address_length is None:
+            address_length = self.address_length or self.session.calc_byte_size(address + size - 1)
+        if size_length is None:
+            size_length = self.size_length or self.session.calc_byte_size(size)
+        self.request_count += 1
+        response = self.session.request(self.format_request(address, size, address_length, size_length),
+                                        timeout=self.timeout)
+        if response is None or response == b'':
+            return False, b''
+        if response[0] == 0x63 and len(response) - 1 == size:
+            return True, response[1:]
+        if response[0] == ResponseCodes.NEGATIVE_RESPONSE and len(response) >= 3:
+            return False, response[2:3]
+        return False, b''
+
+    def probe_block_size(self, address: int, limit: int = None) -> int:
+        """
+        find the largest block size the ECU accepts, using a binary search between min_block_size and max_block_size
+        :param address: address to probe at, the probed blocks start here
+        :param limit: optional upper bound, e.g. the remaining bytes of the dump
+        :return: the largest working block size or 0 if not even min_block_size could be read
+        """
+        high = self.max_block_size if limit is None else min(self.max_block_size, limit)
+        low = min(self.min_block_size, high)
+        success, data = self.read_memory(address, high)
+        if success:
+            return high
+        success, data = self.read_memory(address, low)
+        if not success:
+            return 0
+        # low always works, high never does
+        while high - low > 1:
+            middle = (low + high) // 2
+            success, data = self.read_memory(address, middle)
+            if success:
+                low = middle
+            elif data and data[0] not in BLOCK_SIZE_RESPONSE_CODES:
+                # the ECU refuses for a different reason, probing further won't help
+                break
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def progress_filename(filename: str) -> str:
+        return filename + '.progress'
+
+    def load_progress(self, filename: str, start_address: int, length: int) -> list:
+        try:
+            with open(self.progress_filename(filename), 'r') as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if progress.get('start_address') != start_address or progress.get('length') != length:
+            # this progress belongs to a different dump
+            return []
+        if self.block_size is None and progress.get('block_size'):
+            self.block_size = progress['block_size']
+        return progress.get('done', [])
+
+    def save_progress(self, filename: str, start_address: int, length: int, done: list) -> None:
+        # write to a temporary file first, so a crash never leaves a broken progress file behind
+        progress_filename = self.progress_filename(filename)
+        with open(progress_filename + '.tmp', 'w') as f:
+            json.dump({'start_address': start_address, 'length': length, 'block_size': self.block_size,
+                       'done': done}, f)
+        os.replace(progress_filename + '.tmp', progress_filename)
+
+    def dump(self, start_address: int, length: int, filename: str, resume: bool = True,
+             progress_callback: callable = None) -> bool:
+        """
+        dump memory to a file
+        :param start_address: first address to read
+        :param length: number of bytes to read
+        :param filename: output file, it will have exactly length bytes. unreadable blocks stay zero
+        :param resume: continue a previous dump into the same file, using its progress file
+        :param progress_callback: called after every block with (bytes done, total bytes, throughput in bytes/s)
+        :return: True if all blocks were read
+        """
+        self.bytes_read = 0
+        self.request_count = 0
+        self.retry_count = 0
+        self.failed_ranges = []
+        start_time = time.monotonic()
+
+        done = self.load_progress(filename, start_address, length) if resume else []
+        mode = 'r+b' if done and os.path.exists(filename) else 'w+b'
+        if mode == 'w+b':
+            done = []
+        todo = missing_ranges(done, length)
+
+        address_length = self.address_length or self.session.calc_byte_size(start_address + length - 1)
+        with open(filename, mode) as f:
+            # preallocate the whole file, so blocks can be written in place
+            f.truncate(length)
+            if length == 0:
+                return True
+            with mmap.mmap(f.fileno(), length) as mm:
+                blocks_since_checkpoint = 0
+                for range_start, range_end in todo:
+                    offset = range_start
+                    while offset < range_end:
+                        if self.block_size is None:
+                            self.block_size = self.probe_block_size(start_address + offset, range_end - offset)
+                            if self.block_size == 0:
+                                # skip a single block, the memory after it may be readable
+                                self.block_size = None
+                                size = min(self.min_block_size, range_end - offset)
+                                self.failed_ranges = merge_range(self.failed_ranges, offset, offset + size)
+                                offset += size
+                                continue
+                        size = min(self.block_size, range_end - offset)
+                        size_length = self.size_length or self.session.calc_byte_size(self.block_size)
+                        success, data = False, b''
+                        for attempt in range(self.retries + 1):
+                            if attempt > 0:
+                                self.retry_count += 1
+                            success, data = self.read_memory(start_address + offset, size, address_length,
+                                                             size_length)
+                            if success:
+                                break
+                        if success:
+                            mm[offset:offset + size] = data
+                            done = merge_range(done, offset, offset + size)
+                            self.bytes_read += size
+                        else:
+                            self.failed_ranges = merge_range(self.failed_ranges, offset, offset + size)
+                        offset += size
+
+                        blocks_since_checkpoint += 1
+                        if blocks_since_checkpoint >= self.checkpoint_interval:
+                            # the data has to be on disk before the progress claims it is
+                            mm.flush()
+                            self.save_progress(filename, start_address, length, done)
+                            blocks_since_checkpoint = 0
+                        self.elapsed = time.monotonic() - start_time
+                        if progress_callback is not None:
+                            progress_callback(length - sum(e - s for s, e in missing_ranges(done, length)),
+                                              length, self.throughput())
+                mm.flush()
+        self.save_progress(filename, start_address, length, done)
+        self.elapsed = time.monotonic() - start_time
+        return not self.failed_ranges
+
+    def throughput(self) -> float:
+        """
+        :return: bytes/s of the last dump
+        """
+        if self.elapsed <= 0:
+            return 0.0
+        return self.bytes_read / self.elapsed
@@ -0,0 +1,241 @@
+import enum
+import time
+
+from libcanbadger.frame import Frame
+from libcanbadger.iso_tp.iso_tp_handler import IsoTpHandler
+from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage, IsoTpRxMessageStates, IsoTpFrameFlags, IsoTpBitmasks, \
+    IsoTpFlowStatus
+from libcanbadger.uds.session import Session
+
+
+class EcuScanState(enum.Enum):
+    IDLE = 0  # ready to send the next request
+    EXPECT_FC = 1  # sent a first frame, waiting for flow control
+    EXPECT_RESPONSE = 2  # request is out, waiting for (the rest of) the response
+    DONE = 3  # no more requests
+    SEND_CF = 4  # sending a block of consecutive frames, waiting out STmin until the next one
+
+
+class EcuScanTarget(object):
+    """
+    the request/response state machine for a single ECU within a MultiEcuScanner
+    """
+    def __init__(self, tester_id: int, ecu_id: int, requests, padding_byte: int = None):
+        """
+        :param tester_id: arbitration id requests are sent with
+        :param ecu_id: arbitration id the ECU responds with
+        :param requests: iterable of raw uds requests. it is consumed lazily, so generators work fine
+        :param padding_byte: padding for our frames, None to disable
+        """
+        self.tester_id = tester_id
+        self.ecu_id = ecu_id
+        self.requests = iter(requests)
+        self.padding_byte = padding_byte
+        self.state = EcuScanState.IDLE
+        self.current_request = None
+        self.tx_frames = []
+        # consecutive frames left in the current block, and the STmin (in s) the ECU asked for
+        self.block_remaining = 0
+        self.st_min = 0.0
+        self.rx_msg = None
+        # timeout of the current state. in SEND_CF, the time the next consecutive frame is due
+        self.deadline = 0.0
+        self.start_time = 0.0
+        self.pending_count = 0
+        # (request, response) tuples, in order. a response of b'' means timeout
+        self.results = []
+        self.timeout_count = 0
+
+    def next_request(self):
+        """
+        :return: the next request or None if there are no more
+        """
+        try:
+            return next(self.requests)
+        except StopIteration:
+            return None
+
+
+class MultiEcuScanner(object):
+    """
+    queries many ECUs in parallel over a single interface
+
+    every ECU gets its own request queue and state machine with at most one outstanding request. responses are
+    demultiplexed by their arbitration id, so the bus is shared by all ECUs instead of waiting on each one in turn.
+    response pending replies (NRC 0x78) extend the wait for that ECU only
+    """
+    def __init__(self, interface, timeout: float = 0.2, p2_star: float = 5.0, max_response_pending: int = 10,
+                 padding_byte: int = 0xAA, n_bs: float = 1.0, n_cr: float = 1.0):
+        """
+        :param interface: a connected interface
+        :param timeout: P2, max time (in s) to wait for the start of a response
+        :param p2_star: max time (in s) to wait after a response pending reply
+        :param max_response_pending: max number of response pending replies per request
+        :param padding_byte: padding for our frames, None to disable
+        :param n_bs: max time (in s) to wait for flow control when sending multi-frame requests
+        :param n_cr: max time (in s) to wait for the next consecutive frame of a response
+        """
+        self.interface = interface
+        self.timeout = timeout
+        self.p2_star = p2_star
+        self.max_response_pending = max_response_pending
+        self.padding_byte = padding_byte
+        self.n_bs = n_bs
+        self.n_cr = n_cr
+        # maps ecu ids to their EcuScanTargets
+        self.targets = {}
+
+    def add_ecu(self, tester_id: int, ecu_id: int, requests) -> EcuScanTarget:
+        """
+        add an ECU to the scan
+        :param tester_id: arbitration id requests are sent with
+        :param ecu_id: arbitration id the ECU responds with, must be unique within the scan
+        :param requests: iterable of raw uds requests
+        :return: the ECU's EcuScanTarget
+        """
+        if ecu_id in self.targets:
+            raise Exception(f"MultiEcuScanner: ECU {hex(ecu_id)} was already added")
+        target = EcuScanTarget(tester_id, ecu_id, requests, padding_byte=self.padding_byte)
+        self.targets[ecu_id] = target
+        return target
+
+    def pad(self, payload: bytes) -> bytes:
+        if self.padding_byte is not None and len(payload) < 8:
+            return payload + bytes([self.padding_byte] * (8 - len(payload)))
+        return payload
+
+    def send_request(self, target: EcuScanTarget, now: float) -> None:
+        request = target.next_request()
+        if request is None:
+            target.state = EcuScanState.DONE
+            return
+        target.current_request = request
+        target.pending_count = 0
+        target.start_time = now
+        target.rx_msg = IsoTpMessage(arb_id=target.ecu_id)
+        frames = IsoTpMessage(arb_id=target.tester_id, payload=request, padding_byte=self.padding_byte).format()
+        self.interface.send_frame(frames[0])
+        if len(frames) > 1:
+            target.tx_frames = frames[1:]
+            target.state = EcuScanState.EXPECT_FC
+            target.deadline = now + self.n_bs
+        else:
+            target.state = EcuScanState.EXPECT_RESPONSE
+            target.deadline = now + self.timeout
+
+    def finish_request(self, target: EcuScanTarget, response: bytes, result_callback: callable) -> None:
+        if response == b'':
+            target.timeout_count += 1
+        target.results.append((target.current_request, response))
+        if result_callback is not None:
+            result_callback(target.ecu_id, target.current_request, response)
+        target.current_request = None
+        target.tx_frames = []
+        target.block_remaining = 0
+        target.state = EcuScanState.IDLE
+
+    def handle_flow_control(self, target: EcuScanTarget, frame: Frame, now: float) -> None:
+        if len(frame.payload) < 3:
+            return
+        flow_status = frame.payload[0] & IsoTpBitmasks.LEN_OR_CTR
+        if flow_status == IsoTpFlowStatus.WAIT:
+            target.deadline = now + self.n_bs
+            return
+        if flow_status != IsoTpFlowStatus.CONTINUE_TO_SEND:
+            # overflow, the ECU won't take this request
+            target.tx_frames = []
+            target.deadline = now
+            return
+        block_size = frame.payload[1]
+        target.st_min = IsoTpHandler.decode_st_min(frame.payload[2])
+        target.block_remaining = len(target.tx_frames) if block_size == 0 else min(block_size, len(target.tx_frames))
+        self.send_consecutive_frames(target)
+
+    def send_consecutive_frames(self, target: EcuScanTarget) -> None:
+        """
+        send the consecutive frames of the current block that are due. with an STmin, the next one is scheduled
+        instead of waiting for it, so the other ECUs aren't held up
+        """
+        while target.block_remaining > 0:
+            self.interface.send_frame(target.tx_frames.pop(0))
+            target.block_remaining -= 1
+            if target.st_min and target.block_remaining > 0:
+                target.state = EcuScanState.SEND_CF
+                target.deadline = time.monotonic() + target.st_min
+                return
+        now = time.monotonic()
+        if target.tx_frames:
+            target.state = EcuScanState.EXPECT_FC
+            target.deadline = now + self.n_bs
+        else:
+            target.state = EcuScanState.EXPECT_RESPONSE
+            target.deadline = now + self.timeout
+
+    def handle_frame(self, target: EcuScanTarget, frame: Frame, now: float, result_callback: callable) -> None:
+        frame_type = frame.payload[0] & IsoTpBitmasks.FRAME_TYPE
+        if frame_type == IsoTpFrameFlags.FC:
+            if target.state == EcuScanState.EXPECT_FC:
+                self.handle_flow_control(target, frame, now)
+            return
+        if target.state != EcuScanState.EXPECT_RESPONSE:
+            # late or unsolicited
+            return
+
+        msg = target.rx_msg
+        msg.feed(frame)
+        if msg.rx_state == IsoTpRxMessageStates.SEND_FC:
+            fc = Frame(arb_id=target.tester_id, payload=self.pad(bytes([IsoTpFrameFlags.FC, 0x00, 0x00])))
+            self.interface.send_frame(fc)
+            msg.rx_state = IsoTpRxMessageStates.EXPECT_CF
+            target.deadline = now + self.n_cr
+        elif msg.rx_state == IsoTpRxMessageStates.EXPECT_CF:
+            target.deadline = now + self.n_cr
+        elif msg.rx_state == IsoTpRxMessageStates.ERROR:
+            target.rx_msg = IsoTpMessage(arb_id=target.ecu_id)
+        elif msg.rx_state == IsoTpRxMessageStates.COMPLETE:
+            response = bytes(msg.payload)
+            target.rx_msg = IsoTpMessage(arb_id=target.ecu_id)
+            if Session.is_response_pending(response, target.current_request[0]) \
+                    and target.pending_count < self.max_response_pending:
+                target.pending_count += 1
+                target.deadline = now + self.p2_star
+            else:
+                self.finish_request(target, response, result_callback)
+
+    def run(self, result_callback: callable = None) -> dict:
+        """
+        run until every ECU has answered (or timed out on) all of its requests
+        :param result_callback: optional, called with (ecu_id, request, response) for every finished request
+        :return: a dict mapping ecu ids to lists of (request, response) tuples
+        """
+        targets = self.targets
+        while True:
+            now = time.monotonic()
+            active = False
+            next_deadline = None
+            for target in targets.values():
+                if target.state == EcuScanState.IDLE:
+                    self.send_request(target, now)
+                if target.state == EcuScanState.DONE:
+                    continue
+                if target.state == EcuScanState.SEND_CF and target.deadline <= now:
+                    self.send_consecutive_frames(target)
+                if target.deadline <= now:
+                    self.finish_request(target, b'', result_callback)
+                    self.send_request(target, now)
+                    if target.state == EcuScanState.DONE:
+                        continue
+                active = True
+                if next_deadline is None or target.deadline < next_deadline:
+                    next_deadline = target.deadline
+            if not active:
+                break
+
+            frame = self.interface.receive_frame(timeout=max(next_deadline - time.monotonic(), 0))
+            if frame.payload is None or len(frame.payload) < 1:
+                continue
+            target = targets.get(frame.arb_id)
+            if target is not None:
+                self.handle_frame(target, frame, time.monotonic(), result_callback)
+
+        return {ecu_id: target.results for ecu_id, target in targets.items()}
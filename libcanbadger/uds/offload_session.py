@@ -0,0 +1,116 @@
+import struct
+import time
+
+from libcanbadger.ethernet_message import EthernetMessage, EthernetMessageType, ActionType
+from libcanbadger.uds.session import Session, SessionStatus
+
+# START_UDS payload: can interface, tester id, ecu id, padding enabled, padding byte, diagnostic session level
+# ids use the same extended id flag as CANBadger.send_canframe
+start_uds_struct = struct.Struct('<BIIBBB')
+# UDS payload header, followed by the raw request: P2 and P2* response timeouts in ms
+uds_request_header = struct.Struct('<HH')
+
+EXTENDED_ID_FLAG = 0x80000000
+
+
+class OffloadSession(Session):
+    """
+    a UDS session that runs on the CANBadger itself
+
+    the host only exchanges whole UDS requests and responses with the CANBadger, each as a single EthernetMessage.
+    segmentation, flow control and tester present are handled by the device, so a request costs one round trip to
+    the CANBadger instead of one per frame.
+
+    protocol:
+    - START_UDS (ACTION), payload start_uds_struct: the CANBadger ACKs, opens the diagnostic session and answers with
+      a DATA message (action START_UDS) holding the ECU's DiagnosticSessionControl response.
+      tester present is kept up by the device until the action is stopped
+    - UDS (ACTION), payload uds_request_header + request: answered by a DATA message (action UDS) for every response
+      of the ECU, including response pending replies. the device waits P2 for the first response and P2* after each
+      response pending reply. an empty DATA message signals that the ECU didn't respond in time
+    - STOP_CURRENT_ACTION (ACTION) ends the session
+    """
+    def __init__(self, interface=None, tester_id: int = None, ecu_id: int = None,
+                 use_padding: bool = True, padding: int = 0xAA, use_extended_ids=False, can_interface: int = 1):
+        super(OffloadSession, self).__init__(interface=interface, tester_id=tester_id, ecu_id=ecu_id,
+                                             use_padding=use_padding, padding=padding,
+                                             use_extended_ids=use_extended_ids)
+        if self.ecu_id is None:
+            raise Exception("OffloadSession needs a valid ecu id.")
+        if not hasattr(self.interface, 'send') or not hasattr(self.interface, 'receive'):
+            raise Exception("OffloadSession needs a CANBadger interface.")
+        self.can_interface = can_interface
+        # timeout the device applies to the ECU's first response, in s. None for the negotiated P2
+        self.device_timeout = None
+
+    def __exit__(self, interface=None, tester_id: int = None, ecu_id: int = None, use_padding: bool = True, padding: int = 0xAA):
+        self.stop_tp()
+
+    def format_id(self, arb_id: int) -> int:
+        if self.use_extended_ids:
+            return arb_id | EXTENDED_ID_FLAG
+        return arb_id
+
+    def start(self, diagnostic_level=1, timeout=1):
+        payload = start_uds_struct.pack(self.can_interface, self.format_id(self.tester_id),
+                                        self.format_id(self.ecu_id), int(self.use_padding), self.padding,
+                                        diagnostic_level)
+        accepted = self.interface.send(EthernetMessage(EthernetMessageType.ACTION, ActionType.START_UDS,
+                                                       len(payload), payload), wait_for_ack=True)
+        if not accepted:
+            self.status = SessionStatus.Failed
+            print("CANBadger refused to start the UDS session")
+            return
+
+        response = self.receive_response(timeout=timeout, action_type=ActionType.START_UDS)
+        if response is None or response == b'':
+            self.status = SessionStatus.Failed
+            print("failed to establish session")
+            return
+        response_byte = response[0]
+        if response_byte == 0x50:
+            self.status = SessionStatus.Idle
+            self.update_timing(response)
+        elif response_byte == 0x7f:
+            self.status = SessionStatus.Declined
+        else:
+            print("unpredicted response")
+            print(f"byte is {response[0]}...")
+
+    def ecu_timeout(self) -> float:
+        """
+        :return: the time (in s) the device waits for the ECU's first response
+        """
+        return self.device_timeout if self.device_timeout is not None else self.response_timeout()
+
+    def send_request(self, data, expect_response: bool = True) -> bool:
+        p2_ms = min(int(self.ecu_timeout() * 1000), 0xFFFF)
+        p2_star_ms = min(int(self.p2_star * 1000), 0xFFFF)
+        payload = uds_request_header.pack(p2_ms, p2_star_ms) + bytes(data)
+        return self.interface.send(EthernetMessage(EthernetMessageType.ACTION, ActionType.UDS, len(payload), payload))
+
+    def receive_response(self, timeout=0.2, action_type=ActionType.UDS) -> bytes:
+        # the device enforces the ECU timeout, we only add some slack for the ethernet round trip
+        deadline = time.monotonic() + max(timeout, self.ecu_timeout()) + 0.5
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return b''
+            eth_msg = self.interface.receive(timeout=remaining)
+            if eth_msg == -1:
+                return b''
+            # logged frames and other traffic can share the queue with our responses
+            if eth_msg.msg_type == EthernetMessageType.DATA and eth_msg.action_type == action_type:
+                return eth_msg.data
+
+    def start_tp(self):
+        # the CANBadger sends tester present on its own while the session is active
+        pass
+
+    def stop_tp(self):
+        """
+        tester present is part of the device-side session, stopping it ends the session
+        """
+        if self.status == SessionStatus.Idle:
+            self.interface.send(EthernetMessage(EthernetMessageType.ACTION, ActionType.STOP_CURRENT_ACTION, 0, b''))
+        self.status = SessionStatus.Setup
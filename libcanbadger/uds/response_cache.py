@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict
+
+from libcanbadger.uds.uds_constants import Masks
+
+# services that only read, their positive responses can be cached
+CACHEABLE_SERVICES = (0x22, 0x19, 0x23)
+# services that change the ECU's state or data, any cached response of the ECU may be outdated afterwards
+INVALIDATING_SERVICES = (
+    0x10,  # DiagnosticSessionControl
+    0x11,  # ECUReset
+    0x14,  # ClearDiagnosticInformation
+    0x27,  # SecurityAccess
+    0x2C,  # DynamicallyDefineDataIdentifier
+    0x2E,  # WriteDataByIdentifier
+    0x2F,  # InputOutputControlByIdentifier
+    0x31,  # RoutineControl
+    0x34,  # RequestDownload
+    0x36,  # TransferData
+    0x37,  # RequestTransferExit
+    0x3D,  # WriteMemoryByAddress
+    0x85,  # ControlDTCSetting
+)
+
+
+class ResponseCache(object):
+    """
+    a TTL and LRU cache for responses to read-only uds requests
+
+    entries are keyed by ECU and raw request, so a single cache can be shared by several sessions. ReadMemoryByAddress
+    is only cached within the declared ROM ranges, everything else in memory may change at any time
+    """
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0, rom_ranges: list = None):
+        """
+        :param max_entries: max number of cached responses, the least recently used ones are evicted first
+        :param ttl: time (in s) a response stays valid
+        :param rom_ranges: list of (start address, end address) tuples, end exclusive, of read-only memory
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.rom_ranges = list(rom_ranges) if rom_ranges else []
+        # maps (ecu id, request) to (expiry time, response)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def in_rom(self, request: bytes) -> bool:
+        # parse addressAndLengthFormatIdentifier, memoryAddress and memorySize of a ReadMemoryByAddress request
+        if len(request) < 2:
+            return False
+        size_len = request[1] >> 4
+        address_len = request[1] & 0x0F
+        if size_len == 0 or address_len == 0 or len(request) != 2 + address_len + size_len:
+            return False
+        address = int.from_bytes(request[2:2 + address_len], byteorder='big')
+        size = int.from_bytes(request[2 + address_len:], byteorder='big')
+        return any(start <= address and address + size <= end for start, end in self.rom_ranges)
+
+    def is_cacheable(self, request: bytes) -> bool:
+        if len(request) < 2 or request[0] not in CACHEABLE_SERVICES:
+            return False
+        if request[0] == 0x23:
+            return self.in_rom(request)
+        return True
+
+    @staticmethod
+    def invalidates(request: bytes) -> bool:
+        """
+        :return: True if the request may change what the ECU responds to reads
+        """
+        return len(request) > 0 and request[0] in INVALIDATING_SERVICES
+
+    def get(self, ecu_id: int, request: bytes) -> bytes:
+        """
+        :return: the cached response or None
+        """
+        key = (ecu_id, bytes(request))
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, ecu_id: int, request: bytes, response: bytes) -> None:
+        """
+        cache a response, if the request is cacheable and the response is positive
+        """
+        if not self.is_cacheable(request) or len(response) < 1 or response[0] != request[0] | Masks.REPLY_MASK:
+            return
+        key = (ecu_id, bytes(request))
+        self.entries[key] = (time.monotonic() + self.ttl, bytes(response))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, ecu_id: int = None) -> None:
+        """
+        drop all cached responses of an ECU, or of all ECUs if ecu_id is None
+        """
+        if ecu_id is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[0] == ecu_id]:
+            del self.entries[key]
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
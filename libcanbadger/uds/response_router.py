@@ -0,0 +1,298 @@
+import threading
+import time
+from collections import deque
+
+from libcanbadger.frame import Frame
+from libcanbadger.iso_tp.iso_tp_handler import IsoTpHandler
+from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage, IsoTpRxMessageStates, IsoTpFrameFlags, IsoTpBitmasks, \
+    IsoTpFlowStatus
+from libcanbadger.uds.uds_constants import ResponseCodes, AdditionalResponseCodes, Masks
+
+
+def response_sid(response: bytes) -> int:
+    """
+    :return: the SID of the request a response belongs to, or None if it doesn't look like a uds response
+    """
+    if len(response) < 1:
+        return None
+    if response[0] == ResponseCodes.NEGATIVE_RESPONSE:
+        return response[1] if len(response) >= 3 else None
+    if response[0] & Masks.REPLY_MASK:
+        return response[0] & Masks.SID_MASK
+    return None
+
+
+class PendingRequest(object):
+    """
+    a request waiting for its response within a ResponseRouter
+    """
+    def __init__(self, tester_id: int, ecu_id: int, request: bytes, expect_response: bool = True):
+        self.tester_id = tester_id
+        self.ecu_id = ecu_id
+        self.request = request
+        self.sid = request[0]
+        # False for requests nobody waits for, e.g. with suppressPosRspMsgIndicationBit. they don't take responses
+        self.expect_response = expect_response
+        self.start_time = time.monotonic()
+        # P2 and the resulting deadline are set by the first wait(), response pending replies extend the deadline
+        self.timeout = None
+        self.deadline = None
+        self.pending_count = 0
+        # consecutive frames of a multi-frame request, waiting for flow control
+        self.tx_frames = []
+        # frames of the current block still to send, STmin, and the time the next one is due (None while waiting for
+        # flow control)
+        self.block_remaining = 0
+        self.st_min = 0.0
+        self.next_frame_time = None
+        self.response = None
+        self.done = False
+
+    def finish(self, response: bytes) -> None:
+        self.response = response
+        self.done = True
+
+
+class ResponseRouter(object):
+    """
+    routes uds responses to the requests they belong to
+
+    responses are matched by addressing pair and SID: a positive response (SID | 0x40) or a negative response
+    (7F SID) completes the oldest pending request with that SID on that pair. anything else, like late responses to
+    requests that already timed out, is counted as stale and dropped.
+    any number of requests can be in flight on different addressing pairs. frames are read by whichever thread
+    waits for a response, all other waiting threads are served from there. consecutive frames of multi-frame
+    requests are sent from there as well, as they become due, so an STmin never blocks the other requests
+    """
+    def __init__(self, interface, padding_byte: int = 0xAA, p2_star: float = 5.0, max_response_pending: int = 10,
+                 n_bs: float = 1.0, n_cr: float = 1.0):
+        """
+        :param interface: a connected interface
+        :param padding_byte: padding for our frames, None to disable
+        :param p2_star: max time (in s) to wait after a response pending reply
+        :param max_response_pending: max number of response pending replies per request
+        :param n_bs: max time (in s) to wait for flow control when sending multi-frame requests
+        :param n_cr: max time (in s) between two consecutive frames of a response
+        """
+        self.interface = interface
+        self.padding_byte = padding_byte
+        self.p2_star = p2_star
+        self.max_response_pending = max_response_pending
+        self.n_bs = n_bs
+        self.n_cr = n_cr
+        # ecu id -> tester id, learned from submitted requests
+        self.pairs = {}
+        # ecu id -> list of PendingRequests, oldest first
+        self.pending = {}
+        # ecu id -> IsoTpMessage being reassembled
+        self.rx_messages = {}
+        self.stale_count = 0
+        # the last few stale responses, as (ecu id, response) tuples
+        self.stale_responses = deque(maxlen=32)
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self.poll_lock = threading.Lock()
+
+    def pad(self, payload: bytes) -> bytes:
+        if self.padding_byte is not None and len(payload) < 8:
+            return payload + bytes([self.padding_byte] * (8 - len(payload)))
+        return payload
+
+    def submit(self, tester_id: int, ecu_id: int, request: bytes, expect_response: bool = True) -> PendingRequest:
+        """
+        send a request and register it for its response
+        :param expect_response: False if nobody is going to wait for the response. the request is only registered
+        until it is sent then (multi-frame requests need flow control), and a response is taken as stale
+        :return: a PendingRequest to wait() for
+        """
+        pending = PendingRequest(tester_id, ecu_id, bytes(request), expect_response)
+        frames = IsoTpMessage(arb_id=tester_id, payload=pending.request, padding_byte=self.padding_byte).format()
+        with self.lock:
+            self.pairs[ecu_id] = tester_id
+            if len(frames) > 1:
+                self.pending.setdefault(ecu_id, []).append(pending)
+                pending.tx_frames = frames[1:]
+                pending.deadline = pending.start_time + self.n_bs
+            elif expect_response:
+                self.pending.setdefault(ecu_id, []).append(pending)
+            else:
+                pending.finish(None)
+        self.interface.send_frame(frames[0])
+        return pending
+
+    def cancel(self, pending: PendingRequest) -> None:
+        with self.lock:
+            queue = self.pending.get(pending.ecu_id)
+            if queue and pending in queue:
+                queue.remove(pending)
+
+    def wait(self, pending: PendingRequest, timeout: float = 0.2) -> bytes:
+        """
+        wait for the response to a submitted request
+        :param pending: the PendingRequest returned by submit()
+        :param timeout: P2, max time (in s) from submitting the request to the start of the response
+        :return: the response or b'' on timeout. None for requests submitted without expect_response, once they
+        were sent
+        """
+        with self.lock:
+            if pending.timeout is None:
+                pending.timeout = timeout
+            if pending.deadline is None:
+                pending.deadline = pending.start_time + timeout
+        while True:
+            with self.lock:
+                if pending.done:
+                    return pending.response
+                remaining = pending.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.cancel(pending)
+                    pending.finish(b'' if pending.expect_response else None)
+                    return pending.response
+            if self.poll_lock.acquire(blocking=False):
+                try:
+                    self.poll(timeout=remaining)
+                finally:
+                    self.poll_lock.release()
+                    with self.condition:
+                        self.condition.notify_all()
+            else:
+                # somebody else is reading frames right now and will notify us
+                with self.condition:
+                    if not pending.done:
+                        self.condition.wait(remaining)
+
+    def poll(self, timeout: float) -> None:
+        """
+        receive and dispatch a single frame, and send the consecutive frames that are due. the timeout is cut short
+        when a consecutive frame is due earlier
+        """
+        with self.lock:
+            due = self.next_frame_due()
+        if due is not None:
+            timeout = max(0.0, min(timeout, due - time.monotonic()))
+        frame = self.interface.receive_frame(timeout=timeout)
+        with self.condition:
+            if frame.payload is not None and len(frame.payload) >= 1:
+                self.dispatch_frame(frame)
+            self.send_due_frames(time.monotonic())
+            self.condition.notify_all()
+
+    def next_frame_due(self) -> float:
+        """
+        :return: the time the next scheduled consecutive frame is due, None if there is none
+        """
+        times = [p.next_frame_time for queue in self.pending.values() for p in queue if p.next_frame_time is not None]
+        return min(times, default=None)
+
+    def send_due_frames(self, now: float) -> None:
+        for queue in list(self.pending.values()):
+            for pending in [p for p in queue if p.next_frame_time is not None and p.next_frame_time <= now]:
+                self.send_consecutive_frames(pending)
+
+    def expire(self, ecu_id: int, now: float) -> None:
+        """
+        time out the requests to ecu_id whose deadline passed, whether somebody waits for them or not. requests
+        nobody waited for yet have no deadline, they expire after P2*
+        """
+        queue = self.pending.get(ecu_id)
+        if not queue:
+            return
+        expired = [p for p in queue if (p.deadline if p.deadline is not None else p.start_time + self.p2_star) < now]
+        for pending in expired:
+            queue.remove(pending)
+            pending.finish(b'' if pending.expect_response else None)
+
+    def dispatch_frame(self, frame: Frame) -> None:
+        ecu_id = frame.arb_id
+        tester_id = self.pairs.get(ecu_id)
+        if tester_id is None:
+            return
+        now = time.monotonic()
+        self.expire(ecu_id, now)
+        frame_type = frame.payload[0] & IsoTpBitmasks.FRAME_TYPE
+        if frame_type == IsoTpFrameFlags.FC:
+            self.handle_flow_control(ecu_id, frame, now)
+            return
+
+        msg = self.rx_messages.get(ecu_id)
+        if msg is None or frame_type in (IsoTpFrameFlags.SF, IsoTpFrameFlags.FF):
+            msg = IsoTpMessage(arb_id=ecu_id)
+            self.rx_messages[ecu_id] = msg
+        msg.feed(frame)
+        if msg.rx_state == IsoTpRxMessageStates.SEND_FC:
+            self.interface.send_frame(Frame(arb_id=tester_id, payload=self.pad(bytes([IsoTpFrameFlags.FC, 0, 0]))))
+            msg.rx_state = IsoTpRxMessageStates.EXPECT_CF
+            self.extend_deadlines(ecu_id, now + self.n_cr)
+        elif msg.rx_state == IsoTpRxMessageStates.EXPECT_CF:
+            self.extend_deadlines(ecu_id, now + self.n_cr)
+        elif msg.rx_state == IsoTpRxMessageStates.COMPLETE:
+            del self.rx_messages[ecu_id]
+            self.route(ecu_id, bytes(msg.payload), now)
+        elif msg.rx_state == IsoTpRxMessageStates.ERROR:
+            del self.rx_messages[ecu_id]
+
+    def extend_deadlines(self, ecu_id: int, deadline: float) -> None:
+        # a response is arriving, its requests must not time out in the middle of it
+        for pending in self.pending.get(ecu_id, []):
+            if not pending.tx_frames and pending.deadline is not None and pending.deadline < deadline:
+                pending.deadline = deadline
+
+    def handle_flow_control(self, ecu_id: int, frame: Frame, now: float) -> None:
+        queue = self.pending.get(ecu_id, [])
+        pending = next((p for p in queue if p.tx_frames and not p.block_remaining), None)
+        if pending is None or len(frame.payload) < 3:
+            return
+        flow_status = frame.payload[0] & IsoTpBitmasks.LEN_OR_CTR
+        if flow_status == IsoTpFlowStatus.WAIT:
+            pending.deadline = now + self.n_bs
+            return
+        if flow_status != IsoTpFlowStatus.CONTINUE_TO_SEND:
+            queue.remove(pending)
+            pending.finish(b'')
+            return
+        block_size = frame.payload[1]
+        pending.st_min = IsoTpHandler.decode_st_min(frame.payload[2])
+        pending.block_remaining = len(pending.tx_frames) if block_size == 0 \
+            else min(block_size, len(pending.tx_frames))
+        self.send_consecutive_frames(pending)
+
+    def send_consecutive_frames(self, pending: PendingRequest) -> None:
+        """
+        send the consecutive frames of the current block that are due. with an STmin, the next one is scheduled
+        instead of waiting for it, poll() sends it once it is due
+        """
+        while pending.block_remaining > 0:
+            self.interface.send_frame(pending.tx_frames.pop(0))
+            pending.block_remaining -= 1
+            if pending.st_min and pending.block_remaining > 0:
+                pending.next_frame_time = time.monotonic() + pending.st_min
+                pending.deadline = pending.next_frame_time + self.n_bs
+                return
+        pending.next_frame_time = None
+        queue = self.pending.get(pending.ecu_id, [])
+        if pending.tx_frames:
+            pending.deadline = time.monotonic() + self.n_bs
+        elif not pending.expect_response:
+            queue.remove(pending)
+            pending.finish(None)
+        else:
+            # the request is complete, P2 starts now
+            pending.start_time = time.monotonic()
+            pending.deadline = None if pending.timeout is None else pending.start_time + pending.timeout
+
+    def route(self, ecu_id: int, response: bytes, now: float) -> None:
+        sid = response_sid(response)
+        queue = self.pending.get(ecu_id, [])
+        pending = next((p for p in queue if p.sid == sid and p.expect_response and not p.tx_frames), None)
+        if pending is None:
+            self.stale_count += 1
+            self.stale_responses.append((ecu_id, response))
+            return
+        if response[0] == ResponseCodes.NEGATIVE_RESPONSE \
+                and response[2] == AdditionalResponseCodes.RESPONSE_PENDING \
+                and pending.pending_count < self.max_response_pending:
+            pending.pending_count += 1
+            pending.deadline = now + self.p2_star
+            return
+        queue.remove(pending)
+        pending.finish(response)
@@ -0,0 +1,214 @@
+import json
+import sqlite3
+import time
+import uuid
+
+from libcanbadger.uds.search_runner import Outcome
+from libcanbadger.uds.uds_constants import ResponseCodes
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT NOT NULL,
+        time REAL NOT NULL,
+        ecu_id INTEGER,
+        service INTEGER,
+        parameters TEXT,
+        request BLOB NOT NULL,
+        response BLOB,
+        positive INTEGER,
+        response_code INTEGER,
+        outcome TEXT)''',
+    'CREATE INDEX IF NOT EXISTS results_response_code ON results (ecu_id, service, response_code)',
+    'CREATE INDEX IF NOT EXISTS results_parameters ON results (ecu_id, service, parameters)',
+    'CREATE INDEX IF NOT EXISTS results_request ON results (ecu_id, request, time)',
+]
+
+# outcomes that answer a request for good. busy responses, timeouts and lost sessions say nothing about it
+FINAL_OUTCOMES = (Outcome.Hit.name, Outcome.Miss.name)
+
+COLUMNS = ('run_id', 'time', 'ecu_id', 'service', 'parameters', 'request', 'response', 'positive', 'response_code',
+           'outcome')
+
+
+def encode_values(values: list) -> str:
+    """
+    :return: parameter values as JSON, bytes values as {"bytes": hex}
+    """
+    if values is None:
+        return None
+    return json.dumps([{'bytes': v.hex()} if isinstance(v, (bytes, bytearray)) else v for v in values],
+                      separators=(',', ':'))
+
+
+def decode_values(text: str) -> list:
+    if text is None:
+        return None
+    return [bytes.fromhex(v['bytes']) if isinstance(v, dict) and 'bytes' in v else v for v in json.loads(text)]
+
+
+def response_code(response: bytes) -> int:
+    """
+    :return: the negative response code of a negative response, the response SID of a positive one, None for no
+    response
+    """
+    if not response:
+        return None
+    if response[0] == ResponseCodes.NEGATIVE_RESPONSE:
+        return response[2] if len(response) >= 3 else None
+    return response[0]
+
+
+class ResultStore(object):
+    """
+    keeps scan results in an sqlite3 database, across runs
+
+    results are buffered and written in batches, in a single transaction each, so the scan loop isn't held up by
+    the disk. results are indexed by ECU, service, parameter values and response code, and by request, which is
+    what has_recent() uses to skip combinations scanned recently. only results with a final outcome (Hit or Miss)
+    count for that. the store can be passed to a SearchRunner, or its
+    add() used as result sink
+    """
+    def __init__(self, filename: str, batch_size: int = 500, flush_interval: float = 1.0, run_id: str = None):
+        """
+        :param filename: the database file, created if it doesn't exist. ':memory:' for a temporary store
+        :param batch_size: write after this many results
+        :param flush_interval: write results older than this, in s
+        :param run_id: tags the results of this run, a random one if None
+        """
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.run_id = run_id if run_id is not None else uuid.uuid4().hex
+        self.connection = sqlite3.connect(filename)
+        # WAL keeps readers and the writer out of each other's way, NORMAL syncs on checkpoints only
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+        # rows not written yet, and the latest of them with a final outcome per (ecu_id, request), for has_recent()
+        self.buffer = []
+        self.buffered_requests = {}
+        self.last_flush = time.monotonic()
+        self.row_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, values: list, request: bytes, response: bytes, outcome=None, ecu_id: int = None) -> None:
+        """
+        store a result. the signature matches SearchRunner's result sink
+        :param values: the combination, None if the request didn't come from a search
+        :param request: the raw request
+        :param response: the raw response, b'' or None on timeout
+        :param outcome: how the response was classified, e.g. a search_runner.Outcome. has_recent() only counts
+        results with a final outcome
+        :param ecu_id: the ECU that was asked
+        """
+        request = bytes(request)
+        response = bytes(response) if response is not None else None
+        row = (self.run_id, time.time(), ecu_id, request[0] if request else None, encode_values(values), request,
+               response, None if not response else int(response[0] != ResponseCodes.NEGATIVE_RESPONSE),
+               response_code(response), getattr(outcome, 'name', outcome))
+        self.buffer.append(row)
+        if row[9] in FINAL_OUTCOMES:
+            self.buffered_requests[(ecu_id, request)] = row
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        write all buffered results, in one transaction
+        """
+        if self.buffer:
+            with self.connection:
+                self.connection.executemany(f'INSERT INTO results ({", ".join(COLUMNS)}) '
+                                            f'VALUES ({", ".join("?" * len(COLUMNS))})', self.buffer)
+            self.row_count += len(self.buffer)
+            self.buffer = []
+            self.buffered_requests = {}
+        self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+    def recent_result(self, ecu_id: int, request: bytes, max_age: float) -> bytes:
+        """
+        :param max_age: in s
+        :return: the latest response to request from ecu_id with a final outcome (FINAL_OUTCOMES), if it isn't older
+        than max_age. busy responses, lost sessions, timeouts and results without an outcome don't count. None if
+        there is none
+        """
+        request = bytes(request)
+        row = self.buffered_requests.get((ecu_id, request))
+        if row is not None and row[6] and row[1] >= time.time() - max_age:
+            return row[6]
+        found = self.connection.execute(
+            f'SELECT response FROM results WHERE ecu_id IS ? AND request = ? AND time >= ? AND response IS NOT NULL '
+            f'AND length(response) > 0 AND outcome IN ({", ".join("?" * len(FINAL_OUTCOMES))}) '
+            f'ORDER BY time DESC LIMIT 1', (ecu_id, request, time.time() - max_age) + FINAL_OUTCOMES).fetchone()
+        return found[0] if found is not None else None
+
+    def has_recent(self, ecu_id: int, request: bytes, max_age: float) -> bool:
+        """
+        :return: True if request got a response with a final outcome from ecu_id within the last max_age seconds
+        """
+        return self.recent_result(ecu_id, request, max_age) is not None
+
+    def query(self, ecu_id: int = None, service: int = None, response_code: int = None, positive: bool = None,
+              run_id: str = None, since: float = None, latest_only: bool = False) -> list:
+        """
+        search the stored results, all conditions given have to match
+        :param response_code: see response_code()
+        :param positive: True for positive responses only, False for negative ones only
+        :param since: only results from this time (time.time()) on
+        :param latest_only: only the latest result per ECU and request, to dedupe repeated scans
+        :return: a list of dicts, one per result, ordered by time
+        """
+        self.flush()
+        conditions = []
+        arguments = []
+        for column, value in (('ecu_id', ecu_id), ('service', service), ('response_code', response_code),
+                              ('run_id', run_id)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                arguments.append(value)
+        if positive is not None:
+            conditions.append('positive = ?')
+            arguments.append(int(positive))
+        if since is not None:
+            conditions.append('time >= ?')
+            arguments.append(since)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        if latest_only:
+            # sqlite takes the other columns from the row with the max()
+            statement = f'SELECT {", ".join(COLUMNS)}, max(time) FROM results{where} GROUP BY ecu_id, request ' \
+                        f'ORDER BY time'
+        else:
+            statement = f'SELECT {", ".join(COLUMNS)} FROM results{where} ORDER BY time'
+        results = []
+        for row in self.connection.execute(statement, arguments):
+            result = dict(zip(COLUMNS, row))
+            result['parameters'] = decode_values(result['parameters'])
+            result['positive'] = None if result['positive'] is None else bool(result['positive'])
+            results.append(result)
+        return results
+
+    def hits(self, ecu_id: int = None, service: int = None) -> list:
+        """
+        :return: the latest positive result per ECU and request, over all runs
+        """
+        return self.query(ecu_id=ecu_id, service=service, positive=True, latest_only=True)
+
+    def runs(self) -> list:
+        """
+        :return: a list of (run id, first result time, number of results) tuples
+        """
+        self.flush()
+        return self.connection.execute('SELECT run_id, min(time), count(*) FROM results GROUP BY run_id '
+                                       'ORDER BY min(time)').fetchall()
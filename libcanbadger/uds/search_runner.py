@@ -0,0 +1,353 @@
+import time
+from enum import Enum
+
+from libcanbadger.search.search import Search
+from libcanbadger.uds.uds_constants import ResponseCodes, AdditionalResponseCodes
+
+SESSION_LOST_RESPONSE_CODES = (
+    AdditionalResponseCodes.SERVICE_NOT_SUPPORTED_IN_ACTIVE_SESSION,
+    AdditionalResponseCodes.SUBFUNCTION_NOT_SUPPORTED_IN_ACTIVE_SESSION,
+)
+
+# negative responses that mean "nothing here", adaptive search strategies move on from their neighbourhood
+DEAD_END_RESPONSE_CODES = (
+    ResponseCodes.REQUEST_OUT_OF_RANGE,
+    ResponseCodes.SERVICE_NOT_SUPPORTED,
+    ResponseCodes.SUBFUNCTION_NOT_SUPPORTED,
+)
+
+
+class Outcome(Enum):
+    Hit = 0
+    Miss = 1
+    Timeout = 2
+    Busy = 3
+    SessionLost = 4
+
+
+def classify_response(values: list, response: bytes) -> Outcome:
+    """
+    the default response classifier: positive responses are hits, BUSY_REPEAT_REQUEST means slow down, and
+    "not supported in active session" means the ECU fell back to the default session
+    """
+    if response is None or response == b'':
+        return Outcome.Timeout
+    if response[0] != ResponseCodes.NEGATIVE_RESPONSE:
+        return Outcome.Hit
+    if len(response) >= 3:
+        if response[2] == ResponseCodes.BUSY_REPEAT_REQUEST:
+            return Outcome.Busy
+        if response[2] in SESSION_LOST_RESPONSE_CODES:
+            return Outcome.SessionLost
+    return Outcome.Miss
+
+
+def search_hit(outcome: Outcome, response: bytes) -> bool:
+    """
+    what a search learns from a result, see Search.report()
+    :return: True for hits, False for dead ends (a negative response in DEAD_END_RESPONSE_CODES), None else
+    """
+    if outcome == Outcome.Hit:
+        return True
+    if outcome == Outcome.Miss and len(response) >= 3 and response[0] == ResponseCodes.NEGATIVE_RESPONSE \
+            and response[2] in DEAD_END_RESPONSE_CODES:
+        return False
+    return None
+
+
+def read_data_by_id_builder(values: list) -> bytes:
+    """
+    request builder for DID scans, the first parameter is the DID
+    """
+    return b'\x22' + values[0].to_bytes(2, byteorder='big')
+
+
+def concat_request_builder(widths: list) -> callable:
+    """
+    :param widths: the byte width of every integer parameter, bytes values are taken as they are
+    :return: a request builder concatenating all parameter values, e.g. concat_request_builder([1, 1]) for
+    (service, subfunction) scans
+    """
+    def build(values: list) -> bytes:
+        request = b''
+        for value, width in zip(values, widths):
+            request += value if isinstance(value, bytes) else value.to_bytes(width, byteorder='big')
+        return request
+    return build
+
+
+class TokenBucket(object):
+    """
+    a token bucket rate limit whose rate is adapted with additive increase, multiplicative decrease (AIMD)
+    every success adds increase requests/s, every sign of overload multiplies the rate by decrease. the rate ends
+    up oscillating just below what the ECU tolerates
+    """
+    def __init__(self, rate: float = 50.0, burst: float = 1.0, min_rate: float = 1.0, max_rate: float = None,
+                 increase: float = 1.0, decrease: float = 0.5, clock: callable = time.monotonic,
+                 sleep: callable = time.sleep):
+        """
+        :param rate: initial rate, in requests/s
+        :param burst: max number of requests sent back to back
+        :param min_rate: the rate is never decreased below this
+        :param max_rate: the rate is never increased beyond this, None for no limit
+        :param increase: requests/s added per success
+        :param decrease: factor applied to the rate on overload
+        :param clock: returns the current time in s, e.g. to run against a simulated clock
+        :param sleep: waits for a number of seconds, goes with clock
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase
+        self.decrease_factor = decrease
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.last_refill = clock()
+
+    def refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self) -> float:
+        """
+        wait for a token and take it
+        :return: the time waited, in s
+        """
+        self.refill()
+        waited = 0.0
+        if self.tokens < 1:
+            waited = (1 - self.tokens) / self.rate
+            self.sleep(waited)
+            self.refill()
+        self.tokens -= 1
+        return waited
+
+    def increase(self) -> None:
+        self.rate += self.increase_step
+        if self.max_rate is not None:
+            self.rate = min(self.rate, self.max_rate)
+
+    def decrease(self) -> None:
+        self.rate = max(self.rate * self.decrease_factor, self.min_rate)
+        # no burst right after overload
+        self.tokens = min(self.tokens, 0)
+
+
+class SearchRunner(object):
+    """
+    drives a Search against a uds Session, as fast as the ECU tolerates
+
+    every combination is turned into a request by request_builder, and the response is sorted into an Outcome by
+    classifier. requests are paced by a TokenBucket: successes speed up, busy responses and timeouts slow down, and
+    the combination is repeated. if the ECU drops the diagnostic session, it is reopened and the combination repeated.
+    all responses are reported to the search (Search.report()), so adaptive strategies and pruning rules see them,
+    search_hit() tells the strategies hits from dead ends.
+    hits go to result_sink, and are kept in hits. with a ResultStore, all results are stored, and combinations with a
+    recent result can be skipped
+    """
+    def __init__(self, session, search: Search, request_builder: callable = read_data_by_id_builder,
+                 classifier: callable = classify_response, result_sink: callable = None, sink_all: bool = False,
+                 rate_limit: TokenBucket = None, diagnostic_level: int = 0x01, timeout: float = None,
+                 max_retries: int = 3, reopen_after_timeouts: int = 3, max_reopen_attempts: int = 5,
+                 reopen_delay: float = 0.1, progress_callback: callable = None, progress_interval: float = 1.0,
+                 result_store=None, skip_recent: float = None):
+        """
+        :param session: the uds Session to use
+        :param search: the Search to run, it continues where it is
+        :param request_builder: turns a combination into a request (bytes)
+        :param classifier: called with (combination, response), returns an Outcome
+        :param result_sink: called with (combination, request, response, outcome) for every hit
+        :param sink_all: pass every combination to result_sink, not only hits
+        :param rate_limit: the TokenBucket to pace requests with, a default one if None
+        :param diagnostic_level: the diagnostic session to open before the scan and when it was lost, None to leave
+        the session alone
+        :param timeout: response timeout per request, in s. None uses the session's, based on the negotiated P2
+        :param max_retries: repeats of a combination after busy responses, timeouts or a lost session
+        :param reopen_after_timeouts: reopen the session after this many timeouts in a row
+        :param max_reopen_attempts: give up after this many failed attempts to reopen the session
+        :param reopen_delay: wait before the first reopen attempt, doubled for every further one, in s
+        :param progress_callback: called with status() every progress_interval seconds and at the end
+        :param progress_interval: in s
+        :param result_store: a ResultStore to keep every result in
+        :param skip_recent: with a result_store, don't send requests that got a Hit or Miss response within this many
+        seconds, the stored response is used instead
+        """
+        self.session = session
+        self.search = search
+        self.request_builder = request_builder
+        self.classifier = classifier
+        self.result_sink = result_sink
+        self.sink_all = sink_all
+        self.rate_limit = rate_limit if rate_limit is not None else TokenBucket()
+        self.diagnostic_level = diagnostic_level
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.reopen_after_timeouts = reopen_after_timeouts
+        self.max_reopen_attempts = max_reopen_attempts
+        self.reopen_delay = reopen_delay
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.result_store = result_store
+        self.skip_recent = skip_recent
+
+        # (combination, response) of all hits
+        self.hits = []
+        # combinations without a usable response after all retries
+        self.failed = []
+        # statistics of the last run
+        self.request_count = 0
+        self.outcome_counts = {outcome: 0 for outcome in Outcome}
+        self.reopen_count = 0
+        # combinations answered from the result store
+        self.stored_count = 0
+        self.wait_time = 0.0
+        self.elapsed = 0.0
+        self.start_position = 0
+        self.consecutive_timeouts = 0
+
+    def open_session(self) -> bool:
+        if self.diagnostic_level is None:
+            return True
+        response = self.session.request(bytes([0x10, self.diagnostic_level]), timeout=self.timeout)
+        return response is not None and len(response) > 0 and response[0] == 0x50
+
+    def reopen_session(self) -> None:
+        """
+        reopen the diagnostic session, with exponential backoff between attempts
+        """
+        self.reopen_count += 1
+        delay = self.reopen_delay
+        for attempt in range(self.max_reopen_attempts):
+            if attempt > 0 or self.consecutive_timeouts > 0:
+                # the ECU might be rebooting
+                time.sleep(delay)
+                self.wait_time += delay
+                delay *= 2
+            if self.open_session():
+                self.consecutive_timeouts = 0
+                return
+        raise Exception(f"SearchRunner: couldn't reopen the session after {self.max_reopen_attempts} attempts")
+
+    def try_combination(self, values: list, request: bytes) -> tuple:
+        """
+        send the request for a combination, repeating it while the outcome asks for it
+        :return: a tuple (response, outcome)
+        """
+        attempt = 0
+        while True:
+            self.wait_time += self.rate_limit.acquire()
+            response = self.session.request(request, timeout=self.timeout)
+            self.request_count += 1
+            outcome = self.classifier(values, response)
+            self.outcome_counts[outcome] += 1
+            if outcome in (Outcome.Hit, Outcome.Miss):
+                self.consecutive_timeouts = 0
+                self.rate_limit.increase()
+                return response, outcome
+            if outcome == Outcome.Busy:
+                self.rate_limit.decrease()
+            elif outcome == Outcome.Timeout:
+                self.rate_limit.decrease()
+                self.consecutive_timeouts += 1
+                if self.consecutive_timeouts >= self.reopen_after_timeouts:
+                    self.reopen_session()
+            elif outcome == Outcome.SessionLost:
+                self.reopen_session()
+            attempt += 1
+            if attempt > self.max_retries:
+                return response, outcome
+
+    def run(self, max_duration: float = None, max_requests: int = None) -> list:
+        """
+        run the search until it completes, or a limit is reached. it can be continued with another run()
+        :param max_duration: stop after this many seconds, None for no limit
+        :param max_requests: stop after this many requests, None for no limit
+        :return: the hits of all runs, as (combination, response) tuples
+        """
+        start_time = time.monotonic()
+        last_progress = start_time
+        self.request_count = 0
+        self.outcome_counts = {outcome: 0 for outcome in Outcome}
+        self.reopen_count = 0
+        self.stored_count = 0
+        self.wait_time = 0.0
+        self.start_position = self.search.strategy.progress()
+        if not self.open_session():
+            self.reopen_session()
+
+        while not self.search.has_completed():
+            self.elapsed = time.monotonic() - start_time
+            if (max_duration is not None and self.elapsed >= max_duration) \
+                    or (max_requests is not None and self.request_count >= max_requests):
+                break
+            values = self.search.next()
+            if values is None:
+                break
+            request = self.request_builder(values)
+            response = None
+            if self.result_store is not None and self.skip_recent is not None:
+                response = self.result_store.recent_result(self.session.ecu_id, request, self.skip_recent)
+            if response is not None:
+                outcome = self.classifier(values, response)
+                self.stored_count += 1
+            else:
+                response, outcome = self.try_combination(values, request)
+                if self.result_store is not None:
+                    self.result_store.add(values, request, response, outcome, ecu_id=self.session.ecu_id)
+            self.search.report(values, response, search_hit(outcome, response))
+            if outcome == Outcome.Hit:
+                self.hits.append((values, response))
+            elif outcome != Outcome.Miss:
+                self.failed.append(values)
+            if self.result_sink is not None and (self.sink_all or outcome == Outcome.Hit):
+                self.result_sink(values, request, response, outcome)
+            if self.progress_callback is not None and time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                self.elapsed = last_progress - start_time
+                self.progress_callback(self.status())
+
+        self.elapsed = time.monotonic() - start_time
+        if self.result_store is not None:
+            self.result_store.flush()
+        if self.progress_callback is not None:
+            self.progress_callback(self.status())
+        return self.hits
+
+    def combinations_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return (self.search.strategy.progress() - self.start_position) / self.elapsed
+
+    def eta(self) -> float:
+        """
+        :return: estimated time (in s) until the search completes, at the speed of this run. None if unknown
+        """
+        speed = self.combinations_per_second()
+        if speed <= 0:
+            return None
+        return (self.search.length() - self.search.strategy.progress()) / speed
+
+    def status(self) -> dict:
+        """
+        :return: a dict with the progress (combinations done, total and fraction), the statistics of the current run
+        (requests, hits, outcome counts, session reopens, combinations answered from the result store, time spent
+        waiting for the rate limit), the current rate limit, combinations/s, elapsed time and ETA in s
+        """
+        return {
+            'done': self.search.strategy.progress(),
+            'total': self.search.length(),
+            'progress': self.search.progress() if self.search.length() else 1.0,
+            'requests': self.request_count,
+            'hits': len(self.hits),
+            'outcomes': {outcome.name: count for outcome, count in self.outcome_counts.items()},
+            'reopens': self.reopen_count,
+            'stored': self.stored_count,
+            'wait_time': self.wait_time,
+            'rate_limit': self.rate_limit.rate,
+            'combinations_per_second': self.combinations_per_second(),
+            'elapsed': self.elapsed,
+            'eta': self.eta(),
+        }
@@ -0,0 +1,255 @@
+import json
+import time
+
+from libcanbadger.uds.uds_constants import ResponseCodes
+
+LOCKOUT_RESPONSE_CODES = (ResponseCodes.EXCEEDED_NUMBER_OF_ATTEMPTS, ResponseCodes.REQUIRED_TIME_DELAY_NOT_EXPIRED)
+
+
+class SeedHarvester(object):
+    """
+    collects SecurityAccess (0x27) seeds as fast as the ECU hands them out
+
+    ECUs either return a new seed for every request, or the same one until a key was tried or the ECU was reset. the
+    harvester finds out which, and refreshes the seed with a (deliberately wrong) key attempt or a reset, whichever
+    turned out cheaper per seed so far, lockouts included. a lockout (NRC 0x36/0x37) is cleared with a reset if that
+    works on this ECU, otherwise it is waited out. every seed is appended to an NDJSON file as soon as it arrives
+    """
+    def __init__(self, session, filename: str, level: int = 0x01, diagnostic_level: int = 0x03,
+                 reset_type: int = 0x01, reset_delay: float = 0.5, lockout_delay: float = 10.0,
+                 max_lockout_delay: float = 600.0, refresh_method: str = None, key_callback: callable = None,
+                 timeout: float = 0.2, max_failures: int = 10):
+        """
+        :param session: the uds Session to use
+        :param filename: seeds are appended to this file, one JSON object per line
+        :param level: the security level to request seeds for (odd)
+        :param diagnostic_level: diagnostic session to enter before requesting seeds, and after every reset
+        :param reset_type: ECUReset subfunction
+        :param reset_delay: time (in s) the ECU needs to come back after a reset
+        :param lockout_delay: initial wait (in s) for a lockout that survives resets, doubled while it doesn't expire
+        :param max_lockout_delay: upper bound for the lockout wait, in s
+        :param refresh_method: 'key' or 'reset' to always refresh seeds that way, None picks the faster one
+        :param key_callback: optional, returns the key to send for a seed. defaults to an all-zero key
+        :param timeout: response timeout per request, in s
+        :param max_failures: stop after this many failed seed requests in a row
+        """
+        self.session = session
+        self.filename = filename
+        self.level = level
+        self.diagnostic_level = diagnostic_level
+        self.reset_type = reset_type
+        self.reset_delay = reset_delay
+        self.lockout_delay = lockout_delay
+        self.max_lockout_delay = max_lockout_delay
+        self.refresh_method = refresh_method
+        self.key_callback = key_callback
+        self.timeout = timeout
+        self.max_failures = max_failures
+
+        # what we learned about the ECU, None while unknown
+        self.new_seed_per_request = None
+        self.reset_clears_lockout = None
+        # maps refresh methods to [time spent, seeds gained]
+        self.method_stats = {'key': [0.0, 0], 'reset': [0.0, 0]}
+
+        # statistics
+        self.seed_count = 0
+        self.unique_seeds = set()
+        self.reset_count = 0
+        self.key_attempts = 0
+        self.lockout_count = 0
+        self.wait_time = 0.0
+        self.elapsed = 0.0
+
+    def enter_session(self) -> bool:
+        if self.diagnostic_level is None:
+            return True
+        response = self.session.request(bytes([0x10, self.diagnostic_level]), timeout=self.timeout)
+        return len(response) > 0 and response[0] == 0x50
+
+    def reset_ecu(self) -> bool:
+        self.session.request(bytes([0x11, self.reset_type]), timeout=self.timeout)
+        self.reset_count += 1
+        time.sleep(self.reset_delay)
+        return self.enter_session()
+
+    def request_seed(self) -> tuple:
+        """
+        :return: a tuple (seed, negative response code). both are None on timeout or garbage
+        """
+        response = self.session.request(bytes([0x27, self.level]), timeout=self.timeout)
+        if len(response) > 2 and response[0] == 0x67 and response[1] == self.level:
+            return response[2:], None
+        if len(response) >= 3 and response[0] == ResponseCodes.NEGATIVE_RESPONSE:
+            return None, response[2]
+        return None, None
+
+    def send_key(self, seed: bytes) -> int:
+        """
+        :return: the negative response code, or None if the key was accepted or nothing came back
+        """
+        key = self.key_callback(seed) if self.key_callback is not None else bytes(len(seed))
+        self.key_attempts += 1
+        response = self.session.request(bytes([0x27, self.level + 1]) + key, timeout=self.timeout)
+        if len(response) >= 3 and response[0] == ResponseCodes.NEGATIVE_RESPONSE:
+            return response[2]
+        return None
+
+    def choose_method(self) -> str:
+        if self.refresh_method is not None:
+            return self.refresh_method
+        # try both a few times, then stick with the cheaper one
+        for method, (spent, seeds) in self.method_stats.items():
+            if seeds < 3:
+                return method
+        return min(self.method_stats, key=lambda m: self.method_stats[m][0] / self.method_stats[m][1])
+
+    def write_seed(self, f, seed: bytes, method: str) -> None:
+        self.seed_count += 1
+        self.unique_seeds.add(seed)
+        f.write(json.dumps({'time': time.time(), 'level': self.level, 'seed': seed.hex(), 'method': method,
+                            'reset_count': self.reset_count}) + '\n')
+        f.flush()
+
+    def run(self, count: int = None, duration: float = None, progress_callback: callable = None) -> dict:
+        """
+        harvest seeds until count seeds were collected or duration passed, whichever comes first
+        :param count: number of seeds to collect, None for no limit
+        :param duration: max run time in s, None for no limit
+        :param progress_callback: called after every seed with (seed, number of seeds, seeds/minute)
+        :return: the report(), see there
+        """
+        # statistics are per run, what was learned about the ECU is kept
+        self.seed_count = 0
+        self.unique_seeds = set()
+        self.reset_count = 0
+        self.key_attempts = 0
+        self.lockout_count = 0
+        self.wait_time = 0.0
+        start_time = time.monotonic()
+        delay = self.lockout_delay
+        failures = 0
+        last_seed = None
+        # a refresh happened since the last seed was written, so the next seed counts even if it repeats
+        fresh = True
+        method = None
+        refresh_start = start_time
+        # the last lockout was cleared by a reset / waited out
+        lockout_reset = False
+        lockout_wait = False
+
+        with open(self.filename, 'a+') as f:
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != '\n':
+                    # an interrupted run left a partial line behind, don't glue the first seed to it
+                    f.write('\n')
+            if not self.enter_session():
+                failures += 1
+            while (count is None or self.seed_count < count) and failures <= self.max_failures:
+                self.elapsed = time.monotonic() - start_time
+                if duration is not None and self.elapsed >= duration:
+                    break
+                seed, response_code = self.request_seed()
+
+                if seed is not None:
+                    failures = 0
+                    if lockout_reset and self.reset_clears_lockout is None:
+                        self.reset_clears_lockout = True
+                    lockout_reset = lockout_wait = False
+                    if any(seed) and (fresh or seed != last_seed):
+                        if not fresh and self.new_seed_per_request is None:
+                            self.new_seed_per_request = True
+                        if method is not None:
+                            self.method_stats[method][0] += time.monotonic() - refresh_start
+                            self.method_stats[method][1] += 1
+                        self.write_seed(f, seed, method)
+                        last_seed = seed
+                        fresh = False
+                        method = None
+                        if progress_callback is not None:
+                            self.elapsed = time.monotonic() - start_time
+                            progress_callback(seed, self.seed_count, self.seeds_per_minute())
+                        if self.new_seed_per_request is not False:
+                            # the next request may bring a new seed by itself
+                            continue
+                    elif any(seed) and self.new_seed_per_request is None:
+                        self.new_seed_per_request = False
+
+                    # get the ECU to hand out a new seed
+                    method = self.choose_method() if any(seed) else 'reset'
+                    refresh_start = time.monotonic()
+                    fresh = True
+                    if method == 'key':
+                        self.send_key(seed)
+                    else:
+                        self.reset_ecu()
+
+                elif response_code in LOCKOUT_RESPONSE_CODES:
+                    if not lockout_reset and not lockout_wait:
+                        self.lockout_count += 1
+                    fresh = True
+                    if lockout_reset and self.reset_clears_lockout is None:
+                        # still locked right after a reset
+                        self.reset_clears_lockout = False
+                    if self.reset_clears_lockout is False:
+                        if lockout_wait:
+                            # waited, but not long enough
+                            delay = min(delay * 2, self.max_lockout_delay)
+                        wait = delay
+                        if duration is not None:
+                            # don't wait past the end of the run
+                            wait = min(wait, max(duration - (time.monotonic() - start_time), 0.0))
+                        time.sleep(wait)
+                        self.wait_time += wait
+                        lockout_wait = True
+                        lockout_reset = False
+                    else:
+                        self.reset_ecu()
+                        lockout_reset = True
+
+                else:
+                    failures += 1
+                    fresh = True
+                    self.reset_ecu()
+
+        self.elapsed = time.monotonic() - start_time
+        return self.report()
+
+    def seeds_per_minute(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.seed_count * 60 / self.elapsed
+
+    def report(self) -> dict:
+        """
+        :return: a dict with the statistics of the last run: seeds, unique seeds, resets, key attempts, lockouts,
+        time spent waiting for lockouts, run time and seeds/minute
+        """
+        return {
+            'seeds': self.seed_count,
+            'unique_seeds': len(self.unique_seeds),
+            'resets': self.reset_count,
+            'key_attempts': self.key_attempts,
+            'lockouts': self.lockout_count,
+            'wait_time': self.wait_time,
+            'elapsed': self.elapsed,
+            'seeds_per_minute': self.seeds_per_minute(),
+            'new_seed_per_request': self.new_seed_per_request,
+            'reset_clears_lockout': self.reset_clears_lockout,
+        }
+
+    @staticmethod
+    def read_seeds(filename: str) -> list:
+        """
+        :return: the seeds (bytes) of a harvest file, in order
+        """
+        seeds = []
+        with open(filename, 'r') as f:
+            for line in f:
+                try:
+                    seeds.append(bytes.fromhex(json.loads(line)['seed']))
+                except (ValueError, KeyError):
+                    # e.g. the last line of an interrupted run
+                    continue
+        return seeds
@@ -27,11 +27,20 @@ from libcanbadger.ethernet_message import EthernetMessage, EthernetMessageType,
 from libcanbadger.interface import InterfaceConnectionStatus
 from libcanbadger.iso_tp.iso_tp_handler import IsoTpHandler
 from libcanbadger.iso_tp.iso_tp_message import  IsoTpRxMessageStates
+from libcanbadger.uds.uds_constants import ResponseCodes, AdditionalResponseCodes
+from libcanbadger.uds.tester_present_scheduler import TesterPresentScheduler, get_default_scheduler
+from libcanbadger.uds.response_router import ResponseRouter, response_sid
+from libcanbadger.uds.response_cache import ResponseCache
+import os
 import struct
 import threading
 import time
 
 
+# TransferData payload limit: 4095 bytes of IsoTp, minus SID and block sequence counter
+MAX_TRANSFER_DATA_LENGTH = 4093
+
+
 class DiagnosticSession(Enum):
     NoSession = 0
     DefaultSession = 1,
@@ -47,18 +56,41 @@ class SessionStatus(Enum):
     Failed = 3
 
 
-# send a tester present message to keep up the connection
-def tester_present(session, stop_event, mute_event):
-    while not stop_event.is_set():
-        data = b'\x3e\x80'
-        if not mute_event.is_set():
-            session.isotp_handler.send_data(session.tester_id, data)
-        time.sleep(0.5)
+class ServiceTimingStats(object):
+    """
+    response timing statistics for a single uds service
+    """
+    def __init__(self, sid: int):
+        self.sid = sid
+        self.request_count = 0
+        self.timeout_count = 0
+        # number of response pending replies over all requests, and the most for a single request
+        self.pending_count = 0
+        self.max_pending = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = None
+
+    def record(self, duration: float, pending_count: int, timed_out: bool) -> None:
+        self.request_count += 1
+        if timed_out:
+            self.timeout_count += 1
+        self.pending_count += pending_count
+        self.max_pending = max(self.max_pending, pending_count)
+        self.total_time += duration
+        self.min_time = duration if self.min_time is None else min(self.min_time, duration)
+        self.max_time = duration if self.max_time is None else max(self.max_time, duration)
+
+    def average_time(self) -> float:
+        if self.request_count == 0:
+            return 0.0
+        return self.total_time / self.request_count
 
 
 class Session:
     def __init__(self, interface=None, tester_id: int = None, ecu_id: int = None,
-                 use_padding: bool = True, padding: int = 0xAA, use_extended_ids=False):
+                 use_padding: bool = True, padding: int = 0xAA, use_extended_ids=False,
+                 tp_scheduler: TesterPresentScheduler = None, router: ResponseRouter = None):
         # Session expects a valid and connected interface
         if interface is None:
             raise Exception("UDS Session needs a valid interface.")
@@ -76,15 +108,50 @@ class Session:
         self.padding = padding
         self.use_extended_ids = use_extended_ids
 
+        # with a router, requests and responses go through it instead of the IsoTpHandler, so several sessions can
+        # share one interface with requests in flight at the same time
+        if router is not None and ecu_id is None:
+            raise Exception("UDS Session needs an ecu id to use a response router.")
+        self.router = router
+        self.pending_request = None
+        # responses that didn't answer the request they arrived for, e.g. late responses to timed out requests
+        self.stale_response_count = 0
+
         # create IsoTpHandler with given interface
         self.isotp_handler = IsoTpHandler(interface=self.interface, sender_id=self.tester_id, padding_byte=self.padding if self.use_padding else None)
 
         self.diagnostic_level = DiagnosticSession.NoSession
         self.status = SessionStatus.Setup
 
-        self.tp_thread = None
-        self.halt_tp = threading.Event()
-        self.mute_tp = threading.Event()
+        # tester present is sent by a scheduler shared between sessions
+        self.tp_scheduler = tp_scheduler
+        self.tp_interval = 2.0
+        self.tp_muted = False
+        # held while a request is active, the scheduler doesn't send tester present in between
+        self.request_lock = threading.Lock()
+        # monotonic time of the last request, recent requests make tester present unnecessary
+        self.last_activity = 0.0
+
+        # P2 and P2* server timings in s, updated when a session is started
+        self.p2 = 0.05
+        self.p2_star = 5.0
+        # added to P2 for the default response timeout, covers the transport (IsoTp, CANBadger round trip)
+        self.p2_tolerance = 0.15
+        # max number of response pending replies accepted for a single request
+        self.max_response_pending = 10
+        # maps SIDs to their ServiceTimingStats
+        self.timing_stats = {}
+
+        # optional cache for read-only requests, see enable_cache()
+        self.cache = None
+
+        # ReadDataByIdentifier batching: DIDs per request, grown after every accepted batch and halved after a
+        # rejected one, and the data length of every DID read so far
+        self.did_batch_size = 2
+        self.max_did_batch_size = 64
+        # largest batch size that wasn't rejected yet, None until the ECU rejected one
+        self.did_batch_limit = None
+        self.did_lengths = {}
 
     def __enter__(self):
         return self
@@ -94,27 +161,140 @@ class Session:
         pass
 
     # sends uds request and optionally returns response
-    def request(self, data, wait_for_response=True, timeout=0.2):
-        # disable tester present while request is active
-        self.set_mute_tp(True)
+    def request(self, data, wait_for_response=True, timeout=None):
+        """
+        send a uds request and wait for its final response
+        response pending replies (7F SID 78) extend the wait to P2*, up to max_response_pending times
+        :param data: the raw request
+        :param wait_for_response: if False, return right after sending
+        :param timeout: max time (in s) to wait for the first response, response_timeout() if None
+        :return: the response, b'' on timeout or None if wait_for_response is False
+        """
+        if timeout is None:
+            timeout = self.response_timeout()
+        if self.cache is not None:
+            if self.cache.invalidates(data):
+                self.cache.invalidate(self.ecu_id)
+            elif wait_for_response and self.cache.is_cacheable(data):
+                response = self.cache.get(self.ecu_id, data)
+                if response is not None:
+                    return response
+
+        # tester present is held back while the request is active
+        with self.request_lock:
+            start = time.monotonic()
+            self.send_request(data, expect_response=wait_for_response)
+
+            response = None
+            if wait_for_response:
+                if self.router is not None:
+                    response = self.router.wait(self.pending_request, timeout=timeout)
+                    pending_count = self.pending_request.pending_count
+                else:
+                    response, pending_count = self.receive_final_response(data[0], timeout)
+                self.record_timing(data[0], time.monotonic() - start, pending_count, response)
+                if self.cache is not None:
+                    self.cache.put(self.ecu_id, data, response)
+
+            self.last_activity = time.monotonic()
+
+        if wait_for_response:
+            return response
+
+    def receive_final_response(self, sid: int, timeout: float) -> tuple:
+        """
+        receive responses until one answers the service sid with something other than response pending
+        responses to other services are stale, they are counted and dropped
+        :param sid: the SID of the request
+        :param timeout: P2, max time (in s) to wait for the first response
+        :return: a tuple (response, number of response pending replies). the response is b'' on timeout
+        """
+        deadline = time.monotonic() + timeout
+        pending_count = 0
+        while True:
+            response = self.receive_response(timeout=max(deadline - time.monotonic(), 0))
+            if response is None or response == b'':
+                return b'', pending_count
+            if response_sid(response) != sid:
+                self.stale_response_count += 1
+                continue
+            if not self.is_response_pending(response, sid) or pending_count >= self.max_response_pending:
+                return response, pending_count
+            pending_count += 1
+            deadline = time.monotonic() + self.p2_star
+
+    def enable_cache(self, max_entries: int = 256, ttl: float = 60.0, rom_ranges: list = None,
+                     cache: ResponseCache = None) -> ResponseCache:
+        """
+        cache positive responses to read-only requests (0x22, 0x19 and 0x23 within rom_ranges)
+        session changes, resets and write services invalidate the cached responses of this ECU
+        :param max_entries: max number of cached responses
+        :param ttl: time (in s) a response stays valid
+        :param rom_ranges: list of (start address, end address) tuples, end exclusive, of read-only memory
+        :param cache: an existing ResponseCache to share with other sessions, the other parameters are ignored then
+        :return: the cache in use
+        """
+        self.cache = cache if cache is not None else ResponseCache(max_entries, ttl, rom_ranges)
+        return self.cache
+
+    def disable_cache(self) -> None:
+        self.cache = None
 
+    def send_request(self, data, expect_response: bool = True) -> bool:
+        """
+        transmit a raw uds request, subclasses can override this to use a different transport
+        :param expect_response: False if the response won't be waited for
+        :return: True if the request was sent
+        """
+        if self.router is not None:
+            self.pending_request = self.router.submit(self.tester_id, self.ecu_id, data, expect_response)
+            if not expect_response and not self.pending_request.done:
+                # a multi-frame request, make sure it goes out completely
+                self.router.wait(self.pending_request, timeout=self.response_timeout())
+            return True
         # let the IsoTpHandler and IsoTpMessage classes handle isotp and padding
-        self.isotp_handler.send_data(self.tester_id, data)
+        return self.isotp_handler.send_data(self.tester_id, data, wait_for_flow_control=True, fc_arb_id=self.ecu_id)
 
-        response = None
-        if wait_for_response:
-            if self.ecu_id is None:
-                # accept response from ANY ecu
-                response = self.isotp_handler.receive_message(timeout=timeout)
-            else:
-                response = self.isotp_handler.receive_message(arb_id=self.ecu_id, timeout=timeout)
+    def receive_response(self, timeout=0.2) -> bytes:
+        """
+        receive a single raw uds response, subclasses can override this to use a different transport
+        :param timeout: max time (in s) to wait for the response to start
+        :return: the response or b'' on timeout
+        """
+        if self.ecu_id is None:
+            # accept response from ANY ecu
+            return self.isotp_handler.receive_message(timeout=timeout)
+        else:
+            return self.isotp_handler.receive_message(arb_id=self.ecu_id, timeout=timeout)
 
-        # reenable tp
-        if self.status == SessionStatus.Idle:
-            self.set_mute_tp(False)
+    @staticmethod
+    def is_response_pending(response: bytes, sid: int) -> bool:
+        """
+        :return: True if response is a response pending (NRC 0x78) reply to the service sid
+        """
+        return response is not None and len(response) >= 3 and response[0] == ResponseCodes.NEGATIVE_RESPONSE \
+            and response[1] == sid and response[2] == AdditionalResponseCodes.RESPONSE_PENDING
 
-        if wait_for_response:
-            return response
+    def record_timing(self, sid: int, duration: float, pending_count: int, response: bytes) -> None:
+        stats = self.timing_stats.get(sid)
+        if stats is None:
+            stats = ServiceTimingStats(sid)
+            self.timing_stats[sid] = stats
+        stats.record(duration, pending_count, response is None or response == b'')
+
+    def response_timeout(self) -> float:
+        """
+        :return: the default time (in s) to wait for the first response: the negotiated P2 plus p2_tolerance
+        """
+        return self.p2 + self.p2_tolerance
+
+    def update_timing(self, response: bytes) -> None:
+        """
+        take over P2 and P2* from a positive DiagnosticSessionControl response, if the ECU reported them
+        """
+        if len(response) >= 6:
+            self.p2 = int.from_bytes(response[2:4], byteorder='big') / 1000
+            self.p2_star = int.from_bytes(response[4:6], byteorder='big') * 10 / 1000
 
     def start(self, diagnostic_level=1, timeout=1):
         data = b'\x10' + bytes([diagnostic_level])
@@ -126,6 +306,7 @@ class Session:
         response_byte = response[0]
         if response_byte == 0x50:
             self.status = SessionStatus.Idle
+            self.update_timing(response)
             # start sending TesterPresent periodically
             self.start_tp()
         elif response_byte == 0x7f:
@@ -134,16 +315,34 @@ class Session:
             print("unpredicted response")
             print(f"byte is {response[0]}...")
 
-    def request_upload(self, memory_address, memory_size,  data_format_id = 0x00):
-        request = b'\x35' + bytes([data_format_id])
-
+    def format_address_and_size(self, memory_address, memory_size) -> bytes:
+        """
+        :return: addressAndLengthFormatIdentifier, memoryAddress and memorySize, using as few bytes as possible
+        """
         addr_bytes = self.calc_byte_size(memory_address)
         size_bytes = self.calc_byte_size(memory_size)
-        add_len_byte = (size_bytes << 4) & 0xF0 + (addr_bytes & 0x0F)
+        add_len_byte = ((size_bytes << 4) & 0xF0) + (addr_bytes & 0x0F)
 
-        request += add_len_byte.to_bytes(1, byteorder='big')
+        request = add_len_byte.to_bytes(1, byteorder='big')
         request += memory_address.to_bytes(length=addr_bytes, byteorder='big', signed=False)
         request += memory_size.to_bytes(length=size_bytes, byteorder='big', signed=False)
+        return request
+
+    @staticmethod
+    def parse_max_block_length(response_data: bytes) -> int:
+        """
+        parse a RequestDownload/RequestUpload response (without the SID)
+        :return: maxNumberOfBlockLength, which includes the SID and block sequence counter, or 0 if invalid
+        """
+        if len(response_data) < 1:
+            return 0
+        length_bytes = response_data[0] >> 4
+        if length_bytes == 0 or len(response_data) < 1 + length_bytes:
+            return 0
+        return int.from_bytes(response_data[1:1 + length_bytes], byteorder='big')
+
+    def request_upload(self, memory_address, memory_size,  data_format_id = 0x00):
+        request = b'\x35' + bytes([data_format_id]) + self.format_address_and_size(memory_address, memory_size)
 
         # send request and interpret answer
         response = self.request(request)
@@ -153,15 +352,7 @@ class Session:
             return response[0] == 0x75, response[1:]
 
     def request_download(self, memory_address, memory_size, data_format_id = 0x00):
-        request = b'\x34' + bytes([data_format_id])
-
-        addr_bytes = self.calc_byte_size(memory_address)
-        size_bytes = self.calc_byte_size(memory_size)
-        add_len_byte = (size_bytes << 4) & 0xF0 + (addr_bytes & 0x0F)
-
-        request += add_len_byte
-        request += memory_address.to_bytes(length=addr_bytes, byteorder='big', signed=False)
-        request += memory_size.to_bytes(length=size_bytes, byteorder='big', signed=False)
+        request = b'\x34' + bytes([data_format_id]) + self.format_address_and_size(memory_address, memory_size)
 
         # send request and interpret answer
         response = self.request(request)
@@ -170,16 +361,137 @@ class Session:
         else:
             return response[0] == 0x74, response[1:]
 
-    def transfer_data(self, block_number, length):
-        if length > 4096:
+    def transfer_data(self, block_number, length, data=b''):
+        """
+        perform a single TransferData (0x36)
+        :param block_number: the block sequence counter, 0-255
+        :param length: max number of data bytes expected (upload) or sent (download) in this block
+        :param data: the data to send when downloading, empty when uploading
+        :return: a tuple (success, data). on success, data holds the block's data without the counter. success means
+        a positive response with the matching block sequence counter and at most length bytes of data
+        """
+        if length > MAX_TRANSFER_DATA_LENGTH or len(data) > length:
             raise Exception("Transfer size not supported")
 
-        request  = b'\x36' + block_number.to_bytes(1, byteorder='big')
+        request  = b'\x36' + block_number.to_bytes(1, byteorder='big') + data
         response = self.request(request)
         if response is None or response == b'':
             return False, b''
+        elif response[0] == 0x76 and len(response) >= 2 and response[1] == block_number \
+                and len(response) - 2 <= length:
+            return True, response[2:]
         else:
-            return response[0] == 0x76, response[1:]
+            return False, response[1:]
+
+    def request_transfer_exit(self):
+        response = self.request(b'\x37')
+        if response is None or response == b'':
+            return False, b''
+        else:
+            return response[0] == 0x77, response[1:]
+
+    def block_data_length(self, response_data: bytes) -> int:
+        """
+        :return: the number of data bytes per TransferData, as negotiated by a RequestDownload/RequestUpload
+        """
+        max_block_length = self.parse_max_block_length(response_data)
+        # the negotiated length includes SID and counter. IsoTp limits us further
+        return min(max_block_length - 2, MAX_TRANSFER_DATA_LENGTH) if max_block_length > 2 else 0
+
+    def upload_to_file(self, memory_address, memory_size, filename, data_format_id=0x00, retries=3,
+                       progress_callback: callable = None) -> bool:
+        """
+        read memory from the ECU with RequestUpload, TransferData and RequestTransferExit
+        the data is streamed to the file block by block
+        :param memory_address: address to start reading at
+        :param memory_size: number of bytes to read
+        :param filename: the file to write to
+        :param data_format_id: dataFormatIdentifier (compression and encryption), 0x00 for none
+        :param retries: how often a single block is requested again before we give up
+        :param progress_callback: called after every block with (bytes done, total bytes)
+        :return: True on success. on failure, the transfer is ended and no file is left behind
+        """
+        success, response_data = self.request_upload(memory_address, memory_size, data_format_id)
+        if not success:
+            return False
+        block_length = self.block_data_length(response_data)
+        if block_length == 0:
+            self.request_transfer_exit()
+            return False
+
+        block_number = 1
+        received = 0
+        # the data goes to a temporary file first, so a failed upload doesn't look like a complete dump
+        temp_filename = filename + '.part'
+        success = False
+        try:
+            with open(temp_filename, 'wb') as f:
+                while received < memory_size:
+                    for attempt in range(retries + 1):
+                        # the ECU repeats the last block if we repeat its counter
+                        block_success, data = self.transfer_data(block_number, block_length)
+                        if block_success and len(data) > 0:
+                            break
+                    else:
+                        # end the transfer, the ECU would stay in it otherwise
+                        self.request_transfer_exit()
+                        return False
+                    f.write(data)
+                    received += len(data)
+                    block_number = (block_number + 1) & 0xFF
+                    if progress_callback is not None:
+                        progress_callback(received, memory_size)
+
+            success, _ = self.request_transfer_exit()
+            if success:
+                os.replace(temp_filename, filename)
+            return success
+        finally:
+            if not success and os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    def download_from_file(self, memory_address, filename, data_format_id=0x00, retries=3,
+                           progress_callback: callable = None) -> bool:
+        """
+        write a file to the ECU with RequestDownload, TransferData and RequestTransferExit
+        the file is read in chunks of the negotiated block length
+        :param memory_address: address to start writing at
+        :param filename: the file to send
+        :param data_format_id: dataFormatIdentifier (compression and encryption), 0x00 for none
+        :param retries: how often a single block is sent again before we give up
+        :param progress_callback: called after every block with (bytes done, total bytes)
+        :return: True on success
+        """
+        memory_size = os.path.getsize(filename)
+        success, response_data = self.request_download(memory_address, memory_size, data_format_id)
+        if not success:
+            return False
+        block_length = self.block_data_length(response_data)
+        if block_length == 0:
+            self.request_transfer_exit()
+            return False
+
+        block_number = 1
+        sent = 0
+        with open(filename, 'rb') as f:
+            while True:
+                chunk = f.read(block_length)
+                if not chunk:
+                    break
+                for attempt in range(retries + 1):
+                    success, _ = self.transfer_data(block_number, len(chunk), chunk)
+                    if success:
+                        break
+                else:
+                    self.request_transfer_exit()
+                    return False
+                sent += len(chunk)
+                block_number = (block_number + 1) & 0xFF
+                if progress_callback is not None:
+                    progress_callback(sent, memory_size)
+
+        success, _ = self.request_transfer_exit()
+        return success
 
     def request_vin(self):
         success, vin = self.request_data_by_id(0xf187)
@@ -200,6 +512,137 @@ class Session:
             data = response[1:]
         return success, data
 
+    def read_dids(self, dids: list, did_lengths: dict = None) -> dict:
+        """
+        read many DIDs, packing several of them into each ReadDataByIdentifier request
+        the number of DIDs per request adapts to what the ECU accepts. DID lengths are learned from the responses, so
+        later responses can be split without guessing. rejected or ambiguous batches are read one DID at a time.
+        batches that time out are split for this call only, a timeout says nothing about how many DIDs fit
+        :param dids: the data identifiers to read
+        :param did_lengths: optional dict mapping DIDs to their data length, in addition to the learned ones
+        :return: a dict mapping every DID to its data, or None if it couldn't be read
+        """
+        if did_lengths:
+            self.did_lengths.update(did_lengths)
+        results = {}
+        todo = list(dict.fromkeys(dids))
+        # halves of batches that timed out, read before the rest
+        split = []
+        while split or todo:
+            if split:
+                batch = split.pop(0)
+            else:
+                batch = self.next_did_batch(todo)
+                batch_set = set(batch)
+                todo = [did for did in todo if did not in batch_set]
+            if len(batch) > 1:
+                response = self.request(b'\x22' + b''.join(did.to_bytes(2, byteorder='big') for did in batch))
+                parsed = self.parse_did_response(batch, response)
+                if parsed is not None:
+                    results.update(parsed)
+                    if self.did_batch_limit is None:
+                        self.did_batch_size = min(self.did_batch_size * 2, self.max_did_batch_size)
+                    else:
+                        # approach the limit we ran into before
+                        self.did_batch_size = min((self.did_batch_size + self.did_batch_limit + 1) // 2,
+                                                  self.did_batch_limit)
+                    continue
+                if response == b'':
+                    # e.g. a dropped frame, retry in halves without learning a limit from it
+                    split = [batch[:len(batch) // 2], batch[len(batch) // 2:]] + split
+                    continue
+                if (response[0] == ResponseCodes.NEGATIVE_RESPONSE and len(response) >= 3 and
+                        response[2] in (ResponseCodes.INCORRECT_MESSAGE_LENGTH_OR_INVALIDAD_FORMAT,
+                                        ResponseCodes.RESPONSE_TOO_LONG)):
+                    # too many DIDs (or too much data) for a single request, retry with smaller batches
+                    self.did_batch_limit = len(batch) - 1 if self.did_batch_limit is None \
+                        else min(self.did_batch_limit, len(batch) - 1)
+                    self.did_batch_size = max(len(batch) // 2, 1)
+                    todo = batch + todo
+                    continue
+            # fall back to reading them one by one
+            for did in batch:
+                results[did] = self.read_did(did)
+        return results
+
+    def read_did(self, did: int) -> bytes:
+        """
+        read a single DID and learn its length
+        :return: the DID's data or None if it couldn't be read
+        """
+        success, data = self.request_data_by_id(did)
+        if not success or data[:2] != did.to_bytes(2, byteorder='big'):
+            return None
+        self.did_lengths[did] = len(data) - 2
+        return data[2:]
+
+    def next_did_batch(self, todo: list) -> list:
+        # the response has to fit into IsoTp, as far as we know the lengths
+        batch = []
+        response_length = 1
+        for did in todo[:self.did_batch_size]:
+            response_length += 2 + self.did_lengths.get(did, 1)
+            if batch and response_length > 4095:
+                break
+            batch.append(did)
+        return batch
+
+    def parse_did_response(self, batch: list, response: bytes) -> dict:
+        """
+        split a ReadDataByIdentifier response into the data of the single DIDs
+        a DID of unknown length ends where one of the following requested DIDs starts. DIDs the ECU left out are not
+        supported
+        :return: a dict mapping the DIDs of the batch to their data or None, or None if the response can't be split
+        """
+        if response is None or len(response) < 1 or response[0] != 0x62:
+            return None
+        ids = [did.to_bytes(2, byteorder='big') for did in batch]
+        end = len(response)
+        # maps (position, batch index) to the best way to split response[position:] into the DIDs batch[index:]:
+        # (most DIDs found, number of splits (capped at 2) finding that many, first step as (did index, data end))
+        memo = {}
+
+        def best_split(position: int, index: int) -> tuple:
+            if position == end:
+                return 0, 1, None
+            key = (position, index)
+            if key in memo:
+                return memo[key]
+            best = (-1, 0, None)
+            for j in range(index, len(batch)):
+                if response[position:position + 2] != ids[j]:
+                    continue
+                length = self.did_lengths.get(batch[j])
+                if length is not None:
+                    ends = [position + 2 + length] if position + 2 + length <= end else []
+                else:
+                    ends = [e for e in range(position + 3, end + 1)
+                            if e == end or response[e:e + 2] in ids[j + 1:]]
+                for data_end in ends:
+                    found, ways, _ = best_split(data_end, j + 1)
+                    if ways == 0:
+                        continue
+                    if found + 1 > best[0]:
+                        best = (found + 1, ways, (j, data_end))
+                    elif found + 1 == best[0]:
+                        best = (best[0], min(best[1] + ways, 2), best[2])
+            memo[key] = best
+            return best
+
+        # a DID can be left out by the ECU or its data can contain the id of a later DID, so a response may split in
+        # more than one way. the split finding the most DIDs wins, a tie is ambiguous
+        found, ways, _ = best_split(1, 0)
+        if ways != 1:
+            return None
+        results = dict.fromkeys(batch)
+        position, index = 1, 0
+        while position != end:
+            j, data_end = memo[(position, index)][2]
+            results[batch[j]] = response[position + 2:data_end]
+            self.did_lengths[batch[j]] = data_end - position - 2
+            position, index = data_end, j + 1
+        return results
+
     def security_access(self, level: int, on_seed_callback: callable) -> tuple:
         """
         perform 0x27 security access
@@ -228,26 +671,26 @@ class Session:
 
 
     def start_tp(self):
-        # if there is still a thread running, stop it and start a new one
-        if self.tp_thread is not None:
-            self.halt_tp.set()
-            self.tp_thread.join()
-        self.halt_tp.clear()
-        self.mute_tp.clear()
-        self.tp_thread = threading.Thread(target=tester_present, args=(self, self.halt_tp, self.mute_tp))
-        self.tp_thread.start()
+        """
+        start sending TesterPresent periodically, restarting it if it was already running
+        """
+        if self.tp_scheduler is None:
+            self.tp_scheduler = get_default_scheduler()
+        self.tp_muted = False
+        self.tp_scheduler.register(self, interval=self.tp_interval)
 
     def stop_tp(self):
-        if self.tp_thread is not None:
-            self.halt_tp.set()
-            # self.tp_thread.join() don't wait!
-        self.tp_thread = None
+        """
+        stop sending TesterPresent. no tester present is sent for this session anymore once this returns
+        """
+        if self.tp_scheduler is not None:
+            self.tp_scheduler.unregister(self)
 
     def set_mute_tp(self, state: bool):
-        if state:
-            self.mute_tp.set()
-        else:
-            self.mute_tp.clear()
+        """
+        temporarily suspend tester present, without unregistering the session
+        """
+        self.tp_muted = state
 
     def calc_byte_size(self, value):
         # TODO improve this code to include a minimum length and maybe use a formula instead of ifelse
@@ -0,0 +1,183 @@
+import threading
+import time
+
+from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage
+
+
+class TesterPresentEntry(object):
+    """
+    a session registered with the TesterPresentScheduler
+    """
+    def __init__(self, session, interval: float, frame):
+        self.session = session
+        self.interval = interval
+        # the tester present frame is built once and sent as is
+        self.frame = frame
+        self.due_tick = 0
+        self.sending = False
+        self.cancelled = False
+        self.sent_count = 0
+        self.skipped_count = 0
+
+
+class TesterPresentScheduler(object):
+    """
+    keeps any number of uds sessions alive from a single thread
+
+    sessions are kept in a hashed timer wheel, so every tick only looks at the sessions that are due. a session that
+    had request traffic within the last interval doesn't need a keep-alive, its tester present is postponed instead.
+    the thread only runs while sessions are registered
+    """
+    def __init__(self, tick: float = 0.05, wheel_size: int = 128):
+        """
+        :param tick: resolution of the timer wheel, in s
+        :param wheel_size: number of slots in the timer wheel
+        """
+        self.tick = tick
+        self.wheel_size = wheel_size
+        self.wheel = [[] for _ in range(wheel_size)]
+        self.entries = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.start_time = time.monotonic()
+        self.current_tick = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def tick_at(self, timestamp: float) -> int:
+        return int((timestamp - self.start_time) / self.tick) + 1
+
+    def schedule(self, entry: TesterPresentEntry, timestamp: float) -> None:
+        # never schedule into the slot that is currently processed or before
+        entry.due_tick = max(self.tick_at(timestamp), self.current_tick + 1)
+        self.wheel[entry.due_tick % self.wheel_size].append(entry)
+
+    def register(self, session, interval: float = 2.0) -> None:
+        """
+        start sending tester present for a session
+        :param session: the uds session to keep alive
+        :param interval: max time (in s) between two messages to the ECU, must be well below its S3 timeout
+        """
+        payload = b'\x3e\x80'
+        padding = session.padding if session.use_padding else None
+        frame = IsoTpMessage(arb_id=session.tester_id, payload=payload, padding_byte=padding).format()[0]
+        with self.condition:
+            if session in self.entries:
+                self.cancel(self.entries[session])
+            entry = TesterPresentEntry(session, interval, frame)
+            self.entries[session] = entry
+            self.schedule(entry, time.monotonic() + interval)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='TesterPresentScheduler', daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def cancel(self, entry: TesterPresentEntry) -> None:
+        # entries stay in their slot until it is processed, cancelled ones are dropped there
+        entry.cancelled = True
+        del self.entries[entry.session]
+
+    def unregister(self, session) -> bool:
+        """
+        stop sending tester present for a session
+        once this returns, no more tester present frames will be sent for this session
+        :return: True if the session was registered
+        """
+        with self.condition:
+            entry = self.entries.get(session)
+            if entry is None:
+                return False
+            self.cancel(entry)
+            # don't return while the frame is still being sent
+            while entry.sending:
+                self.condition.wait()
+            return True
+
+    def is_registered(self, session) -> bool:
+        with self.condition:
+            return session in self.entries
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                if not self.entries:
+                    self.thread = None
+                    return
+                # catch up with all ticks that have passed, collecting the entries that are due
+                now = time.monotonic()
+                due = []
+                while self.current_tick < self.tick_at(now):
+                    self.current_tick += 1
+                    slot_index = self.current_tick % self.wheel_size
+                    slot = self.wheel[slot_index]
+                    remaining = []
+                    for entry in slot:
+                        if entry.cancelled:
+                            continue
+                        if entry.due_tick > self.current_tick:
+                            # due in a later round of the wheel
+                            remaining.append(entry)
+                        else:
+                            due.append(entry)
+                    self.wheel[slot_index] = remaining
+
+                to_send = []
+                for entry in due:
+                    session = entry.session
+                    last_activity = getattr(session, 'last_activity', 0.0)
+                    if now - last_activity < entry.interval:
+                        # the request traffic already keeps the session alive
+                        entry.skipped_count += 1
+                        self.schedule(entry, last_activity + entry.interval)
+                    elif session.tp_muted or not session.request_lock.acquire(blocking=False):
+                        # a request is running right now, check again soon
+                        self.schedule(entry, now + self.tick)
+                    else:
+                        entry.sending = True
+                        to_send.append(entry)
+
+            for entry in to_send:
+                try:
+                    entry.session.interface.send_frame(entry.frame)
+                finally:
+                    entry.session.request_lock.release()
+
+            with self.condition:
+                now = time.monotonic()
+                for entry in to_send:
+                    entry.sending = False
+                    entry.sent_count += 1
+                    if not entry.cancelled:
+                        self.schedule(entry, now + entry.interval)
+                self.condition.notify_all()
+                # sleep until the next tick, register() wakes us up early
+                self.condition.wait(max(self.start_time + self.current_tick * self.tick - time.monotonic(), 0)
+                                    + self.tick / 10)
+
+    def shutdown(self) -> None:
+        """
+        unregister all sessions and wait for the scheduler thread to finish
+        """
+        with self.condition:
+            for entry in list(self.entries.values()):
+                self.cancel(entry)
+            thread = self.thread
+            self.condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+default_scheduler = None
+default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> TesterPresentScheduler:
+    """
+    :return: the scheduler shared by all sessions that don't bring their own
+    """
+    global default_scheduler
+    with default_scheduler_lock:
+        if default_scheduler is None:
+            default_scheduler = TesterPresentScheduler()
+        return default_scheduler
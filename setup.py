@@ -4,10 +4,15 @@ setup(
     name='libcanbadger',
     version='1.0',
     packages=['libcanbadger', 'libcanbadger.uds',
-              'libcanbadger.util', 'libcanbadger.iso_tp', 'libcanbadger.search', 'libcanbadger.custom_exceptions'],
+              'libcanbadger.util', 'libcanbadger.iso_tp', 'libcanbadger.search', 'libcanbadger.custom_exceptions',
+              'libcanbadger.emulation'],
     url='',
     license='',
     author='Noelscher Consulting GmbH',
     author_email='canbadger@noelscher.com',
-    description='CANBadger library'
+    description='CANBadger library',
+    extras_require={
+        # vectorized batches of combinations, see Search.next_batch()
+        'batch': ['numpy'],
+    },
 )
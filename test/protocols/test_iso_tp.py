@@ -1,4 +1,5 @@
 import struct
+import time
 
 from libcanbadger.canbadger import CANBadger
 from libcanbadger.interface import InterfaceConnectionStatus
@@ -227,3 +228,69 @@ def test_iso_tp_handler_transmit():
     handler.rx_feed(Frame(payload=b'\x30\x00\x00\x00\x00\x00\x00\x00'))
     """
 
+
+
+class TrickleInterface(MockCanBadger):
+    """
+    keeps delivering unrelated frames, like a busy bus would
+    """
+    def receive_frame(self, can_ids=None, timeout=1):
+        if self.rx_sequence:
+            return self.rx_sequence.pop(0)
+        time.sleep(min(timeout, 0.005))
+        return Frame(arb_id=0x6aa, payload=b'\x03\x01\x02\x03')
+
+
+def test_iso_tp_handler_deadlines():
+    cb = TrickleInterface()
+    cb.connect()
+    handler = IsoTpHandler(interface=cb, sender_id=0x111, n_cr=0.05)
+
+    # unrelated traffic must not keep the wait for a first frame alive
+    start = time.monotonic()
+    pl = handler.receive_message(arb_id=0x123, timeout=0.05)
+    assert(pl == b'')
+    assert(time.monotonic() - start < 0.5)
+
+    # ..nor a transfer that stopped sending consecutive frames (N_Cr)
+    cb.rx_sequence.append(Frame(arb_id=0x123, payload=b'\x10\x16\x01\x02\x03\x04\x05\x06'))
+    start = time.monotonic()
+    pl = handler.receive_message(arb_id=0x123, timeout=1)
+    assert(pl == b'')
+    assert(time.monotonic() - start < 0.5)
+
+    # the overall transfer deadline applies as well
+    start = time.monotonic()
+    pl = handler.receive_message(arb_id=0x123, timeout=10, transfer_timeout=0.05)
+    assert(pl == b'')
+    assert(time.monotonic() - start < 0.5)
+
+
+def test_iso_tp_handler_flow_control():
+    cb = MockCanBadger()
+    cb.connect()
+    handler = IsoTpHandler(interface=cb, sender_id=0x123, n_bs=0.05)
+    payload = bytes(range(40))
+
+    # it should send blocks as requested by the receiver's flow control frames
+    cb.rx_sequence.append(Frame(arb_id=0x77a, payload=b'\x30\x02\x00'))
+    cb.rx_sequence.append(Frame(arb_id=0x77a, payload=b'\x31\x00\x00'))  # WAIT
+    cb.rx_sequence.append(Frame(arb_id=0x77a, payload=b'\x30\x00\xf1'))
+    assert(handler.send_data(0x123, payload, wait_for_flow_control=True, fc_arb_id=0x77a))
+    assert(len(cb.tx_sequence) == 6)
+    assert(cb.rx_sequence == [])
+    cb.rx_sequence = cb.tx_sequence
+    assert(handler.receive_message() == payload)
+
+    # it should give up after N_Bs without flow control
+    cb.reset_data()
+    assert(not handler.send_data(0x123, payload, wait_for_flow_control=True))
+    assert(len(cb.tx_sequence) == 1)
+
+    # it should abort on overflow
+    cb.reset_data()
+    cb.rx_sequence.append(Frame(arb_id=0x77a, payload=b'\x32\x00\x00'))
+    assert(not handler.send_data(0x123, payload, wait_for_flow_control=True))
+
+    assert(IsoTpHandler.decode_st_min(0x14) == 0.02)
+    assert(IsoTpHandler.decode_st_min(0xf5) == 0.0005)
@@ -0,0 +1,80 @@
+from libcanbadger.iso_tp.iso_tp_sniffer import IsoTpSniffer
+from libcanbadger.iso_tp.iso_tp_message import IsoTpMessage
+from libcanbadger.log import Log, FrameEvent, NamedEvent, LogEventType
+from libcanbadger.frame import Frame
+
+
+def stamped(frames, start=0.0, step=0.001):
+    for i, f in enumerate(frames):
+        f.timestamp = start + i * step
+    return frames
+
+
+def test_sniffer_reassembly():
+    sniffer = IsoTpSniffer()
+
+    # it should reassemble single frames
+    msg = sniffer.feed(Frame(arb_id=0x710, payload=b'\x03\x22\xf1\x87\xaa\xaa\xaa\xaa', timestamp=1.0))
+    assert(msg is not None)
+    assert(msg.arb_id == 0x710)
+    assert(msg.payload == b'\x22\xf1\x87')
+    assert(msg.start_time == msg.end_time == 1.0)
+
+    # it should reassemble interleaved multi-frame messages from different ids
+    a = IsoTpMessage(arb_id=0x77a, payload=bytes(range(20))).format()
+    b = IsoTpMessage(arb_id=0x77b, payload=bytes(range(100, 130))).format()
+    frames = [a[0], b[0], a[1], b[1], b[2], a[2], b[3], b[4]]
+    stamped(frames, start=2.0)
+    messages = list(sniffer.sniff(frames))
+    assert(len(messages) == 2)
+    assert(messages[0].arb_id == 0x77a)
+    assert(messages[0].payload == bytes(range(20)))
+    assert(messages[0].start_time == 2.0)
+    assert(messages[0].end_time == 2.005)
+    assert(messages[1].payload == bytes(range(100, 130)))
+
+    # it should drop transfers with missing consecutive frames
+    frames = stamped(IsoTpMessage(arb_id=0x77a, payload=bytes(20)).format(), start=3.0)
+    assert(list(sniffer.sniff([frames[0], frames[2]])) == [])
+    assert(sniffer.error_count == 1)
+
+
+def test_sniffer_pairing():
+    sniffer = IsoTpSniffer()
+    request = IsoTpMessage(arb_id=0x710, payload=b'\x22\xf1\x87').format()
+    response = IsoTpMessage(arb_id=0x77a, payload=b'\x62\xf1\x87' + b'WVWZZZ1JZXW000001').format()
+    fc = Frame(arb_id=0x710, payload=b'\x30\x00\x00')
+    frames = stamped(request + response[:1] + [fc] + response[1:])
+    messages = list(sniffer.sniff(frames))
+    assert(len(messages) == 2)
+    # the response should be paired with the request, learned from the flow control frame
+    assert(messages[1].request is messages[0])
+
+    # pairs can also be supplied up front
+    sniffer = IsoTpSniffer(pairs={0x710: 0x77a})
+    frames = stamped(IsoTpMessage(arb_id=0x710, payload=b'\x3e\x00').format() +
+                     IsoTpMessage(arb_id=0x77a, payload=b'\x7e\x00').format())
+    messages = list(sniffer.sniff(frames))
+    assert(messages[1].request is messages[0])
+
+
+def test_sniffer_bounded_state():
+    sniffer = IsoTpSniffer(max_streams=4, stream_timeout=0.5)
+    for i in range(10):
+        sniffer.feed(Frame(arb_id=0x700 + i, payload=b'\x10\x20\x00\x01\x02\x03\x04\x05', timestamp=0.0))
+    assert(len(sniffer.streams) == 4)
+    assert(sniffer.evicted_count == 6)
+
+    # stale streams should be evicted
+    sniffer.feed(Frame(arb_id=0x123, payload=b'\x01\x00', timestamp=10.0))
+    assert(list(sniffer.streams.keys()) == [0x123])
+
+
+def test_sniffer_log_source():
+    log = Log()
+    log.log(NamedEvent(name="start"))
+    for f in stamped(IsoTpMessage(arb_id=0x7e8, payload=bytes(range(10))).format()):
+        log.log(FrameEvent(frame=f, type=LogEventType.LOG_EVENT_RX_FRAME))
+    messages = list(IsoTpSniffer().sniff(log))
+    assert(len(messages) == 1)
+    assert(messages[0].payload == bytes(range(10)))
@@ -0,0 +1,111 @@
+import pytest
+
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bytes_parameter import BytesParameter
+from libcanbadger.search.dependent_parameter import DependentParameter
+
+# DIDs an imaginary ECU supports, in two dense clusters
+SUPPORTED_DIDS = set(range(0xF180, 0xF1A0)) | set(range(0x2000, 0x2010))
+# services and subfunctions an imaginary ECU supports
+SUPPORTED_SERVICES = {0x10: [0x01, 0x03], 0x11: [0x01], 0x3e: [0x00]}
+
+
+@pytest.fixture
+def respond_did():
+    """
+    :return: a function answering [did] combinations like an ECU supporting SUPPORTED_DIDS
+    """
+    def respond(values):
+        did = values[0]
+        if did in SUPPORTED_DIDS:
+            return bytes([0x62]) + did.to_bytes(2, 'big') + b'\x00'
+        return b'\x7f\x22\x31'
+    return respond
+
+
+@pytest.fixture
+def respond_service():
+    """
+    :return: a function answering [service, subfunction, data] combinations like an ECU supporting
+    SUPPORTED_SERVICES, with serviceNotSupported and subFunctionNotSupported
+    """
+    def respond(values):
+        service, subfunction, data = values
+        if service not in SUPPORTED_SERVICES:
+            return bytes([0x7f, service, 0x11])
+        if subfunction not in SUPPORTED_SERVICES[service]:
+            return bytes([0x7f, service, 0x12])
+        return bytes([service + 0x40, subfunction])
+    return respond
+
+
+@pytest.fixture
+def create_did_search():
+    """
+    :return: a function creating a Search over all DIDs
+    """
+    def create(strategy):
+        search = Search(strategy=strategy)
+        search.add_param(IntegerRangeParameter(name='did', start=0, stop=0x10000))
+        return search
+    return create
+
+
+@pytest.fixture
+def create_service_search():
+    """
+    :return: a function creating a Search over [service, subfunction, data], pruning unsupported services and
+    subfunctions
+    """
+    def nrc_rule(code):
+        return lambda values, response: response[0] == 0x7f and response[2] == code
+
+    def create(strategy):
+        search = Search(strategy=strategy)
+        search.add_param(IntegerChoiceParameter(name='service', values=[0x10, 0x11, 0x22, 0x3e, 0x85]))
+        search.add_param(IntegerRangeParameter(name='subfunction', start=0, stop=8))
+        search.add_param(IntegerRangeParameter(name='data', start=0, stop=16))
+        search.add_pruning_rule(1, nrc_rule(0x11))
+        search.add_pruning_rule(2, nrc_rule(0x12))
+        return search
+    return create
+
+
+@pytest.fixture
+def create_cost_search():
+    """
+    :return: a function creating a Search over [did, session, security], with the parameters added in the worst
+    order for a bruteforce scan
+    """
+    def create(strategy):
+        search = Search(strategy=strategy)
+        did = IntegerRangeParameter('did', start=0xf180, stop=0xf190)
+        did.switch_cost = 0.0
+        session = IntegerChoiceParameter('session', values=[0x01, 0x02, 0x03])
+        session.switch_cost = 0.5
+        security = IntegerChoiceParameter('security', values=[0, 1])
+        security.switch_cost = 2.0
+        search.add_param(did)
+        search.add_param(session)
+        search.add_param(security)
+        return search
+    return create
+
+
+@pytest.fixture
+def create_dependent_search():
+    """
+    :return: a function creating a Search over [service, data, padding], with data depending on the service and
+    no valid data for service 0x85
+    """
+    def create(strategy):
+        search = Search(strategy=strategy)
+        search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e, 0x85]))
+        search.add_param(DependentParameter('data', depends_on='service', domains={
+            0x22: BytesParameter('did', min_length=2, alphabet=[0xf1, 0x90]),
+            0x2e: BytesParameter('record', min_length=2, max_length=3, alphabet=[0x00, 0x01])}))
+        search.add_param(IntegerChoiceParameter(name='padding', values=[0x00, 0xaa]))
+        return search
+    return create
@@ -0,0 +1,60 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.adaptive_strategy import AdaptiveStrategy
+
+
+def requests_until_hits(search, hit_count, respond):
+    requests = 0
+    hits = 0
+    while hits < hit_count:
+        values = search.next()
+        response = respond(values)
+        # the DIDs around a missing one are dead ends
+        search.report(values, response, response[0] == 0x62)
+        requests += 1
+        if response[0] == 0x62:
+            hits += 1
+    return requests
+
+
+def test_adaptive_finds_clusters_first(create_did_search, respond_did):
+    bruteforce = requests_until_hits(create_did_search(BruteforceStrategy()), 40, respond_did)
+    adaptive = requests_until_hits(create_did_search(AdaptiveStrategy(block_size=16)), 40, respond_did)
+    assert(adaptive * 10 < bruteforce)
+
+
+def test_adaptive_full_coverage():
+    search = Search(strategy=AdaptiveStrategy(block_size=7))
+    search.add_param(IntegerRangeParameter(name='did', start=0, stop=1000))
+    seen = []
+    while not search.has_completed():
+        values = search.next()
+        seen.append(values)
+        # hits, dead ends and results that say neither
+        search.report(values, None, True if values[0] % 3 == 0 else (False if values[0] % 5 else None))
+    assert(sorted(seen) == [[i] for i in range(1000)])
+    assert(search.next() is None)
+    assert(search.progress() == 1.0)
+
+
+def test_adaptive_serialization(create_did_search, respond_did):
+    search = create_did_search(AdaptiveStrategy(block_size=16))
+    order = []
+    for _ in range(200):
+        values = search.next()
+        order.append(values)
+        response = respond_did(values)
+        search.report(values, response, response[0] == 0x62)
+
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(search.serialize())
+    assert(isinstance(restored.strategy, AdaptiveStrategy))
+    assert(restored.next() == search.next())
+
+    # an in-flight combination is handed out again
+    in_flight = search.next()
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(search.serialize(in_flight=True))
+    assert(restored.next() == in_flight)
+    assert(restored.next() == search.next())
@@ -67,7 +67,43 @@ def test_bruteforce_search():
         search.next()
 
     assert(search.progress() == 1.0)
+    assert(search.has_completed())
+    # ..and return nothing more
+    assert(search.next() is None)
+
+
+def test_random_access():
+    search = Search(strategy=BruteforceStrategy())
+    search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e, 0x31]))
+    search.add_param(IntegerRangeParameter(name='did', start=0xf180, stop=0xf1a0, step=2))
+    search.add_param(IntegerRangeParameter(name='length', start=1, stop=6))
+    assert(len(search) == 3 * 16 * 5)
+
+    # get(index) should match the order next() returns the combinations in
+    combinations = [search.next() for _ in range(len(search))]
+    for index, values in enumerate(combinations):
+        assert(search.get(index) == values)
+        assert(search.index_of(values) == index)
+    assert(search.get(5) == [0x22, 0xf182, 1])
+
+    # seek should continue anywhere
+    search.seek(123)
+    assert(search.progress() == 123 / len(search))
+    assert(search.peek_next() == combinations[123])
+    assert(search.next() == combinations[123])
+    search.increment()
+    assert(search.next() == combinations[125])
+    search.seek(len(search) - 1)
+    assert(search.next() == combinations[-1])
+    assert(search.has_completed())
+
+    # huge spaces don't need to be walked
+    search.add_param(IntegerRangeParameter(name='address', start=0, stop=2 ** 32))
+    index = len(search) - 12345
+    assert(search.index_of(search.get(index)) == index)
+
 
 if __name__ == "__main__":
     test_parameters()
-    test_bruteforce_search()
\ No newline at end of file
+    test_bruteforce_search()
+    test_random_access()
\ No newline at end of file
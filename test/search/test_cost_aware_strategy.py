@@ -0,0 +1,63 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.cost_aware_strategy import CostAwareStrategy
+
+
+def measured_cost(search):
+    cost = 0.0
+    last = None
+    while not search.has_completed():
+        values = search.next()
+        if last is not None:
+            cost += sum(p.switch_cost for p, a, b in zip(search.parameters, last, values) if a != b)
+        last = values
+    return cost
+
+
+def test_cost_aware_order(create_cost_search):
+    for gray in (True, False):
+        search = create_cost_search(CostAwareStrategy(gray=gray))
+        report = search.strategy.cost_report()
+        assert(report['order'] == ['security', 'session', 'did'])
+        combinations = []
+        while not search.has_completed():
+            combinations.append(search.next())
+        # every combination exactly once
+        assert(sorted(combinations) == sorted(search.get(i) for i in range(search.length())))
+        # the expected cost is exact
+        assert(measured_cost(create_cost_search(CostAwareStrategy(gray=gray))) == report['cost'])
+
+    search = create_cost_search(CostAwareStrategy())
+    report = search.strategy.cost_report()
+    # one security switch, 2 session switches per security level, a DID switch within each of the 6 runs
+    assert(report['switches'] == {'security': 1, 'session': 4, 'did': 6 * 15})
+    assert(report['cost'] == 2.0 + 4 * 0.5)
+    assert(report['bruteforce_cost'] == measured_cost(create_cost_search(BruteforceStrategy())))
+    assert(report['bruteforce_cost'] > 10 * report['cost'])
+
+
+def test_cost_aware_gray_code(create_cost_search):
+    search = create_cost_search(CostAwareStrategy())
+    last = search.next()
+    while not search.has_completed():
+        values = search.next()
+        # exactly one parameter changes at a time, by one step
+        changed = [(a, b) for a, b in zip(last, values) if a != b]
+        assert(len(changed) == 1)
+        last = values
+
+
+def test_cost_aware_resume(create_cost_search):
+    search = create_cost_search(CostAwareStrategy())
+    order = [search.next() for _ in range(search.length())]
+    search.seek(40)
+    assert(search.strategy.expected_cost() == measured_cost(search))
+    shard = create_cost_search(CostAwareStrategy()).shard(1, 2)
+    assert(shard.next() == order[48])
+    restored = Search(strategy=BruteforceStrategy())
+    resumed = create_cost_search(CostAwareStrategy())
+    resumed.seek(17)
+    restored.unserialize(resumed.serialize())
+    assert(isinstance(restored.strategy, CostAwareStrategy))
+    assert(restored.parameters[2].switch_cost == 2.0)
+    assert(restored.next() == order[17])
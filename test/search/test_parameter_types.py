@@ -0,0 +1,95 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.bytes_parameter import BytesParameter
+from libcanbadger.search.bitfield_parameter import BitfieldParameter
+from libcanbadger.search.dependent_parameter import DependentParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.random_permutation_strategy import RandomPermutationStrategy
+from libcanbadger.search.adaptive_strategy import AdaptiveStrategy
+from libcanbadger.search.cost_aware_strategy import CostAwareStrategy
+
+
+def check_index_of(parameter):
+    for index in range(parameter.length()):
+        assert(parameter.index_of(parameter.get(index)) == index)
+
+
+def test_bytes_parameter():
+    parameter = BytesParameter('data', min_length=0, max_length=2, alphabet=[0x00, 0x55, 0xff], prefix=b'\x10')
+    assert(parameter.length() == 1 + 3 + 9)
+    assert(parameter.get(0) == b'\x10')
+    assert(parameter.get(1) == b'\x10\x00')
+    assert(parameter.get(4) == b'\x10\x00\x00')
+    assert(parameter.get(12) == b'\x10\xff\xff')
+    check_index_of(parameter)
+
+    # huge domains are not expanded
+    parameter = BytesParameter('key', min_length=16)
+    assert(parameter.length() == 2 ** 128)
+    assert(parameter.get(2 ** 128 - 1) == b'\xff' * 16)
+    assert(parameter.index_of(b'\x00' * 15 + b'\x01') == 1)
+
+
+def test_bitfield_parameter():
+    parameter = BitfieldParameter('flags', template=b'\x0f', max_flips=2)
+    assert(parameter.length() == 1 + 8 + 28)
+    assert(parameter.get(0) == b'\x0f')
+    assert(parameter.get(1) == b'\x0e')
+    assert(parameter.get(8) == b'\x8f')
+    values = [parameter.get(i) for i in range(parameter.length())]
+    assert(len(set(values)) == parameter.length())
+    assert(all(bin(v[0] ^ 0x0f).count('1') <= 2 for v in values))
+    check_index_of(parameter)
+
+    # only the masked bits, all of their values
+    parameter = BitfieldParameter('control', template=b'\x12\x34', mask=b'\x00\xf0')
+    assert(parameter.length() == 16)
+    assert(set(parameter.get(i) for i in range(16)) == set(bytes([0x12, x << 4 | 4]) for x in range(16)))
+    check_index_of(parameter)
+
+
+def test_dependent_parameter(create_dependent_search):
+    search = create_dependent_search(BruteforceStrategy())
+    # data is as long as the largest domain, 12 values
+    assert(search.length() == 3 * 12 * 2)
+    combinations = []
+    while not search.has_completed():
+        combinations.append(search.next())
+    assert(len(combinations) == (4 + 12) * 2)
+    assert(combinations[0] == [0x22, b'\xf1\xf1', 0x00])
+    assert(combinations[8] == [0x2e, b'\x00\x00', 0x00])
+    assert(all(c[0] != 0x85 for c in combinations))
+    assert(search.skipped() + len(combinations) == search.length())
+    assert(search.progress() == 1.0)
+    assert(search.get(search.index_of(combinations[10])) == combinations[10])
+    # invalid combinations
+    assert(search.get(9) is None)
+
+    # other strategies skip invalid combinations too, has_completed() turns True once only invalid ones are left
+    for strategy in [RandomPermutationStrategy(seed=seed) for seed in range(10)] + \
+            [AdaptiveStrategy(block_size=5), CostAwareStrategy()]:
+        search = create_dependent_search(strategy)
+        shuffled = []
+        while not search.has_completed():
+            shuffled.append(search.next())
+        assert(sorted(shuffled) == sorted(combinations))
+        assert(search.progress() == 1.0)
+
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(create_dependent_search(BruteforceStrategy()).serialize())
+    assert(isinstance(restored.parameters[1], DependentParameter))
+    assert(restored.next() == combinations[0])
+
+
+def test_pruned_bytes_serialization(create_dependent_search):
+    # pruned prefixes with bytes values have to survive a checkpoint
+    for strategy in [RandomPermutationStrategy(seed=2), AdaptiveStrategy(block_size=5)]:
+        search = create_dependent_search(strategy)
+        rules = [(2, lambda values, outcome: values[1] == b'\xf1\xf1')]
+        for depth, predicate in rules:
+            search.add_pruning_rule(depth, predicate)
+        while not search.strategy.pruned_prefixes:
+            search.report(search.next(), None)
+        restored = Search(strategy=type(strategy)())
+        restored.unserialize(search.serialize(), pruning_rules=rules)
+        assert(restored.strategy.pruned_prefixes == search.strategy.pruned_prefixes == {(0x22, b'\xf1\xf1')})
+        assert(restored.skipped() == search.skipped())
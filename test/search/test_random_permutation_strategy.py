@@ -0,0 +1,51 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.random_permutation_strategy import RandomPermutationStrategy
+
+
+def create_search(strategy):
+    search = Search(strategy=strategy)
+    search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e, 0x31]))
+    search.add_param(IntegerRangeParameter(name='did', start=0, stop=333))
+    return search
+
+
+def test_random_permutation():
+    search = create_search(RandomPermutationStrategy(seed=42))
+    combinations = []
+    while not search.has_completed():
+        combinations.append(search.next())
+
+    # every combination exactly once, but not in order
+    assert(len(combinations) == 999)
+    assert(sorted(combinations) == sorted(search.get(i) for i in range(999)))
+    assert(combinations != [search.get(i) for i in range(999)])
+    assert(search.progress() == 1.0)
+    assert(search.next() is None)
+
+    # the seed decides the order
+    same = create_search(RandomPermutationStrategy(seed=42))
+    other = create_search(RandomPermutationStrategy(seed=43))
+    assert([same.next() for _ in range(20)] == combinations[:20])
+    assert([other.next() for _ in range(20)] != combinations[:20])
+
+    # seeking, sharding and serialization keep the order
+    same.seek(500)
+    assert(same.next() == combinations[500])
+    shard = same.shard(2, 3)
+    assert(shard.next() == combinations[666])
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(same.serialize())
+    assert(isinstance(restored.strategy, RandomPermutationStrategy))
+    assert(restored.next() == combinations[501])
+
+
+def test_random_permutation_huge_space():
+    search = Search(strategy=RandomPermutationStrategy(seed=1))
+    search.add_param(IntegerRangeParameter(name='address', start=0, stop=2 ** 32))
+    search.add_param(IntegerRangeParameter(name='length', start=1, stop=4))
+    values = [search.next() for _ in range(1000)]
+    assert(len(set(tuple(v) for v in values)) == 1000)
+    assert(all(0 <= address < 2 ** 32 and 1 <= length < 4 for address, length in values))
@@ -0,0 +1,72 @@
+import pytest
+
+from libcanbadger.search.search import Search
+from libcanbadger.search.parameter import Parameter
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.random_permutation_strategy import RandomPermutationStrategy
+from libcanbadger.search.adaptive_strategy import AdaptiveStrategy
+
+numpy = pytest.importorskip("numpy")
+
+
+class PayloadParameter(Parameter):
+    """
+    a custom parameter without get_batch(), whose values depend on the service
+    """
+    def __init__(self, name, count: int = 4):
+        super(PayloadParameter, self).__init__(name)
+        self.count = count
+
+    def length(self) -> int:
+        return self.count
+
+    def get(self, index, context: dict = None):
+        return bytes([context['service'], index])
+
+
+def create_search(strategy, custom=False):
+    search = Search(strategy=strategy)
+    search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e, 0x31]))
+    search.add_param(IntegerRangeParameter(name='did', start=0xf100, stop=0xf200, step=4))
+    if custom:
+        search.add_param(PayloadParameter(name='payload'))
+    return search
+
+
+def test_next_batch():
+    for strategy in [BruteforceStrategy(), RandomPermutationStrategy(seed=5), AdaptiveStrategy(block_size=10)]:
+        search = create_search(strategy)
+        reference = create_search(type(strategy).from_dict(strategy.to_dict()))
+        batch = search.next_batch(100)
+        assert(batch.shape == (100, 2))
+        assert(batch.tolist() == [reference.next() for _ in range(100)])
+        assert(search.strategy.progress() == 100)
+
+        # the last batch is shorter
+        rest = search.next_batch(1000)
+        assert(rest.shape == (len(search) - 100, 2))
+        assert(search.has_completed())
+        assert(search.next_batch(10).shape == (0, 2))
+
+
+def test_next_batch_columns_and_fallback():
+    search = create_search(BruteforceStrategy(), custom=True)
+    services, dids, payloads = search.next_batch(70, as_columns=True)
+    assert(services.dtype != object and dids.dtype != object)
+    assert(payloads.dtype == object)
+    assert(services[69] == 0x22 and dids[69] == 0xf100 + 17 * 4)
+    assert(payloads[69] == bytes([0x22, 1]))
+    search.seek(0)
+    assert([list(row) for row in zip(services.tolist(), dids.tolist(), payloads.tolist())] ==
+           [search.next() for _ in range(70)])
+
+
+def test_next_batch_huge_space():
+    search = Search(strategy=BruteforceStrategy())
+    search.add_param(IntegerRangeParameter(name='address', start=0, stop=2 ** 40))
+    search.add_param(IntegerRangeParameter(name='length', start=0, stop=2 ** 30))
+    search.seek(search.length() - 3)
+    batch = search.next_batch(5)
+    assert(batch.tolist() == [[2 ** 40 - 1, 2 ** 30 - 3], [2 ** 40 - 1, 2 ** 30 - 2], [2 ** 40 - 1, 2 ** 30 - 1]])
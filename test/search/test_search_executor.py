@@ -0,0 +1,58 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.search_executor import SearchExecutor
+
+
+def create_search():
+    search = Search(strategy=BruteforceStrategy())
+    search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e]))
+    search.add_param(IntegerRangeParameter(name='did', start=0, stop=1001))
+    return search
+
+
+def find_multiples(shard_index):
+    # module level, so it can be pickled for the process pool
+    def worker(values):
+        return values[1] * 2 if values[1] % 97 == 0 else None
+    return worker
+
+
+def test_shards():
+    search = create_search()
+    shards = [search.shard(i, 3) for i in range(3)]
+
+    # shards should be disjoint, balanced and cover everything
+    assert([len(shard) for shard in shards] == [667, 667, 668])
+    combinations = []
+    for shard in shards:
+        while not shard.has_completed():
+            combinations.append(shard.next())
+    assert(combinations == [search.get(i) for i in range(len(search))])
+    # ..without touching the original search
+    assert(search.progress() == 0.0)
+
+    # shards can be sharded again
+    assert(len(shards[2].shard(1, 2)) == 334)
+    assert(shards[2].shard(1, 2).next() == search.get(667 + 667 + 334))
+
+
+def test_search_executor():
+    search = create_search()
+    progress = []
+    executor = SearchExecutor(search, find_multiples, shard_count=4, report_interval=100)
+    hits = executor.run(progress_callback=lambda done, total: progress.append((done, total)))
+
+    # hits of all shards should be merged
+    assert(sorted(values for values, result in hits) == [[s, d] for s in (0x22, 0x2e) for d in range(0, 1001, 97)])
+    assert(all(result == values[1] * 2 for values, result in hits))
+    assert(progress[-1] == (2002, 2002))
+    assert(executor.progress() == 1.0)
+
+    # it should only split up what is left of a search
+    search.seek(1001)
+    executor = SearchExecutor(search, find_multiples, shard_count=2, use_processes=True)
+    hits = executor.run()
+    assert(sorted(values for values, result in hits) == [[0x2e, d] for d in range(0, 1001, 97)])
+    assert(executor.done() == 1001)
@@ -0,0 +1,75 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.random_permutation_strategy import RandomPermutationStrategy
+from libcanbadger.search.adaptive_strategy import AdaptiveStrategy
+
+def run(search, respond):
+    requests = []
+    while not search.has_completed():
+        values = search.next()
+        if values is None:
+            break
+        requests.append(values)
+        search.report(values, respond(values))
+    return requests
+
+
+def test_bruteforce_pruning(create_service_search, respond_service):
+    search = create_service_search(BruteforceStrategy())
+    requests = run(search, respond_service)
+    # one request per unsupported service and subfunction, all data values for supported ones
+    assert(len(requests) == (2 * 16 + 6) + (16 + 7) + 1 + (16 + 7) + 1)
+    assert(len(requests) + search.skipped() == search.length())
+    assert(search.progress() == 1.0)
+    assert([0x10, 0x03, 15] in requests)
+    assert([0x22, 0, 1] not in requests)
+
+
+def test_pruning_progress_and_resume(create_service_search, respond_service):
+    search = create_service_search(BruteforceStrategy())
+    for _ in range(3):
+        values = search.next()
+        search.report(values, respond_service(values))
+    # subfunction 0 of service 0x10 is not supported, its other data values were skipped
+    assert(search.skipped() == 15)
+    assert(search.strategy.progress() == 18)
+    assert(search.progress() == 18 / search.length())
+
+    restored = create_service_search(BruteforceStrategy())
+    restored.unserialize(search.serialize())
+    assert(restored.skipped() == 15)
+    assert(len(restored.strategy.pruning_rules) == 2)
+    assert(restored.next() == search.next() == [0x10, 1, 2])
+
+
+def test_pruning_rules_on_resume(capsys, create_service_search, respond_service):
+    search = create_service_search(BruteforceStrategy())
+    for _ in range(3):
+        values = search.next()
+        search.report(values, respond_service(values))
+
+    # a fresh search has no rules to keep, losing them is reported
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(search.serialize())
+    assert(not restored.strategy.pruning_rules)
+    assert('pruning rules' in capsys.readouterr().out)
+
+    # ..unless they are passed along
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(search.serialize(), pruning_rules=search.strategy.pruning_rules)
+    assert(len(restored.strategy.pruning_rules) == 2)
+    assert(capsys.readouterr().out == '')
+    assert(run(restored, respond_service) == run(search, respond_service))
+
+
+def test_pruning_other_strategies(create_service_search, respond_service):
+    expected = sorted(run(create_service_search(BruteforceStrategy()), respond_service))
+    for strategy in [RandomPermutationStrategy(seed=3), AdaptiveStrategy(block_size=8)]:
+        search = create_service_search(strategy)
+        requests = run(search, respond_service)
+        # supported combinations are never pruned
+        supported = set(tuple(v) for v in expected if respond_service(v)[0] != 0x7f)
+        assert(supported <= set(map(tuple, requests)))
+        assert(len(requests) < search.length() // 2)
+        assert(len(requests) + search.skipped() == search.length())
+        assert(search.progress() == 1.0)
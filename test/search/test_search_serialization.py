@@ -0,0 +1,71 @@
+import json
+
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+
+
+def create_search():
+    search = Search(strategy=BruteforceStrategy())
+    search.add_param(IntegerChoiceParameter(name='service', values=[0x22, 0x2e]))
+    search.add_param(IntegerRangeParameter(name='did', start=0xf100, stop=0xf200, step=4))
+    return search
+
+
+def test_serialize():
+    search = create_search()
+    for _ in range(17):
+        search.next()
+
+    # it should restore parameters and position
+    restored = Search(strategy=BruteforceStrategy())
+    restored.unserialize(search.serialize())
+    assert(len(restored) == len(search))
+    assert(restored.progress() == search.progress())
+    assert(restored.next() == search.next())
+    assert(restored.parameters[1].to_dict() == {'type': 'IntegerRangeParameter', 'name': 'did',
+                                                'start': 0xf100, 'stop': 0xf200, 'step': 4})
+
+    # ..including shard ranges
+    shard = search.shard(1, 3)
+    shard.next()
+    restored.unserialize(shard.serialize())
+    assert(len(restored) == len(shard))
+    assert(restored.next() == shard.next())
+
+    # in flight combinations are repeated
+    state = json.loads(search.serialize(in_flight=True))
+    assert(state['strategy']['position'] == 17)
+
+
+def test_checkpoints(tmp_path):
+    filename = str(tmp_path / 'search.json')
+    done = []
+    search = create_search()
+    search.enable_checkpoints(filename, every_steps=10)
+    try:
+        with search:
+            while not search.has_completed():
+                values = search.next()
+                if len(done) == 25:
+                    raise KeyboardInterrupt()
+                done.append(values)
+    except KeyboardInterrupt:
+        pass
+
+    # a restarted search should continue with the interrupted combination
+    restarted = Search(strategy=BruteforceStrategy())
+    assert(restarted.load_checkpoint(filename))
+    while not restarted.has_completed():
+        done.append(restarted.next())
+    assert(done == [search.get(i) for i in range(len(search))])
+
+    # automatic checkpoints only contain completed combinations
+    search = create_search()
+    search.enable_checkpoints(filename, every_steps=10)
+    for _ in range(15):
+        search.next()
+    restarted.load_checkpoint(filename)
+    assert(restarted.strategy.progress() == 10)
+    assert(not Search(strategy=BruteforceStrategy()).load_checkpoint(filename + '.missing'))
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from libcanbadger.emulation.emulated_can_interface import EmulatedCanInterface
+from libcanbadger.emulation.ecu_emulator import EcuEmulator, negative_response
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.uds.session import Session
+from libcanbadger.uds.uds_constants import ResponseCodes, AdditionalResponseCodes
+
+
+class SimulatedClock(object):
+    """
+    a clock that only advances when sleep() is called, for timing dependent tests that must not depend on the load
+    of the machine they run on
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def create_session():
+    """
+    :return: a function creating a Session to an EcuEmulator, over an EmulatedCanInterface
+    """
+    def create(ecu, **kwargs):
+        interface = EmulatedCanInterface(ecus=[ecu], padding_byte=0xAA)
+        interface.connect()
+        return Session(interface=interface, tester_id=ecu.tester_id, ecu_id=ecu.ecu_id, **kwargs)
+    return create
+
+
+@pytest.fixture
+def clock():
+    return SimulatedClock()
+
+
+@pytest.fixture
+def create_did_ecu():
+    """
+    :return: a function creating an ECU with a few DIDs in 0xf180-0xf1af, for scans. it answers BUSY_REPEAT_REQUEST to
+    requests faster than max_rate (measured with clock), and falls back to the default session every
+    drop_session_every requests
+    """
+    def create(max_rate: float = None, drop_session_every: int = None, clock: callable = time.monotonic):
+        ecu = EcuEmulator(dids={0xf180 + i: bytes([i]) for i in range(0, 40, 3)})
+        read_data_by_identifier = ecu.read_data_by_identifier
+        state = {'last': None, 'count': 0}
+
+        def handler(request):
+            now = clock()
+            if max_rate is not None and state['last'] is not None and now - state['last'] < 1 / max_rate:
+                return [negative_response(request[0], ResponseCodes.BUSY_REPEAT_REQUEST)]
+            state['last'] = now
+            state['count'] += 1
+            if drop_session_every is not None and state['count'] % drop_session_every == 0:
+                ecu.diagnostic_session = 0x01
+            if ecu.diagnostic_session == 0x01:
+                return [negative_response(request[0],
+                                          AdditionalResponseCodes.SERVICE_NOT_SUPPORTED_IN_ACTIVE_SESSION)]
+            return read_data_by_identifier(request)
+
+        ecu.register_service(0x22, handler)
+        return ecu
+    return create
+
+
+@pytest.fixture
+def create_did_scan():
+    """
+    :return: a function creating a bruteforce Search over the DIDs 0xf180-0xf1af, the range create_did_ecu answers
+    """
+    def create():
+        search = Search(strategy=BruteforceStrategy())
+        search.add_param(IntegerRangeParameter('did', start=0xf180, stop=0xf1b0))
+        return search
+    return create
@@ -0,0 +1,38 @@
+from libcanbadger.emulation.emulated_can_interface import EmulatedCanInterface
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.discovery import EcuDiscovery, candidate_ids, conventional_request_id
+
+
+def test_conventional_request_id():
+    assert(conventional_request_id(0x7e8) == 0x7e0)
+    assert(conventional_request_id(0x18daf110) == 0x18da10f1)
+    assert(conventional_request_id(0x18db33f1) is None)
+    assert(len(candidate_ids()) == 0x7ff)
+    assert(len(candidate_ids(use_extended_ids=True)) == 0xff)
+
+
+def test_discovery():
+    ecus = [EcuEmulator(tester_id=0x7e0, ecu_id=0x7e8), EcuEmulator(tester_id=0x710, ecu_id=0x77a),
+            EcuEmulator(tester_id=0x6f1, ecu_id=0x6f9), EcuEmulator(tester_id=0x123, ecu_id=0x456)]
+    interface = EmulatedCanInterface(ecus=ecus, padding_byte=0xAA)
+    interface.connect()
+    discovery = EcuDiscovery(interface, listen_time=0.01)
+
+    # it should find every ECU and its request id
+    address_map = discovery.discover()
+    assert(address_map == {0x7e0: 0x7e8, 0x710: 0x77a, 0x6f1: 0x6f9, 0x123: 0x456})
+    assert(all(ecu.functional and ecu.physical for ecu in discovery.ecus.values()))
+    assert(discovery.ecus[0x7e8].response == b'\x7e\x00')
+    # one sweep plus a few bisection rounds, not one round per id
+    assert(discovery.round_count <= 16)
+    assert(discovery.probe_count < 3 * len(candidate_ids()))
+
+
+def test_discovery_extended_ids():
+    ecus = [EcuEmulator(tester_id=0x18da10f1, ecu_id=0x18daf110), EcuEmulator(tester_id=0x18da42f1, ecu_id=0x18ff0042)]
+    interface = EmulatedCanInterface(ecus=ecus, padding_byte=0xAA)
+    interface.connect()
+    discovery = EcuDiscovery(interface, use_extended_ids=True, probe=b'\x10\x01', listen_time=0.01)
+
+    assert(discovery.discover() == {0x18da10f1: 0x18daf110, 0x18da42f1: 0x18ff0042})
+    assert(discovery.ecus[0x18daf110].response[:2] == b'\x50\x01')
@@ -0,0 +1,93 @@
+import os
+import random
+
+import pytest
+
+from libcanbadger.emulation.ecu_emulator import EcuEmulator, negative_response
+from libcanbadger.uds.memory_dumper import MemoryDumper, merge_range, missing_ranges
+
+
+def test_ranges():
+    ranges = merge_range([], 10, 20)
+    ranges = merge_range(ranges, 30, 40)
+    assert(ranges == [[10, 20], [30, 40]])
+    # adjacent ranges should be merged
+    ranges = merge_range(ranges, 20, 30)
+    assert(ranges == [[10, 40]])
+    assert(missing_ranges(ranges, 50) == [[0, 10], [40, 50]])
+    assert(missing_ranges([], 50) == [[0, 50]])
+
+
+def test_memory_dump(tmp_path, create_session):
+    rng = random.Random(1)
+    memory = bytes(rng.getrandbits(8) for _ in range(0x3000))
+    ecu = EcuEmulator(memory=memory, memory_address=0x80000, max_read_size=0x200)
+    session = create_session(ecu)
+    filename = str(tmp_path / 'dump.bin')
+
+    dumper = MemoryDumper(session)
+    assert(dumper.dump(0x80000, len(memory), filename))
+    # it should find the largest block size the ECU accepts
+    assert(dumper.block_size == 0x200)
+    with open(filename, 'rb') as f:
+        assert(f.read() == memory)
+    assert(dumper.bytes_read == len(memory))
+    assert(dumper.throughput() > 0)
+    # it should auto-size the address and length formats
+    assert(ecu.requests[-1][:2] == b'\x23\x23')
+
+
+def test_memory_dump_retry_and_resume(tmp_path, create_session):
+    memory = bytes(range(256)) * 16
+    ecu = EcuEmulator(memory=memory, memory_address=0x1000, max_read_size=0x100)
+    session = create_session(ecu)
+    filename = str(tmp_path / 'dump.bin')
+
+    # it should retry failed blocks
+    read_memory = ecu.services[0x23]
+    failures = {'count': 2}
+
+    def flaky_read(request):
+        if failures['count'] > 0:
+            failures['count'] -= 1
+            return [negative_response(0x23, 0x21)]
+        return read_memory(request)
+    ecu.register_service(0x23, flaky_read)
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(done, total, throughput):
+        if done >= 0x800:
+            raise Interrupted()
+
+    dumper = MemoryDumper(session, block_size=0x100, checkpoint_interval=1)
+    with pytest.raises(Interrupted):
+        dumper.dump(0x1000, len(memory), filename, progress_callback=interrupt)
+    assert(dumper.retry_count == 2)
+    assert(os.path.exists(filename + '.progress'))
+
+    # it should resume where it stopped
+    ecu.requests = []
+    dumper = MemoryDumper(session, block_size=0x100)
+    assert(dumper.dump(0x1000, len(memory), filename))
+    assert(len(ecu.requests) == 8)
+    with open(filename, 'rb') as f:
+        assert(f.read() == memory)
+
+    # unreadable blocks are reported and stay zero
+    ecu.memory = ecu.memory[:0x300]
+    dumper = MemoryDumper(session, block_size=0x100, retries=1)
+    assert(not dumper.dump(0x1000, 0x400, filename, resume=False))
+    assert(dumper.failed_ranges == [[0x300, 0x400]])
+
+    # an unreadable block doesn't end the dump, the block size is probed again after it
+    ecu.memory = bytearray(memory)
+    ecu.register_service(0x23, lambda request: [negative_response(0x23, 0x31)]
+                         if int.from_bytes(request[2:4], 'big') < 0x1100 else read_memory(request))
+    dumper = MemoryDumper(session, min_block_size=0x80)
+    assert(not dumper.dump(0x1000, len(memory), filename, resume=False))
+    assert(dumper.failed_ranges == [[0, 0x100]])
+    assert(dumper.bytes_read == len(memory) - 0x100)
+    with open(filename, 'rb') as f:
+        assert(f.read()[0x100:] == memory[0x100:])
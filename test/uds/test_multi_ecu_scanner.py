@@ -0,0 +1,68 @@
+from libcanbadger.emulation.emulated_can_interface import EmulatedCanInterface
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.multi_ecu_scanner import MultiEcuScanner
+
+
+def test_multi_ecu_scan():
+    ecus = [EcuEmulator(tester_id=0x700 + i, ecu_id=0x708 + i + 0x10, dids={0xf190: b'ECU%d' % i * 8})
+            for i in range(5)]
+    interface = EmulatedCanInterface(ecus=ecus, padding_byte=0xAA)
+    interface.connect()
+    # one of the ECUs is slow
+    ecus[2].pending_responses[0x22] = 2
+
+    scanner = MultiEcuScanner(interface, timeout=0.05)
+    requests = [b'\x22\xf1\x90', b'\x22\xf1\x91', b'\x22\xf1\x90' + b'\xf1\x90' * 5]
+    for ecu in ecus:
+        scanner.add_ecu(ecu.tester_id, ecu.ecu_id, list(requests))
+
+    finished = []
+    results = scanner.run(result_callback=lambda ecu_id, request, response: finished.append(ecu_id))
+    assert(len(finished) == 15)
+    for i, ecu in enumerate(ecus):
+        ecu_results = results[ecu.ecu_id]
+        assert(len(ecu_results) == 3)
+        assert(ecu_results[0] == (requests[0], b'\x62\xf1\x90' + b'ECU%d' % i * 8))
+        assert(ecu_results[1] == (requests[1], b'\x7f\x22\x31'))
+        # multi-frame requests and responses work as well
+        assert(ecu_results[2][1][:3] == b'\x62\xf1\x90')
+
+    # all ECUs should be queried before any of them gets its second request
+    first_frames = [f.arb_id for f in interface.tx_frames[:5]]
+    assert(first_frames == [ecu.tester_id for ecu in ecus])
+
+
+def test_multi_ecu_scan_timeout():
+    ecu = EcuEmulator(tester_id=0x700, ecu_id=0x708)
+    interface = EmulatedCanInterface(ecus=[ecu])
+    interface.connect()
+    scanner = MultiEcuScanner(interface, timeout=0.01)
+    scanner.add_ecu(0x700, 0x708, [b'\x3e\x00'])
+    # nobody answers on this pair
+    target = scanner.add_ecu(0x701, 0x709, [b'\x3e\x00', b'\x3e\x00'])
+    results = scanner.run()
+    assert(results[0x708] == [(b'\x3e\x00', b'\x7e\x00')])
+    assert(results[0x709] == [(b'\x3e\x00', b''), (b'\x3e\x00', b'')])
+    assert(target.timeout_count == 2)
+
+
+def test_multi_ecu_scan_st_min():
+    slow = EcuEmulator(tester_id=0x700, ecu_id=0x708)
+    # 20ms between consecutive frames
+    slow.fc_st_min = 20
+    fast = EcuEmulator(tester_id=0x701, ecu_id=0x709, dids={0xf190: b'FAST'})
+    interface = EmulatedCanInterface(ecus=[slow, fast])
+    interface.connect()
+    scanner = MultiEcuScanner(interface, timeout=0.01)
+    # 5 consecutive frames, so sending the request takes 80ms
+    scanner.add_ecu(0x700, 0x708, [b'\x22' + b'\xf1\x90' * 20])
+    scanner.add_ecu(0x701, 0x709, [b'\x22\xf1\x90'] * 5)
+    results = scanner.run()
+
+    # the fast ECU shouldn't wait for the slow one's STmin
+    assert(results[0x709] == [(b'\x22\xf1\x90', b'\x62\xf1\x90FAST')] * 5)
+    assert(results[0x708][0][1] == b'\x7f\x22\x31')
+    tx_ids = [f.arb_id for f in interface.tx_frames]
+    slow_frames = [i for i, arb_id in enumerate(tx_ids) if arb_id == 0x700]
+    assert(len(slow_frames) == 6)
+    assert(any(arb_id == 0x701 for arb_id in tx_ids[slow_frames[1]:slow_frames[-1]]))
@@ -0,0 +1,43 @@
+from libcanbadger.emulation.canbadger_emulator import CANBadgerEmulator
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.ethernet_message import ActionType
+from libcanbadger.uds.offload_session import OffloadSession
+from libcanbadger.uds.session import SessionStatus
+
+
+def test_offload_session():
+    ecu = EcuEmulator(tester_id=0x710, ecu_id=0x77a, dids={0xf187: b'WVWZZZ1JZXW000001'})
+    cb = CANBadgerEmulator(ecus=[ecu])
+    cb.connect()
+
+    with OffloadSession(interface=cb, tester_id=0x710, ecu_id=0x77a) as session:
+        # the device should open the session and keep up tester present on its own
+        session.start(diagnostic_level=3)
+        assert(session.status == SessionStatus.Idle)
+        assert(ecu.diagnostic_session == 3)
+        assert(cb.tester_present_active)
+        assert(session.tp_scheduler is None)
+
+        # every request should be a single ethernet message
+        sent_before = len(cb.received_messages)
+        success, data = session.request_data_by_id(0xf187)
+        assert(success)
+        assert(data == b'\xf1\x87WVWZZZ1JZXW000001')
+        assert(len(cb.received_messages) == sent_before + 1)
+        assert(cb.received_messages[-1].action_type == ActionType.UDS)
+
+        # negative responses are passed through
+        success, data = session.request_data_by_id(0x1234)
+        assert(not success)
+
+    # leaving the session should stop it on the device
+    assert(not cb.tester_present_active)
+    assert(cb.received_messages[-1].action_type == ActionType.STOP_CURRENT_ACTION)
+
+
+def test_offload_session_unknown_ecu():
+    cb = CANBadgerEmulator(ecus=[EcuEmulator(tester_id=0x710, ecu_id=0x77a)])
+    cb.connect()
+    session = OffloadSession(interface=cb, tester_id=0x711, ecu_id=0x77b)
+    session.start()
+    assert(session.status == SessionStatus.Failed)
@@ -0,0 +1,110 @@
+import time
+
+from libcanbadger.emulation.emulated_can_interface import EmulatedCanInterface
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.response_router import ResponseRouter, response_sid
+from libcanbadger.uds.session import Session
+
+VIN = b'WVWZZZ1JZXW000001'
+
+
+def test_response_sid():
+    assert(response_sid(b'\x62\xf1\x87') == 0x22)
+    assert(response_sid(b'\x7f\x22\x31') == 0x22)
+    assert(response_sid(b'\x22\xf1\x87') is None)
+    assert(response_sid(b'') is None)
+
+
+def test_session_drops_stale_responses(create_session):
+    ecu = EcuEmulator(dids={0xf187: VIN})
+    session = create_session(ecu)
+
+    # a late answer to an earlier request must not be taken for the answer to this one
+    session.interface.queue_frame(ecu.ecu_id, b'\x03\x7e\x00\xaa\xaa\xaa\xaa\xaa')
+    session.interface.queue_frame(ecu.ecu_id, b'\x03\x7f\x27\x35\xaa\xaa\xaa\xaa')
+    success, data = session.request_data_by_id(0xf187)
+    assert(success)
+    assert(data == b'\xf1\x87' + VIN)
+    assert(session.stale_response_count == 2)
+
+
+def test_response_router():
+    ecu_a = EcuEmulator(tester_id=0x710, ecu_id=0x77a, dids={0xf187: VIN})
+    ecu_b = EcuEmulator(tester_id=0x711, ecu_id=0x77b, dids={0xf190: b'\x01\x02'})
+    interface = EmulatedCanInterface(ecus=[ecu_a, ecu_b], padding_byte=0xAA)
+    interface.connect()
+    router = ResponseRouter(interface)
+
+    # it should keep requests to different ECUs in flight at the same time
+    interface.queue_frame(0x77b, b'\x02\x7e\x00\xaa\xaa\xaa\xaa\xaa')
+    pending_a = router.submit(0x710, 0x77a, b'\x22\xf1\x87')
+    pending_b = router.submit(0x711, 0x77b, b'\x22\xf1\x90')
+    assert(router.wait(pending_b) == b'\x62\xf1\x90\x01\x02')
+    assert(router.wait(pending_a) == b'\x62\xf1\x87' + VIN)
+    assert(router.stale_count == 1)
+
+    # multi-frame requests, response pending and negative responses
+    ecu_a.pending_responses[0x22] = 2
+    pending = router.submit(0x710, 0x77a, b'\x22\xf1\x87\xf1\x90\xf1\x91\xf1\x92')
+    assert(router.wait(pending) == b'\x62\xf1\x87' + VIN)
+    assert(pending.pending_count == 2)
+    pending = router.submit(0x711, 0x77b, b'\x22\x12\x34')
+    assert(router.wait(pending) == b'\x7f\x22\x31')
+
+    # timeouts
+    pending = router.submit(0x711, 0x77b, b'\x3e\x80')
+    assert(router.wait(pending, timeout=0.01) == b'')
+    assert(not router.pending[0x77b])
+
+    # sessions should be able to share a router
+    session = Session(interface=interface, tester_id=0x710, ecu_id=0x77a, router=router)
+    success, data = session.request_data_by_id(0xf187)
+    assert(success)
+    assert(data == b'\xf1\x87' + VIN)
+    assert(session.timing_stats[0x22].pending_count == 2)
+
+
+def test_response_router_unanswered_requests():
+    ecu = EcuEmulator(tester_id=0x710, ecu_id=0x77a, dids={0xf187: VIN})
+    interface = EmulatedCanInterface(ecus=[ecu], padding_byte=0xAA)
+    interface.connect()
+    router = ResponseRouter(interface, p2_star=0.01)
+    session = Session(interface=interface, tester_id=0x710, ecu_id=0x77a, router=router)
+
+    # a request nobody waits for must not take the response to the next one
+    session.request(b'\x3e\x80', wait_for_response=False)
+    assert(not router.pending.get(0x77a))
+    assert(session.request(b'\x3e\x00') == b'\x7e\x00')
+    # ..multi-frame requests are sent completely before the session moves on
+    session.request(b'\x22\x12\x34\x12\x35\x12\x36\x12\x37', wait_for_response=False)
+    assert(not router.pending.get(0x77a))
+    assert(router.stale_count == 0)
+    assert(session.request(b'\x3e\x00') == b'\x7e\x00')
+    assert(router.stale_count == 1)
+
+    # requests nobody waits for expire, and don't take later responses
+    forgotten = router.submit(0x710, 0x77a, b'\x3e\x00')
+    time.sleep(0.02)
+    assert(session.request(b'\x3e\x00') == b'\x7e\x00')
+    assert(forgotten.done and forgotten.response == b'')
+
+
+def test_response_router_st_min():
+    ecu_a = EcuEmulator(tester_id=0x710, ecu_id=0x77a)
+    ecu_a.fc_st_min = 20
+    ecu_b = EcuEmulator(tester_id=0x711, ecu_id=0x77b, dids={0xf190: b'\x01\x02'})
+    interface = EmulatedCanInterface(ecus=[ecu_a, ecu_b], padding_byte=0xAA)
+    interface.connect()
+    router = ResponseRouter(interface)
+
+    # a slow multi-frame request must not hold up the other ECUs while its consecutive frames wait for STmin
+    pending_a = router.submit(0x710, 0x77a, b'\x22' + b'\x12\x34' * 20)
+    for _ in range(2):
+        pending_b = router.submit(0x711, 0x77b, b'\x22\xf1\x90')
+        assert(router.wait(pending_b) == b'\x62\xf1\x90\x01\x02')
+    assert(pending_a.tx_frames)
+    assert(router.wait(pending_a) == b'\x7f\x22\x31')
+    a_frames = [i for i, frame in enumerate(interface.tx_frames) if frame.arb_id == 0x710]
+    b_frames = [i for i, frame in enumerate(interface.tx_frames) if frame.arb_id == 0x711]
+    assert(len(a_frames) == 6)
+    assert(a_frames[1] < b_frames[1] < a_frames[-1])
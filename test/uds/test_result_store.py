@@ -0,0 +1,92 @@
+import time
+
+from libcanbadger.uds.result_store import ResultStore
+from libcanbadger.uds.search_runner import SearchRunner, TokenBucket, Outcome
+
+
+def test_result_store(tmp_path):
+    filename = str(tmp_path / 'results.sqlite')
+    with ResultStore(filename, batch_size=100, run_id='first') as store:
+        store.add([0xf180], b'\x22\xf1\x80', b'\x62\xf1\x80\x01', Outcome.Hit, ecu_id=0x77a)
+        store.add([0xf181], b'\x22\xf1\x81', b'\x7f\x22\x31', Outcome.Miss, ecu_id=0x77a)
+        store.add([0x01, b'\x00\xff'], b'\x31\x01\x00\xff', b'', Outcome.Timeout, ecu_id=0x77b)
+        # buffered, but visible already
+        assert(store.row_count == 0)
+        assert(store.has_recent(0x77a, b'\x22\xf1\x81', max_age=10))
+        assert(not store.has_recent(0x77b, b'\x31\x01\x00\xff', max_age=10))
+        assert(not store.has_recent(0x77b, b'\x22\xf1\x81', max_age=10))
+        # only final outcomes answer a request
+        store.add([0xf182], b'\x22\xf1\x82', b'\x7f\x22\x21', Outcome.Busy, ecu_id=0x77a)
+        store.add([0xf183], b'\x22\xf1\x83', b'\x7f\x22\x7f', Outcome.SessionLost, ecu_id=0x77a)
+        store.add([0xf184], b'\x22\xf1\x84', b'\x7f\x22\x31', ecu_id=0x77a)
+        store.add([0xf181], b'\x22\xf1\x81', b'\x7f\x22\x21', Outcome.Busy, ecu_id=0x77a)
+        assert(not store.has_recent(0x77a, b'\x22\xf1\x82', max_age=10))
+        assert(not store.has_recent(0x77a, b'\x22\xf1\x83', max_age=10))
+        assert(not store.has_recent(0x77a, b'\x22\xf1\x84', max_age=10))
+        assert(store.recent_result(0x77a, b'\x22\xf1\x81', max_age=10) == b'\x7f\x22\x31')
+
+    with ResultStore(filename, run_id='second') as store:
+        # results of earlier runs are found
+        assert(store.recent_result(0x77a, b'\x22\xf1\x80', max_age=10) == b'\x62\xf1\x80\x01')
+        assert(not store.has_recent(0x77a, b'\x22\xf1\x80', max_age=0))
+        assert(not store.has_recent(0x77a, b'\x22\xf1\x82', max_age=10))
+        assert(store.recent_result(0x77a, b'\x22\xf1\x81', max_age=10) == b'\x7f\x22\x31')
+        store.add([0xf180], b'\x22\xf1\x80', b'\x62\xf1\x80\x02', Outcome.Hit, ecu_id=0x77a)
+
+        assert(len(store.query(ecu_id=0x77a)) == 7)
+        assert(store.query(response_code=0x31)[0]['parameters'] == [0xf181])
+        assert(store.query(ecu_id=0x77b)[0]['parameters'] == [0x01, b'\x00\xff'])
+        assert(store.query(ecu_id=0x77b)[0]['positive'] is None)
+        # repeated scans are deduped, the latest result wins
+        hits = store.hits(ecu_id=0x77a, service=0x22)
+        assert(len(hits) == 1)
+        assert(hits[0]['response'] == b'\x62\xf1\x80\x02' and hits[0]['run_id'] == 'second')
+        assert([run[0] for run in store.runs()] == ['first', 'second'])
+
+
+def test_result_store_throughput(tmp_path):
+    with ResultStore(str(tmp_path / 'results.sqlite')) as store:
+        start = time.monotonic()
+        for i in range(5000):
+            store.add([i], b'\x22' + i.to_bytes(2, 'big'), b'\x7f\x22\x31', Outcome.Miss, ecu_id=0x77a)
+        store.flush()
+        assert(time.monotonic() - start < 2.0)
+        assert(store.row_count == 5000)
+
+
+def test_search_runner_result_store(create_session, create_did_ecu, create_did_scan):
+    store = ResultStore(':memory:')
+    ecu = create_did_ecu()
+    ecu.diagnostic_session = 0x03
+    session = create_session(ecu)
+    runner = SearchRunner(session, create_did_scan(), diagnostic_level=None, rate_limit=TokenBucket(rate=10000.0),
+                          result_store=store, skip_recent=60.0)
+    runner.run()
+    assert(len(store.query(ecu_id=ecu.ecu_id)) == 48)
+    assert(len(store.hits(ecu_id=ecu.ecu_id)) == len(ecu.dids))
+
+    # a repeated scan is answered from the store
+    requests = len(ecu.requests)
+    runner = SearchRunner(session, create_did_scan(), diagnostic_level=None, rate_limit=TokenBucket(rate=10000.0),
+                          result_store=store, skip_recent=60.0)
+    hits = runner.run()
+    assert(len(ecu.requests) == requests)
+    assert(runner.stored_count == 48)
+    assert(len(hits) == len(ecu.dids))
+
+    # results without a final outcome are sent again
+    store = ResultStore(':memory:')
+    ecu.diagnostic_session = 0x01
+    runner = SearchRunner(session, create_did_scan(), diagnostic_level=None, rate_limit=TokenBucket(rate=10000.0),
+                          max_retries=0, result_store=store, skip_recent=60.0)
+    runner.run()
+    assert(len(runner.failed) == 48)
+    ecu.diagnostic_session = 0x03
+    requests = len(ecu.requests)
+    runner = SearchRunner(session, create_did_scan(), diagnostic_level=None, rate_limit=TokenBucket(rate=10000.0),
+                          result_store=store, skip_recent=60.0)
+    hits = runner.run()
+    assert(len(ecu.requests) == requests + 48)
+    assert(runner.stored_count == 0)
+    assert(len(hits) == len(ecu.dids))
+    store.close()
@@ -0,0 +1,99 @@
+from libcanbadger.search.search import Search
+from libcanbadger.search.integer_range_parameter import IntegerRangeParameter
+from libcanbadger.search.integer_choice_parameter import IntegerChoiceParameter
+from libcanbadger.search.bruteforce_strategy import BruteforceStrategy
+from libcanbadger.search.adaptive_strategy import AdaptiveStrategy
+from libcanbadger.uds.search_runner import SearchRunner, TokenBucket, Outcome, classify_response, \
+    concat_request_builder, search_hit
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=100.0, max_rate=150.0, increase=10.0, clock=clock, sleep=clock.sleep)
+    # the first request passes right away, the other ten wait for their token
+    for _ in range(11):
+        bucket.acquire()
+    assert(abs(clock.now - 0.1) < 1e-6)
+    for _ in range(10):
+        bucket.increase()
+    assert(bucket.rate == 150.0)
+    bucket.decrease()
+    assert(bucket.rate == 75.0)
+
+
+def test_classify_response():
+    assert(classify_response([0], b'\x62\xf1\x80\x00') == Outcome.Hit)
+    assert(classify_response([0], b'\x7f\x22\x31') == Outcome.Miss)
+    assert(classify_response([0], b'\x7f\x22\x21') == Outcome.Busy)
+    assert(classify_response([0], b'\x7f\x22\x7f') == Outcome.SessionLost)
+    assert(classify_response([0], b'') == Outcome.Timeout)
+
+
+def test_search_hit():
+    assert(search_hit(Outcome.Hit, b'\x62\xf1\x90\x00') is True)
+    assert(search_hit(Outcome.Miss, b'\x7f\x22\x31') is False)
+    assert(search_hit(Outcome.Miss, b'\x7f\x22\x11') is False)
+    assert(search_hit(Outcome.Miss, b'\x7f\x22\x33') is None)
+    assert(search_hit(Outcome.Timeout, b'') is None)
+    assert(search_hit(Outcome.Busy, b'\x7f\x22\x21') is None)
+
+
+def test_search_runner(create_session, create_did_ecu, create_did_scan, clock):
+    ecu = create_did_ecu(max_rate=1000.0, drop_session_every=20, clock=clock)
+    session = create_session(ecu)
+    results = []
+    progress = []
+    runner = SearchRunner(session, create_did_scan(), diagnostic_level=0x03, reopen_delay=0.0,
+                          rate_limit=TokenBucket(rate=200.0, increase=50.0, clock=clock, sleep=clock.sleep),
+                          result_sink=lambda *result: results.append(result), progress_callback=progress.append)
+    hits = runner.run()
+
+    # every DID found, despite busy responses and lost sessions
+    assert(sorted(values[0] for values, _ in hits) == sorted(ecu.dids))
+    assert(len(results) == len(ecu.dids))
+    assert(results[0][1] == b'\x22\xf1\x80' and results[0][3] == Outcome.Hit)
+    assert(runner.failed == [])
+    assert(runner.reopen_count >= 2)
+    status = progress[-1]
+    assert(status['progress'] == 1.0 and status['eta'] == 0)
+    assert(status['hits'] == len(ecu.dids))
+    assert(status['outcomes']['Hit'] == len(ecu.dids))
+    # the rate limit settles around what the ECU tolerates
+    assert(status['outcomes']['Busy'] < 40)
+    assert(runner.rate_limit.rate < 2000.0)
+
+
+def test_search_runner_limits(create_session, create_did_ecu):
+    ecu = create_did_ecu()
+    ecu.diagnostic_session = 0x03
+    session = create_session(ecu)
+    search = Search(strategy=BruteforceStrategy())
+    search.add_param(IntegerChoiceParameter('service', values=[0x22]))
+    search.add_param(IntegerRangeParameter('did', start=0xf180, stop=0xf1b0))
+    timeouts = []
+    request = session.request
+    session.request = lambda data, **kwargs: timeouts.append(kwargs.get('timeout')) or request(data, **kwargs)
+    runner = SearchRunner(session, search, request_builder=concat_request_builder([1, 2]), diagnostic_level=None,
+                          rate_limit=TokenBucket(rate=10000.0), sink_all=True)
+
+    # it can be stopped and continued
+    runner.run(max_requests=10)
+    assert(search.strategy.progress() == 10)
+    assert(runner.status()['eta'] is not None)
+    runner.run()
+    assert(search.has_completed())
+    # requests wait the session's negotiated timing by default
+    assert(timeouts and set(timeouts) == {None})
+    assert(len(runner.hits) == len(ecu.dids))
+
+
+def test_search_runner_adaptive(create_session, create_did_ecu):
+    ecu = create_did_ecu()
+    ecu.diagnostic_session = 0x03
+    session = create_session(ecu)
+    search = Search(strategy=AdaptiveStrategy(block_size=8))
+    search.add_param(IntegerRangeParameter('did', start=0xf180, stop=0xf1b0))
+    runner = SearchRunner(session, search, diagnostic_level=None, rate_limit=TokenBucket(rate=10000.0))
+
+    # the strategy learns hits and dead ends from the runner, without looking at the responses
+    runner.run()
+    assert(search.strategy.hit_count == len(ecu.dids))
+    assert(search.strategy.dead_count == 48 - len(ecu.dids))
@@ -0,0 +1,72 @@
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.seed_harvester import SeedHarvester
+
+
+def test_seed_harvester(tmp_path, create_session):
+    filename = str(tmp_path / 'seeds.ndjson')
+    ecu = EcuEmulator()
+    session = create_session(ecu)
+    harvester = SeedHarvester(session, filename, reset_delay=0.0)
+
+    # it should collect seeds around key attempts, lockouts and resets
+    report = harvester.run(count=30)
+    assert(report['seeds'] == 30)
+    assert(report['new_seed_per_request'] is False)
+    assert(report['reset_clears_lockout'] is True)
+    assert(report['lockouts'] >= 1)
+    assert(report['seeds_per_minute'] > 0)
+    seeds = SeedHarvester.read_seeds(filename)
+    assert(len(seeds) == 30)
+    assert(all(len(seed) == 4 for seed in seeds))
+
+    # the file is appended to, even after an interrupted run
+    with open(filename, 'a') as f:
+        f.write('{"seed": "0102')
+    SeedHarvester(session, filename, reset_delay=0.0, refresh_method='reset').run(count=5)
+    assert(len(SeedHarvester.read_seeds(filename)) == 35)
+    with open(filename, 'r') as f:
+        assert(len(f.readlines()) == 36)
+
+
+def test_seed_harvester_lockout(tmp_path, create_session):
+    filename = str(tmp_path / 'seeds.ndjson')
+    ecu = EcuEmulator()
+    ecu.lockout_survives_reset = True
+    ecu.security_delay = 0.05
+    session = create_session(ecu)
+    harvester = SeedHarvester(session, filename, reset_delay=0.0, lockout_delay=0.01, refresh_method='key')
+
+    # a lockout that survives resets has to be waited out
+    report = harvester.run(count=10)
+    assert(report['seeds'] == 10)
+    assert(report['reset_clears_lockout'] is False)
+    assert(report['wait_time'] >= 0.05)
+    assert(harvester.reset_count == 1)
+
+
+def test_seed_harvester_new_seed_per_request(tmp_path, create_session):
+    ecu = EcuEmulator()
+    ecu.new_seed_per_request = True
+    session = create_session(ecu)
+    harvester = SeedHarvester(session, str(tmp_path / 'seeds.ndjson'), reset_delay=0.0)
+
+    # no refresh needed at all
+    report = harvester.run(count=20)
+    assert(report['seeds'] == 20)
+    assert(report['new_seed_per_request'] is True)
+    assert(report['resets'] == 0 and report['key_attempts'] == 0)
+
+
+def test_seed_harvester_lockout_duration(tmp_path, create_session):
+    ecu = EcuEmulator()
+    ecu.lockout_survives_reset = True
+    ecu.security_delay = 60.0
+    session = create_session(ecu)
+    harvester = SeedHarvester(session, str(tmp_path / 'seeds.ndjson'), reset_delay=0.0, lockout_delay=30.0,
+                              refresh_method='key')
+
+    # the lockout wait must not run past the duration of the run
+    report = harvester.run(duration=0.2)
+    assert(report['reset_clears_lockout'] is False)
+    assert(report['wait_time'] <= 0.2)
+    assert(report['elapsed'] < 5.0)
@@ -0,0 +1,198 @@
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.session import SessionStatus
+
+
+def test_session_request(create_session):
+    ecu = EcuEmulator(dids={0xf187: b'WVWZZZ1JZXW000001'})
+    session = create_session(ecu)
+    session.start()
+    assert(session.status == SessionStatus.Idle)
+    # it should take over P2/P2* from the session response
+    assert(session.p2 == 0.05)
+    assert(session.p2_star == 5.0)
+    session.stop_tp()
+    # ..and use it as the default response timeout
+    assert(session.response_timeout() == session.p2 + session.p2_tolerance)
+
+    # it should handle multi-frame responses
+    success, data = session.request_data_by_id(0xf187)
+    assert(success)
+    assert(data == b'\xf1\x87WVWZZZ1JZXW000001')
+
+
+def test_session_response_pending(create_session):
+    ecu = EcuEmulator(dids={0xf187: b'WVWZZZ1JZXW000001'})
+    session = create_session(ecu)
+
+    # it should keep waiting after response pending replies
+    ecu.pending_responses[0x22] = 3
+    success, data = session.request_data_by_id(0xf187)
+    assert(success)
+    assert(data == b'\xf1\x87WVWZZZ1JZXW000001')
+    stats = session.timing_stats[0x22]
+    assert(stats.request_count == 1)
+    assert(stats.pending_count == 3)
+    assert(stats.max_pending == 3)
+    assert(stats.timeout_count == 0)
+
+    # ..but only up to max_response_pending times
+    session.max_response_pending = 2
+    response = session.request(b'\x22\xf1\x87')
+    assert(response == b'\x7f\x22\x78')
+    assert(stats.request_count == 2)
+    assert(stats.pending_count == 5)
+
+
+def test_session_upload_download(tmp_path, create_session):
+    # 0x500 blocks of 0x400 bytes, so the block sequence counter has to wrap around
+    memory = bytes(i * 7 & 0xFF for i in range(0x400 * 0x120 + 123))
+    ecu = EcuEmulator(memory=memory, memory_address=0x10000)
+    session = create_session(ecu)
+
+    assert(session.parse_max_block_length(b'\x20\x04\x02') == 0x402)
+    assert(session.format_address_and_size(0x10000, 0x200) == b'\x23\x01\x00\x00\x02\x00')
+
+    # it should stream uploads to a file, using the negotiated block length
+    filename = str(tmp_path / 'upload.bin')
+    progress = []
+    assert(session.upload_to_file(0x10000, len(memory), filename,
+                                  progress_callback=lambda done, total: progress.append(done)))
+    with open(filename, 'rb') as f:
+        assert(f.read() == memory)
+    assert(len(progress) == 0x121)
+    assert(ecu.requests[-1] == b'\x37')
+    assert(ecu.transfer is None)
+
+    # it should stream downloads from a file
+    download = bytes(range(256)) * 20 + b'\x01\x02\x03'
+    filename = str(tmp_path / 'download.bin')
+    with open(filename, 'wb') as f:
+        f.write(download)
+    assert(session.download_from_file(0x10000, filename))
+    assert(ecu.memory[:len(download)] == download)
+    assert(ecu.requests[-1] == b'\x37')
+    transfers = [r for r in ecu.requests if r[0] == 0x36]
+    assert(len(transfers[-1]) == 2 + len(download) % 0x400)
+
+    # it should fail on requests the ECU refuses
+    assert(not session.upload_to_file(0x0, 0x10, filename))
+
+    # a failed upload should end the transfer and leave no (truncated) file behind
+    transfer_data = ecu.services[0x36]
+    ecu.register_service(0x36, lambda request: transfer_data(request) if request[1] < 3 else [])
+    filename = str(tmp_path / 'failed.bin')
+    assert(not session.upload_to_file(0x10000, len(memory), filename, retries=1))
+    assert(ecu.requests[-1] == b'\x37')
+    assert(not (tmp_path / 'failed.bin').exists())
+    assert(not (tmp_path / 'failed.bin.part').exists())
+
+
+def test_session_read_dids(create_session):
+    dids = {0xf100 + i: bytes([i]) * (i % 5 + 1) for i in range(100)}
+    ecu = EcuEmulator(dids=dids)
+    ecu.max_dids_per_request = 10
+    session = create_session(ecu)
+
+    # it should read all DIDs with far fewer requests than DIDs
+    wanted = list(dids) + [0xf200, 0xf201]
+    expected = dict(dids)
+    expected.update({0xf200: None, 0xf201: None})
+    results = session.read_dids(wanted)
+    assert(results == expected)
+    assert(len(ecu.requests) < 25)
+    assert(session.did_batch_limit == 10)
+    assert(session.did_lengths[0xf104] == 5)
+
+    # with all lengths known, a batch only fails if the ECU rejects it
+    ecu.requests.clear()
+    results = session.read_dids(wanted)
+    assert(results == expected)
+    assert(len(ecu.requests) <= 15)
+
+    # learned lengths that turn out to be wrong fall back to single reads
+    ecu.dids[0xf101] = b'\x01\x02\x03'
+    results = session.read_dids([0xf100, 0xf101, 0xf102])
+    assert(results[0xf101] == b'\x01\x02\x03')
+    assert(results[0xf102] == dids[0xf102])
+    assert(session.did_lengths[0xf101] == 3)
+
+
+def test_session_read_dids_timeout(create_session):
+    dids = {0xf100 + i: bytes([i]) for i in range(8)}
+    ecu = EcuEmulator(dids=dids)
+    session = create_session(ecu)
+
+    # a dropped batch response is retried in halves, but doesn't limit later batches
+    read_data_by_identifier = ecu.services[0x22]
+    dropped = []
+
+    def drop_once(request):
+        if len(request) > 3 and not dropped:
+            dropped.append(request)
+            return []
+        return read_data_by_identifier(request)
+    ecu.register_service(0x22, drop_once)
+    assert(session.read_dids([0xf100, 0xf101]) == {0xf100: b'\x00', 0xf101: b'\x01'})
+    assert(dropped)
+    assert(session.did_batch_limit is None)
+    ecu.requests.clear()
+    assert(session.read_dids(list(dids)) == dids)
+    assert(len(ecu.requests) < len(dids))
+
+
+def test_session_cache(create_session):
+    ecu = EcuEmulator(dids={0xf187: b'WVWZZZ1JZXW000001'}, memory=bytes(range(256)) * 4, memory_address=0x1000)
+    session = create_session(ecu)
+    cache = session.enable_cache(ttl=60.0, rom_ranges=[(0x1000, 0x1200)])
+
+    # repeated reads should be answered from the cache
+    for _ in range(3):
+        assert(session.request_data_by_id(0xf187) == (True, b'\xf1\x87WVWZZZ1JZXW000001'))
+    assert(len(ecu.requests) == 1)
+    assert(cache.hits == 2 and cache.misses == 1)
+
+    # ..memory reads only within ROM
+    for _ in range(2):
+        assert(session.request(b'\x23\x12\x10\x00\x10') == b'\x63' + bytes(range(16)))
+        assert(session.request(b'\x23\x12\x11\xf8\x10')[0] == 0x63)
+    assert(len(ecu.requests) == 4)
+
+    # negative responses are not cached
+    session.request(b'\x22\x12\x34')
+    session.request(b'\x22\x12\x34')
+    assert(len(ecu.requests) == 6)
+
+    # writes, resets and session changes invalidate the cache
+    session.request(b'\x10\x03')
+    session.request_data_by_id(0xf187)
+    assert(len(ecu.requests) == 8)
+
+    # entries expire
+    cache.invalidate()
+    cache.ttl = 0.0
+    session.request_data_by_id(0xf187)
+    session.request_data_by_id(0xf187)
+    assert(len(ecu.requests) == 10)
+
+    # the least recently used entries are evicted
+    cache.invalidate()
+    cache.ttl = 60.0
+    cache.max_entries = 1
+    session.request(b'\x23\x12\x10\x00\x10')
+    session.request_data_by_id(0xf187)
+    assert(len(cache) == 1 and cache.evictions == 1)
+
+
+def test_session_negotiated_p2(create_session):
+    ecu = EcuEmulator()
+    # P2 = 300ms
+    ecu.register_service(0x10, lambda request: [b'\x50' + request[1:2] + b'\x01\x2c\x01\xf4'])
+    session = create_session(ecu)
+    session.update_timing(session.request(b'\x10\x03'))
+    assert(session.p2 == 0.3)
+
+    # requests should wait the negotiated P2 by default
+    waits = []
+    session.receive_response = lambda timeout=0.2: waits.append(timeout) or b''
+    assert(session.request(b'\x22\xf1\x87') == b'')
+    assert(abs(waits[0] - (0.3 + session.p2_tolerance)) < 0.01)
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from libcanbadger.emulation.emulated_can_interface import EmulatedCanInterface
+from libcanbadger.emulation.ecu_emulator import EcuEmulator
+from libcanbadger.uds.session import Session
+from libcanbadger.uds import tester_present_scheduler
+
+
+def count_tester_present(interface, tester_id):
+    return len([f for f in list(interface.tx_frames) if f.arb_id == tester_id and f.payload[:3] == b'\x02\x3e\x80'])
+
+
+def test_tester_present_scheduler():
+    ecus = [EcuEmulator(tester_id=0x700 + i, ecu_id=0x780 + i) for i in range(20)]
+    interface = EmulatedCanInterface(ecus=ecus)
+    interface.connect()
+    scheduler = tester_present_scheduler.TesterPresentScheduler(tick=0.005)
+    sessions = [Session(interface=interface, tester_id=ecu.tester_id, ecu_id=ecu.ecu_id, tp_scheduler=scheduler)
+                for ecu in ecus]
+
+    # all sessions should be served by a single thread
+    threads_before = threading.active_count()
+    for session in sessions:
+        session.tp_interval = 0.02
+        session.start_tp()
+    assert(threading.active_count() == threads_before + 1)
+    assert(len(scheduler) == 20)
+
+    # sessions with recent traffic don't need tester present
+    busy = sessions[0]
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        busy.request(b'\x3e\x00')
+        time.sleep(0.005)
+    for session in sessions[1:]:
+        assert(count_tester_present(interface, session.tester_id) >= 3)
+    assert(count_tester_present(interface, busy.tester_id) <= 1)
+    # the frames should be padded like the session's own frames
+    tp_frame = [f for f in interface.tx_frames if f.arb_id == 0x701][0]
+    assert(tp_frame.payload == b'\x02\x3e\x80\xaa\xaa\xaa\xaa\xaa')
+
+    # no tester present is sent once stop_tp() returned
+    stopped = sessions[1]
+    stopped.stop_tp()
+    sent = count_tester_present(interface, stopped.tester_id)
+    time.sleep(0.1)
+    assert(count_tester_present(interface, stopped.tester_id) == sent)
+    assert(not scheduler.is_registered(stopped))
+
+    # the thread should end after all sessions are gone
+    scheduler.shutdown()
+    assert(scheduler.thread is None)
+    assert(threading.active_count() == threads_before)
@@ -1,5 +1,8 @@
+import os
+import time
+
 from libcanbadger.interface import Interface, LoggedInterface
-from libcanbadger.log import Log, LogEventType, FrameEvent, NamedEvent
+from libcanbadger.log import Log, LogEventType, FrameEvent, NamedEvent, StreamingLogWriter
 from libcanbadger.frame import Frame
 
 class MockInterface(Interface):
@@ -78,3 +81,68 @@ def test_log():
         last_e = e
     assert(last_e == parsed_log.events[-1])
 
+
+
+def test_log_roundtrip(tmp_path):
+    log = Log(name='roundtrip')
+    log.log(FrameEvent(Frame(arb_id=0x7e0, payload=b'\x02\x10\x03'), type=LogEventType.LOG_EVENT_TX_FRAME))
+    log.log(NamedEvent(name="session started"))
+    filename = str(tmp_path / 'log.json')
+    log.save_to_file(filename)
+
+    # it should restore events, not just their json
+    parsed_log = Log.load_from_file(filename)
+    assert(parsed_log.events[0].type == LogEventType.LOG_EVENT_TX_FRAME)
+    assert(parsed_log.events[0].frame.arb_id == 0x7e0)
+    assert(parsed_log.events[0].frame.payload == b'\x02\x10\x03')
+    assert(isinstance(parsed_log.events[1], NamedEvent))
+    assert(parsed_log.events[1].name == "session started")
+
+
+def test_streaming_log_writer(tmp_path):
+    filename = str(tmp_path / 'capture.ndjson')
+    mi = MockInterface()
+    interface = LoggedInterface(underlying=mi)
+    writer = interface.start_stream_log('capture', filename, max_bytes=2000)
+    for i in range(100):
+        mi.rx_frames.append(Frame(arb_id=0x7e8, payload=bytes([0x03, 0x62, i])))
+        interface.receive_frame()
+    writer.log(NamedEvent(name="done"))
+    assert(len(writer) == 101)
+
+    # readable while still being written, up to the last flush
+    writer.flush()
+    assert(len(Log.load_from_stream(filename)) == 101)
+
+    interface.stop_log(writer)
+    # it should rotate by size
+    assert(len(writer.segment_filenames()) > 1)
+    assert(all(os.path.getsize(f) <= 2000 for f in writer.segment_filenames()))
+    log = Log.load_from_stream(filename)
+    assert(log.name == 'capture')
+    assert(len(log) == 101)
+    assert(log.events[99].frame.payload == bytes([0x03, 0x62, 99]))
+    assert(log.events[-1].name == "done")
+
+    # a partial last line, e.g. after a crash, is left out
+    last = writer.segment_filenames()[-1]
+    with open(last, 'a') as f:
+        f.write('{"type": 0, "arb_id": "0x7e8", "pay')
+    assert(len(Log.load_from_stream(filename)) == 101)
+
+    # writing continues in the last segment, after the partial line
+    with StreamingLogWriter(filename, name='capture') as writer:
+        writer.log(NamedEvent(name="resumed"))
+    log = Log.load_from_stream(filename)
+    assert(len(log) == 102)
+    assert(log.events[-1].name == "resumed")
+
+
+def test_streaming_log_writer_rotate_by_time(tmp_path):
+    filename = str(tmp_path / 'capture.ndjson')
+    with StreamingLogWriter(filename, max_age=0.05, flush_interval=0, fsync_interval=0.01) as writer:
+        writer.log(NamedEvent(name="first"))
+        time.sleep(0.06)
+        writer.log(NamedEvent(name="second"))
+    assert(len(writer.segment_filenames()) == 2)
+    assert([e.name for e in Log.load_from_stream(filename)] == ["first", "second"])